@@ -0,0 +1,146 @@
+import asyncio
+import time
+from typing import List, Set
+
+from app.api.services import cache, jobs, pool, render_seconds, upload_bytes, upload_seconds
+from app.api.utils import (
+    EmptyUploadError,
+    ResultFormat,
+    Upload,
+    UploadTooLargeError,
+    file_chunks,
+    read_upload,
+    result_from_ipc,
+    result_response,
+    result_to_ipc,
+    results_key,
+    returns_from_csv,
+)
+from app.api.workers import QueueFullError
+from app.core import config
+from fastapi import APIRouter, File, Form, HTTPException, Query, Request, UploadFile
+from fastapi.responses import JSONResponse
+
+router = APIRouter()
+
+# references to running job tasks, so that they are not garbage collected
+job_tasks: Set[asyncio.Task] = set()
+
+
+async def run_job(job_id: str, upload: Upload, years: List[int], cache_key: str) -> None:
+    # the slot of the pool was reserved by submit
+    try:
+        result = await pool.run_reserved(returns_from_csv, upload.data, years, job_id)
+        await cache.set(cache_key, result)
+        finish_job(job_id, result)
+    except Exception as e:
+        jobs.update(job_id, status="failed", error=repr(e))
+    finally:
+        upload.remove_spooled()
+
+
+def finish_job(job_id: str, result) -> None:
+    isin_summary, year_summary = result_to_ipc(result)
+    jobs.update(job_id, status="done", stage="done", result=isin_summary, year_summary=year_summary)
+
+
+async def upload_from(chunks) -> Upload:
+    start = time.perf_counter()
+    try:
+        upload = await read_upload(chunks, config.MAX_UPLOAD_SIZE, config.UPLOAD_BATCH_SIZE, config.SPOOL_THRESHOLD)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except EmptyUploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    upload_seconds.observe(time.perf_counter() - start)
+    upload_bytes.observe(upload.size)
+    return upload
+
+
+def render(result, format: ResultFormat):
+    start = time.perf_counter()
+    response = result_response(result, format)
+    render_seconds.observe(time.perf_counter() - start)
+    return response
+
+
+async def submit(chunks, years: List[int]):
+    # the slot is taken before reading the upload; the slot and the upload are handed to the job task, or given back
+    try:
+        pool.reserve()
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Server busy, try again later", headers={"Retry-After": "5"})
+    reserved = True
+    upload = None
+    try:
+        upload = await upload_from(chunks)
+        years = sorted(set(years))
+        cache_key = results_key(upload.digest, years)
+        job_id = jobs.create()
+        cached = await cache.get(cache_key)
+        if cached is not None:
+            finish_job(job_id, cached)
+        else:
+            task = asyncio.create_task(run_job(job_id, upload, years, cache_key))
+            reserved = False
+            job_tasks.add(task)
+            task.add_done_callback(job_tasks.discard)
+    finally:
+        if reserved:
+            pool.release()
+            if upload is not None:
+                upload.remove_spooled()
+    return {"job_id": job_id, "status": jobs.get(job_id)["status"]}
+
+
+@router.post("/jobs/", status_code=202)
+async def submit_job(file: UploadFile = File(...), years: List[int] = Form([config.FISCAL_YEAR])):
+    return await submit(file_chunks(file, config.UPLOAD_CHUNK_SIZE), years)
+
+
+@router.post("/jobs/csv", status_code=202)
+async def submit_job_csv(request: Request, years: List[int] = Query([config.FISCAL_YEAR])):
+    """Submit the csv as raw request body, parsed while it is still being received"""
+    return await submit(request.stream(), years)
+
+
+@router.post("/returns/")
+async def compute_returns(
+    file: UploadFile = File(...),
+    years: List[int] = Form([config.FISCAL_YEAR]),
+    format: ResultFormat = "json",
+):
+    """Compute the returns of the upload for every fiscal year and answer with them as JSON or Arrow IPC stream"""
+    upload = await upload_from(file_chunks(file, config.UPLOAD_CHUNK_SIZE))
+    years = sorted(set(years))
+    cache_key = results_key(upload.digest, years)
+    try:
+        result = await cache.get(cache_key)
+        if result is None:
+            result = await pool.run(returns_from_csv, upload.data, years)
+            await cache.set(cache_key, result)
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Server busy, try again later", headers={"Retry-After": "5"})
+    finally:
+        upload.remove_spooled()
+    return render(result, format)
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {key: value for key, value in job.items() if key not in ("result", "year_summary")}
+
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, format: ResultFormat = "json"):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "failed":
+        return JSONResponse(status_code=500, content={"detail": job["error"]})
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return render(result_from_ipc(job["result"], job["year_summary"]), format)
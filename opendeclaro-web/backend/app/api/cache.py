@@ -0,0 +1,107 @@
+import hashlib
+import os
+import struct
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+
+class ResultCache:
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float,
+        directory: Optional[str] = None,
+        serialize: Optional[Callable[[Any], Tuple[bytes, ...]]] = None,
+        deserialize: Optional[Callable[..., Any]] = None,
+    ):
+        """Least recently used cache whose entries expire after ttl seconds
+
+        Parameters
+        ----------
+        max_entries : int
+            maximum number of entries kept in memory
+        ttl : float
+            seconds after which an entry is evicted
+        directory : Optional[str], optional
+            if given, entries are also written to this directory and survive restarts and memory evictions,
+            by default None
+        serialize : Optional[Callable[[Any], Tuple[bytes, ...]]], optional
+            turns a value into the parts written to the directory (plain data such as Arrow IPC streams, never
+            pickles, so that a file of the directory cannot run code when read), required with directory
+        deserialize : Optional[Callable[..., Any]], optional
+            builds a value back from the parts read from the directory, required with directory
+        """
+        if directory is not None and (serialize is None or deserialize is None):
+            raise ValueError("serialize and deserialize are required to store entries in a directory")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        self.serialize = serialize
+        self.deserialize = deserialize
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    async def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        if key in self.entries:
+            expires, value = self.entries[key]
+            if expires > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+        value = None if self.directory is None else await run_in_threadpool(self.read_disk, key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.set_memory(key, value)
+        return value
+
+    async def set(self, key: str, value: Any) -> None:
+        self.set_memory(key, value)
+        if self.directory is not None:
+            await run_in_threadpool(self.write_disk, key, value)
+
+    def set_memory(self, key: str, value: Any) -> None:
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def disk_path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".bin")
+
+    def read_disk(self, key: str) -> Optional[Any]:
+        # the parts of an entry are written one after the other, each preceded by its length
+        path = self.disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                content = f.read()
+            parts, offset = [], 0
+            while offset < len(content):
+                (length,) = struct.unpack_from("<Q", content, offset)
+                if offset + 8 + length > len(content):
+                    return None
+                parts.append(content[offset + 8 : offset + 8 + length])
+                offset += 8 + length
+            return self.deserialize(*parts)
+        except (OSError, struct.error):
+            return None
+
+    def write_disk(self, key: str, value: Any) -> None:
+        path = self.disk_path(key)
+        with open(path + ".tmp", "wb") as f:
+            for part in self.serialize(value):
+                f.write(struct.pack("<Q", len(part)))
+                f.write(part)
+        os.replace(path + ".tmp", path)
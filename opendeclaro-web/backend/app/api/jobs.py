@@ -0,0 +1,114 @@
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+JOB_FIELDS = ["job_id", "status", "stage", "done", "total", "error", "result", "year_summary", "created", "updated"]
+FINISHED = ("done", "failed")
+
+
+class JobStore:
+    def __init__(self, ttl: float):
+        """In-process store of computation jobs
+
+        Parameters
+        ----------
+        ttl : float
+            seconds after their last update when finished jobs are forgotten
+        """
+        self.ttl = ttl
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def create(self) -> str:
+        now = time.time()
+        job = {field: None for field in JOB_FIELDS}
+        job.update(job_id=uuid.uuid4().hex, status="queued", done=0, total=0, created=now, updated=now)
+        with self.lock:
+            self.prune(now)
+            self.jobs[job["job_id"]] = job
+        return job["job_id"]
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        with self.lock:
+            if job_id in self.jobs:
+                self.jobs[job_id].update(fields, updated=time.time())
+
+    def progress(self, job_id: str, stage: str, done: int, total: int) -> None:
+        """Set a job running at a stage, unless it already finished (progress reported late by a worker)"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job["status"] not in FINISHED:
+                job.update(status="running", stage=stage, done=done, total=total, updated=time.time())
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else dict(job)
+
+    def prune(self, now: float) -> None:
+        expired = [
+            job_id for job_id, job in self.jobs.items() if job["status"] in FINISHED and job["updated"] < now - self.ttl
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+
+class SQLiteJobStore(JobStore):
+    def __init__(self, path: str, ttl: float):
+        """Store of computation jobs persisted in a SQLite database
+
+        Parameters
+        ----------
+        path : str
+            path location of the database file
+        ttl : float
+            seconds after their last update when finished jobs are deleted
+        """
+        super().__init__(ttl)
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, status TEXT, stage TEXT, done INTEGER, "
+            "total INTEGER, error TEXT, result BLOB, year_summary BLOB, created REAL, updated REAL)"
+        )
+
+    def create(self) -> str:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.prune(now)
+            self.connection.execute(
+                "INSERT INTO jobs (job_id, status, done, total, created, updated) VALUES (?, 'queued', 0, 0, ?, ?)",
+                (job_id, now, now),
+            )
+        return job_id
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{field} = ?" for field in fields if field in JOB_FIELDS)
+        with self.lock:
+            self.connection.execute(
+                f"UPDATE jobs SET {columns} WHERE job_id = ?",
+                [value for field, value in fields.items() if field in JOB_FIELDS] + [job_id],
+            )
+
+    def progress(self, job_id: str, stage: str, done: int, total: int) -> None:
+        with self.lock:
+            self.connection.execute(
+                "UPDATE jobs SET status = 'running', stage = ?, done = ?, total = ?, updated = ? "
+                "WHERE job_id = ? AND status NOT IN ('done', 'failed')",
+                (stage, done, total, time.time(), job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            row = self.connection.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return None if row is None else dict(zip(JOB_FIELDS, row))
+
+    def prune(self, now: float) -> None:
+        self.connection.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated < ?", (now - self.ttl,)
+        )
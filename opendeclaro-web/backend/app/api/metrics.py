@@ -0,0 +1,105 @@
+"""metrics.py metrics of the web backend exposed in the Prometheus text format"""
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence
+
+# buckets of durations in seconds and of sizes in bytes
+TIME_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+SIZE_BUCKETS = [1024 * 4**i for i in range(10)]
+
+
+class Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Lines of the samples of the metric in the Prometheus text format"""
+
+    def render(self) -> str:
+        return "\n".join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()])
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {self.value}"]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, function: Optional[Callable[[], float]] = None):
+        """Gauge set by inc/dec, or read from function at every scrape when given"""
+        super().__init__(name, help)
+        self.value = 0.0
+        self.function = function
+
+    def inc(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+    def samples(self) -> List[str]:
+        value = self.function() if self.function is not None else self.value
+        return [f"{self.name} {value}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = TIME_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        with self.lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        samples, cumulative = [], 0
+        for bound, count in zip([*self.buckets, "+Inf"], counts):
+            cumulative += count
+            samples.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        return [*samples, f"{self.name}_sum {total}", f"{self.name}_count {cumulative}"]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def observe(self, name: str, value: float) -> None:
+        """Record a value sent by name (from the worker processes): observed by histograms, added to counters"""
+        metric = self.metrics.get(name)
+        if isinstance(metric, Histogram):
+            metric.observe(value)
+        elif isinstance(metric, (Counter, Gauge)):
+            metric.inc(value)
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
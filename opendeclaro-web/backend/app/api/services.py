@@ -0,0 +1,52 @@
+"""services.py state shared by the routes of the web backend"""
+from app.api.cache import ResultCache
+from app.api.jobs import JobStore, SQLiteJobStore
+from app.api.metrics import SIZE_BUCKETS, Counter, Gauge, Histogram, Registry
+from app.api.utils import result_from_ipc, result_to_ipc, warm_worker
+from app.api.workers import WorkerPool
+from app.core import config
+
+jobs = JobStore(ttl=config.JOB_TTL) if config.JOB_DB is None else SQLiteJobStore(config.JOB_DB, ttl=config.JOB_TTL)
+metrics = Registry()
+
+
+def update_job_progress(job_id: str, stage: str, done: int, total: int) -> None:
+    jobs.progress(job_id, stage, done, total)
+
+
+pool = WorkerPool(
+    workers=config.WORKERS,
+    queue_size=config.QUEUE_SIZE,
+    on_progress=update_job_progress,
+    on_metric=metrics.observe,
+    initializer=warm_worker,
+)
+cache = ResultCache(
+    max_entries=config.CACHE_SIZE,
+    ttl=config.CACHE_TTL,
+    directory=config.CACHE_DIR,
+    serialize=result_to_ipc,
+    deserialize=result_from_ipc,
+)
+
+
+def cache_hit_ratio() -> float:
+    lookups = cache.hits + cache.misses
+    return cache.hits / lookups if lookups else 0.0
+
+
+# histograms observed in this process
+upload_bytes = metrics.register(Histogram("opendeclaro_upload_bytes", "Size of the uploads", SIZE_BUCKETS))
+upload_seconds = metrics.register(Histogram("opendeclaro_upload_seconds", "Time reading and parsing the uploads"))
+render_seconds = metrics.register(Histogram("opendeclaro_render_seconds", "Time rendering the results"))
+# histograms and counters observed in the worker processes
+metrics.register(Histogram("opendeclaro_dataset_seconds", "Time of Dataset parse"))
+metrics.register(Histogram("opendeclaro_stocks_orders_seconds", "Time of DataPrep.stocks_orders"))
+metrics.register(Histogram("opendeclaro_returns_seconds", "Time of Returns.return_on_all_stocks_by_year"))
+metrics.register(Counter("opendeclaro_rows_total", "Rows of the accounts processed"))
+metrics.register(Counter("opendeclaro_isin_total", "ISIN matched"))
+# gauges
+requests_in_flight = metrics.register(Gauge("opendeclaro_requests_in_flight", "Requests being served"))
+metrics.register(Gauge("opendeclaro_worker_pending", "Computations running or waiting", lambda: pool.pending))
+metrics.register(Gauge("opendeclaro_worker_queued", "Computations waiting for a worker", lambda: pool.queued))
+metrics.register(Gauge("opendeclaro_cache_hit_ratio", "Hits over lookups of the result cache", cache_hit_ratio))
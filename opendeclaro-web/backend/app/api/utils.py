@@ -1,33 +1,246 @@
-import json
+import asyncio
+import hashlib
+import importlib
 import os
-import random
-import shutil
-import string
+import tempfile
+import time
 from dataclasses import dataclass
+from io import BytesIO
+from typing import IO, AsyncIterator, List, Literal, Optional, Tuple, Union
+
+import polars as pl
+from app.api.workers import report_metric, report_progress
+from app.core import config
+from fastapi import Response, UploadFile
+from polars import DataFrame
+from starlette.concurrency import run_in_threadpool
 
 from opendeclaro import degiro
 
 
+# formats of the results, validated as query parameter
+ResultFormat = Literal["json", "arrow"]
+RESULT_FORMATS = {"json": "application/json", "arrow": "application/vnd.apache.arrow.stream"}
+# modules computing the returns, imported by every worker process when it starts
+WORKER_MODULES = ["opendeclaro.degiro.dataset", "opendeclaro.degiro.dataprep", "opendeclaro.degiro.returns"]
+
+
 @dataclass
 class ReturnsISINGlob:
-    isin_summary: json
-    global_result: float
+    # return per year and ISIN (year, isin, return) and global result per year (year, global_result)
+    isin_summary: DataFrame
+    year_summary: DataFrame
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+class EmptyUploadError(Exception):
+    pass
+
+
+@dataclass
+class Upload:
+    # csv parsed as a frame of string columns, or path of the temporary csv of an upload too large to keep in memory
+    data: Union[DataFrame, str]
+    digest: str
+    size: int
+
+    def remove_spooled(self) -> None:
+        if isinstance(self.data, str) and os.path.exists(self.data):
+            os.remove(self.data)
+
+
+def matching_progress(job_id: Optional[str], done: int, total: int) -> None:
+    # report about every 1% of the ISIN, not to flood the progress queue on large accounts
+    if done == total or done % max(total // 100, 1) == 0:
+        report_progress(job_id, "matching", done, total)
+
+
+def results_key(digest: str, years: List[int]) -> str:
+    return f"{digest}-{'-'.join(str(year) for year in years)}"
+
+
+def returns_from_csv(data: DataFrame, years: List[int], job_id: Optional[str] = None) -> ReturnsISINGlob:
+    """Returns of every fiscal year, from a single parse of the csv and a single matching of its transactions"""
+    report_progress(job_id, "parse")
+    start = time.perf_counter()
+    data = degiro.Dataset(data, categorical=True).data
+    report_metric("opendeclaro_dataset_seconds", time.perf_counter() - start)
+    report_metric("opendeclaro_rows_total", data.height)
+    report_progress(job_id, "prepare")
+    start = time.perf_counter()
+    data_stock = degiro.DataPrep(data).matching_orders
+    report_metric("opendeclaro_stocks_orders_seconds", time.perf_counter() - start)
+    report_progress(job_id, "matching")
+    start = time.perf_counter()
+    returns_by_year = degiro.Returns(data_stock).return_on_all_stocks_by_year(
+        years, progress=lambda done, total: matching_progress(job_id, done, total)
+    )
+    report_metric("opendeclaro_returns_seconds", time.perf_counter() - start)
+    isin_summary = pl.concat(
+        [
+            returns.isin_summary.select(pl.lit(year, dtype=pl.Int32).alias("year"), "isin", "return")
+            for year, returns in returns_by_year.items()
+        ]
+    )
+    report_metric("opendeclaro_isin_total", isin_summary["isin"].n_unique())
+    year_summary = pl.DataFrame(
+        {
+            "year": list(returns_by_year),
+            "global_result": [float(returns.global_return) for returns in returns_by_year.values()],
+        },
+        schema={"year": pl.Int32, "global_result": pl.Float64},
+    )
+    return ReturnsISINGlob(isin_summary, year_summary)
+
+
+def warm_worker() -> None:
+    """Initializer of the worker processes: import the modules computing the returns (spawned processes do not
+    inherit the imports of the server) and, when WARMUP is set, compute the bundled synthetic account, so that no
+    request pays for the first calls of polars and opendeclaro"""
+    for module in WORKER_MODULES:
+        importlib.import_module(module)
+    if config.WARMUP:
+        with open(config.WARMUP_FILE, "rb") as f:
+            returns_from_csv(parse_batch(f.read()), [config.FISCAL_YEAR])
+
+
+async def file_chunks(file: UploadFile, chunk_size: int) -> AsyncIterator[bytes]:
+    while chunk := await file.read(chunk_size):
+        yield chunk
+
+
+def parse_batch(csv: bytes) -> DataFrame:
+    # every column as string, so that all batches share the schema Dataset expects from the csv
+    return pl.read_csv(BytesIO(csv), infer_schema_length=0)
+
+
+def last_record_end(data: bytearray) -> int:
+    """Index of the last newline of data that ends a record, -1 if there is none
+
+    Data starts at the beginning of a record, so a newline is inside a quoted (multi-line) field when an odd number
+    of quotes precedes it; escaped quotes ("") count twice and leave the parity unchanged.
+    """
+    end = len(data)
+    while (end := data.rfind(b"\n", 0, end)) >= 0 and data.count(b'"', 0, end) % 2:
+        pass
+    return end
+
+
+def spool_upload(header: Optional[bytes], frames: List[DataFrame], pending: bytes) -> IO[bytes]:
+    """Temporary csv file with the header, the batches already parsed and the bytes not parsed yet"""
+    f = tempfile.NamedTemporaryFile(suffix=".csv", delete=False)
+    f.write(header or b"")
+    for df in frames:
+        df.write_csv(f, include_header=False)
+    f.write(pending)
+    return f
+
+
+async def read_upload(chunks: AsyncIterator[bytes], max_size: int, batch_size: int, spool_threshold: int) -> Upload:
+    """Read the upload by chunks, hashing its content and parsing it by batches of lines on the way.
+
+    Each batch (the header followed by about batch_size bytes of complete records) is parsed in a thread while the
+    next chunks are read, and its bytes are released once parsed. Uploads larger than spool_threshold bytes are not
+    kept in memory: what was parsed so far and the rest of the upload are written to a temporary csv file, to be
+    removed with Upload.remove_spooled.
+
+    Raises
+    ------
+    UploadTooLargeError
+        as soon as more than max_size bytes have been read
+    EmptyUploadError
+        when the upload has no record after its header
+    """
+    sha = hashlib.sha256()
+    size = 0
+    header = None
+    pending = bytearray()
+    batches: List[asyncio.Future] = []
+    spool = None
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > max_size:
+                raise UploadTooLargeError(f"Upload exceeds {max_size} bytes")
+            sha.update(chunk)
+            if spool is not None:
+                await run_in_threadpool(spool.write, chunk)
+                continue
+            pending += chunk
+            if size > spool_threshold:
+                frames = await asyncio.gather(*batches)
+                spool = await run_in_threadpool(spool_upload, header, frames, bytes(pending))
+                batches, pending = [], bytearray()
+                continue
+            if header is None:
+                if (end := pending.find(b"\n")) < 0:
+                    continue
+                header = bytes(pending[: end + 1])
+                del pending[: end + 1]
+            if len(pending) >= batch_size and (end := last_record_end(pending)) >= 0:
+                batches.append(asyncio.ensure_future(run_in_threadpool(parse_batch, header + pending[: end + 1])))
+                del pending[: end + 1]
+        if spool is not None:
+            spool.close()
+            return Upload(spool.name, sha.hexdigest(), size)
+        if header is None or not (batches or pending.strip()):
+            raise EmptyUploadError("Upload has no rows")
+        if pending.strip():
+            batches.append(asyncio.ensure_future(run_in_threadpool(parse_batch, header + pending)))
+        return Upload(pl.concat(await asyncio.gather(*batches)), sha.hexdigest(), size)
+    except BaseException:
+        # batches not parsed yet are dropped with the upload (a batch already running in its thread completes unread)
+        for batch in batches:
+            batch.cancel()
+        if spool is not None:
+            spool.close()
+            os.remove(spool.name)
+        raise
+
+
+def frame_to_ipc(df: DataFrame) -> bytes:
+    sink = BytesIO()
+    df.write_ipc_stream(sink)
+    return sink.getvalue()
+
+
+def result_to_ipc(result: ReturnsISINGlob) -> Tuple[bytes, bytes]:
+    """Serialize the result as Arrow IPC streams to store it out of memory (job database, cache directory)"""
+    return frame_to_ipc(result.isin_summary), frame_to_ipc(result.year_summary)
+
 
+def result_from_ipc(isin_summary: bytes, year_summary: bytes) -> ReturnsISINGlob:
+    return ReturnsISINGlob(pl.read_ipc_stream(BytesIO(isin_summary)), pl.read_ipc_stream(BytesIO(year_summary)))
 
-def returns_from_csv(data_path: str) -> ReturnsISINGlob:
-    data = degiro.Dataset(data_path).data
-    data_stock = degiro.DataPrep(data).stocks_orders
-    degiro_returns = degiro.Returns(data_stock, start_date="01/01/2023", end_date="01/01/2024").return_on_all_stocks()
-    isin_summary = degiro_returns.isin_summary.write_json(row_oriented=True)
-    global_result = degiro_returns.global_return
-    return ReturnsISINGlob(isin_summary, global_result)
 
+def result_tables(result: ReturnsISINGlob) -> List[dict]:
+    """Rows of the result grouped by year, to be rendered by table.html"""
+    return [
+        {
+            "year": row["year"],
+            "global_result": row["global_result"],
+            "isin_summary": result.isin_summary.filter(pl.col("year") == row["year"]).iter_rows(named=True),
+        }
+        for row in result.year_summary.iter_rows(named=True)
+    ]
 
-def generate_random_str(k: str = 10) -> str:
-    return "".join(random.choices(string.ascii_letters + string.digits, k=k))
 
+def result_response(result: ReturnsISINGlob, format: ResultFormat = "json") -> Response:
+    """Response with the result written straight from its frames
 
-def create_user_upload_folder(path: str) -> None:
-    if os.path.exists(path):
-        shutil.rmtree(path)
-    os.makedirs(path)
+    As Arrow IPC stream the body is the ISIN summary and the year summary goes as JSON in the X-Year-Summary header;
+    as JSON the body is {"isin_summary": [{"year": ..., "isin": ..., "return": ...}, ...],
+    "year_summary": [{"year": ..., "global_result": ...}, ...]}.
+    """
+    year_summary = result.year_summary.write_json(row_oriented=True)
+    if format == "arrow":
+        return Response(
+            content=frame_to_ipc(result.isin_summary),
+            media_type=RESULT_FORMATS[format],
+            headers={"X-Year-Summary": year_summary},
+        )
+    content = f'{{"isin_summary": {result.isin_summary.write_json(row_oriented=True)}, "year_summary": {year_summary}}}'
+    return Response(content=content, media_type=RESULT_FORMATS[format])
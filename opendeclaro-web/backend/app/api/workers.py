@@ -0,0 +1,154 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Callable, List, Optional
+
+import polars as pl
+
+# queue of events (progress of jobs, metrics) to the pool owner, set in every worker process when it starts
+_event_queue = None
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def init_worker(event_queue: Any, initializer: Optional[Callable[[], None]]) -> None:
+    global _event_queue
+    # categoricals of the datasets of a worker share one string cache, set once for the whole process
+    pl.enable_string_cache()
+    # run before the queue is set: what the initializer computes is not reported as progress or metrics
+    if initializer is not None:
+        initializer()
+    _event_queue = event_queue
+
+
+def report_progress(job_id: Optional[str], stage: str, done: int = 0, total: int = 0) -> None:
+    """Send the progress of a job from a worker process to the process owning the pool"""
+    if job_id is not None and _event_queue is not None:
+        _event_queue.put(("progress", job_id, stage, done, total))
+
+
+def report_metric(name: str, value: float) -> None:
+    """Send a measure (a duration, a count) taken in a worker process to the process owning the pool"""
+    if _event_queue is not None:
+        _event_queue.put(("metric", name, value))
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        workers: int,
+        queue_size: int,
+        on_progress: Optional[Callable[[str, str, int, int], None]] = None,
+        on_metric: Optional[Callable[[str, float], None]] = None,
+        initializer: Optional[Callable[[], None]] = None,
+    ):
+        """Pool of processes to run CPU-bound computations out of the event loop
+
+        Parameters
+        ----------
+        workers : int
+            number of worker processes
+        queue_size : int
+            maximum number of computations waiting for a free worker
+        on_progress : Optional[Callable[[str, str, int, int], None]], optional
+            called (in a thread of this process) with job_id, stage, done and total for every report_progress call
+            of the workers, by default None
+        on_metric : Optional[Callable[[str, float], None]], optional
+            called (in a thread of this process) with name and value for every report_metric call of the workers,
+            by default None
+        initializer : Optional[Callable[[], None]], optional
+            called in every worker process when it starts (a top level function, pickled by reference), by default
+            None
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self.on_progress = on_progress
+        self.on_metric = on_metric
+        self.initializer = initializer
+        self.pending = 0
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.event_queue: Any = None
+
+    def start(self) -> None:
+        # spawn: forking a process whose polars thread pool is already running may deadlock
+        context = get_context("spawn")
+        self.event_queue = context.Queue()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(self.event_queue, self.initializer),
+        )
+        threading.Thread(target=self.drain_events, args=(self.event_queue,), daemon=True).start()
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+            self.event_queue.put(None)
+
+    async def start_workers(self) -> List[int]:
+        """Start every worker process now rather than on demand and wait for their initializer, returning the pids
+        of the processes that answered
+
+        The executor starts a new process for a submission while none is idle, so the workers submissions made at
+        once start them all, whichever processes end up running them.
+        """
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(loop.run_in_executor(self.executor, os.getpid) for _ in range(self.workers)))
+
+    def drain_events(self, event_queue: Any) -> None:
+        while (event := event_queue.get()) is not None:
+            kind, *args = event
+            if kind == "progress" and self.on_progress is not None:
+                self.on_progress(*args)
+            elif kind == "metric" and self.on_metric is not None:
+                self.on_metric(*args)
+
+    @property
+    def full(self) -> bool:
+        return self.pending >= self.workers + self.queue_size
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.pending - self.workers)
+
+    def reserve(self) -> None:
+        """Take a slot of the pool for a computation to be run later with run_reserved
+
+        Taken before the first await of a request, so that concurrent requests cannot all see a free slot.
+
+        Raises
+        ------
+        QueueFullError
+            when all workers are busy and queue_size computations are already waiting
+        """
+        if self.full:
+            raise QueueFullError("all workers are busy and the queue is full")
+        self.pending += 1
+
+    def release(self) -> None:
+        """Give back a slot taken with reserve that is not used by run_reserved"""
+        self.pending -= 1
+
+    async def run_reserved(self, fn: Callable, *args: Any) -> Any:
+        """Run fn(*args) in a worker process in a slot taken with reserve, released once it is done"""
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.release()
+
+    async def run(self, fn: Callable, *args: Any) -> Any:
+        """Run fn(*args) in a worker process and wait for its result without blocking the event loop
+
+        Raises
+        ------
+        QueueFullError
+            when all workers are busy and queue_size computations are already waiting
+        """
+        self.reserve()
+        return await self.run_reserved(fn, *args)
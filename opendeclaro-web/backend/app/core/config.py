@@ -0,0 +1,30 @@
+"""config.py settings of the web backend, read from environment variables"""
+import os
+
+# processes computing returns and maximum number of computations waiting for one of them
+WORKERS = int(os.environ.get("OPENDECLARO_WORKERS", os.cpu_count() or 1))
+QUEUE_SIZE = int(os.environ.get("OPENDECLARO_QUEUE_SIZE", 2 * WORKERS))
+# uploads larger than MAX_UPLOAD_SIZE bytes are rejected; they are read by chunks of UPLOAD_CHUNK_SIZE bytes and
+# parsed by batches of about UPLOAD_BATCH_SIZE bytes while the rest of the upload is still being read
+MAX_UPLOAD_SIZE = int(os.environ.get("OPENDECLARO_MAX_UPLOAD_SIZE", 100 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = int(os.environ.get("OPENDECLARO_UPLOAD_CHUNK_SIZE", 1024 * 1024))
+UPLOAD_BATCH_SIZE = int(os.environ.get("OPENDECLARO_UPLOAD_BATCH_SIZE", 8 * 1024 * 1024))
+# uploads larger than this many bytes are written to a temporary file instead of being kept in memory
+SPOOL_THRESHOLD = int(os.environ.get("OPENDECLARO_SPOOL_THRESHOLD", 64 * 1024 * 1024))
+
+# fiscal year computed when the upload does not ask for one
+FISCAL_YEAR = int(os.environ.get("OPENDECLARO_FISCAL_YEAR", 2023))
+
+# results cached by content hash of the upload and fiscal year (CACHE_DIR enables the on-disk tier, stored as Arrow
+# IPC streams: anyone who can write to CACHE_DIR can forge the results served, so it must be private to the server)
+CACHE_SIZE = int(os.environ.get("OPENDECLARO_CACHE_SIZE", 128))
+CACHE_TTL = float(os.environ.get("OPENDECLARO_CACHE_TTL", 3600))
+CACHE_DIR = os.environ.get("OPENDECLARO_CACHE_DIR") or None
+
+# synthetic account computed once in the server and in every worker of the pool at startup when WARMUP is set
+WARMUP = os.environ.get("OPENDECLARO_WARMUP", "0") == "1"
+WARMUP_FILE = os.path.join(os.path.dirname(__file__), "warmup.csv")
+
+# jobs are kept in process unless JOB_DB (path of a SQLite database) is set; finished jobs expire after JOB_TTL
+JOB_DB = os.environ.get("OPENDECLARO_JOB_DB") or None
+JOB_TTL = float(os.environ.get("OPENDECLARO_JOB_TTL", 3600))
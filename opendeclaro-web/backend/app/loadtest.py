@@ -0,0 +1,188 @@
+"""loadtest.py load test of /uploadfile/ with synthetic DEGIRO accounts
+
+Runs the app in process (default) or against a running server (--url), sending --requests uploads of accounts of
+--rows rows with --concurrency uploads in flight, and reports throughput and latency percentiles. Results are saved
+as JSON (--output) and compared with the ones of a previous run (--baseline).
+
+    python -m app.loadtest --rows 2000 --requests 50 --concurrency 4 --output results.json
+    python -m app.loadtest --url http://localhost:8001 --baseline results.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import time
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import httpx
+
+HEADER = "Fecha,Hora,Fecha valor,Producto,ISIN,Descripción,Tipo,Variación,,Saldo,,ID Orden\n"
+
+
+def decimal_comma(value: float) -> str:
+    return f"{value:.2f}".replace(".", ",")
+
+
+def synthetic_account(rows: int, seed: int = 0, year: int = 2023) -> bytes:
+    """DEGIRO account csv of about the given number of rows: buys and sells in EUR of several stocks, each trade with
+    its transaction costs, sorted from the most recent as exported by DEGIRO
+
+    Parameters
+    ----------
+    rows : int
+        number of rows of the account (two per trade)
+    seed : int, optional
+        seed of the prices and dates, and part of the order ids (so that accounts of different seeds differ), by
+        default 0
+    year : int, optional
+        year of the trades, by default 2023
+    """
+    rng = random.Random(seed)
+    trades = []
+    for k in range(max(1, rows // 2)):
+        # every stock is bought twice and then sold twice
+        isin = f"ES{k // 4:010d}"
+        verb = "Compra" if k % 4 < 2 else "Venta"
+        date = datetime(year, 1, 2) + timedelta(days=k % 4 * 60 + rng.randint(0, 50), minutes=k)
+        number, price = 10, rng.uniform(10, 100)
+        amount = number * price * (-1 if verb == "Compra" else 1)
+        trades.append((date, isin, verb, number, price, amount, f"{seed}-{k}"))
+    lines = []
+    for date, isin, verb, number, price, amount, id_order in sorted(trades, reverse=True):
+        day, hour, product = date.strftime("%d-%m-%Y"), date.strftime("%H:%M"), f"STOCK {isin}"
+        lines.append(
+            f'{day},{hour},{day},{product},{isin},"{verb} {number} {product}@{decimal_comma(price)} EUR ({isin})",,'
+            f'EUR,"{decimal_comma(amount)}",EUR,"0,00",{id_order}'
+        )
+        lines.append(
+            f"{day},{hour},{day},{product},{isin},Costes de transacción y/o externos de DEGIRO,,"
+            f'EUR,"-2,00",EUR,"0,00",{id_order}'
+        )
+    return (HEADER + "\n".join(lines) + "\n").encode()
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+async def run(
+    url: Optional[str], rows: int, requests: int, concurrency: int, unique: bool, year: int, timeout: float
+) -> dict:
+    """Send the uploads and measure every request
+
+    Returns
+    -------
+    dict
+        settings of the run, throughput (requests per second), latency percentiles (seconds) and errors
+    """
+    async with AsyncExitStack() as stack:
+        if url is None:
+            from app.main import app
+
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            transport = httpx.ASGITransport(app=app)
+            client = httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout)
+        else:
+            client = httpx.AsyncClient(base_url=url, timeout=timeout)
+        await stack.enter_async_context(client)
+
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies: List[float] = []
+        errors: dict = {}
+
+        async def upload(i: int) -> None:
+            # different accounts defeat the result cache of the server unless unique is False
+            content = synthetic_account(rows, seed=i if unique else 0, year=year)
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(
+                        "/uploadfile/",
+                        files={"file": ("account.csv", content, "text/csv")},
+                        data={"years": str(year)},
+                    )
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                if status == "200":
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors[status] = errors.get(status, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(upload(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "revision": git_revision(),
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "machine": platform.platform(),
+        "target": url or "in-process",
+        "rows": rows,
+        "requests": requests,
+        "concurrency": concurrency,
+        "unique": unique,
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "errors": errors,
+    }
+
+
+def report(result: dict, baseline: Optional[dict] = None) -> str:
+    lines = [
+        f"{result['target']}: {result['requests']} uploads of {result['rows']} rows, concurrency "
+        f"{result['concurrency']}, {result['elapsed']:.2f} s, errors {result['errors'] or 'none'}"
+    ]
+    for key, unit in [("throughput", "req/s"), ("p50", "s"), ("p95", "s"), ("p99", "s")]:
+        line = f"  {key:<10} {result[key] or 0:10.4f} {unit}"
+        if baseline is not None and baseline.get(key):
+            line += f"  ({(result[key] or 0) / baseline[key] - 1:+.1%} vs {baseline.get('revision')})"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test of /uploadfile/ with synthetic DEGIRO accounts")
+    parser.add_argument("--url", help="base url of a running server, by default the app is run in process")
+    parser.add_argument("--rows", type=int, default=1000, help="rows of every synthetic account")
+    parser.add_argument("--requests", type=int, default=20, help="number of uploads")
+    parser.add_argument("--concurrency", type=int, default=4, help="uploads in flight at once")
+    parser.add_argument("--year", type=int, default=2023, help="fiscal year of the trades and of the request")
+    parser.add_argument("--same", action="store_true", help="upload the same account every time (cache hits)")
+    parser.add_argument("--timeout", type=float, default=300, help="timeout of every request in seconds")
+    parser.add_argument("--output", help="file where the results are saved as JSON")
+    parser.add_argument("--baseline", help="results of a previous run (JSON) to compare with")
+    args = parser.parse_args()
+
+    result = asyncio.run(
+        run(args.url, args.rows, args.requests, args.concurrency, not args.same, args.year, args.timeout)
+    )
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print(report(result, baseline))
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
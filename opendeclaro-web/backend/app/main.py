@@ -1,68 +1,112 @@
-import csv
-import json
 import os
-import random
-import shutil
-import string
-
-from app.api.utils import (
-    create_user_upload_folder,
-    generate_random_str,
-    returns_from_csv,
-)
-from fastapi import APIRouter, FastAPI, File, HTTPException, Request, UploadFile
-from fastapi.responses import HTMLResponse
+import time
+from contextlib import asynccontextmanager
+from typing import List
+
+from app.api.api_v1.api import router as api_router
+from app.api.api_v1.api import upload_from
+from app.api.services import cache, metrics, pool, render_seconds, requests_in_flight
+from app.api.utils import file_chunks, read_upload, result_tables, results_key, returns_from_csv
+from app.api.workers import QueueFullError
+from app.core import config
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
 
-from opendeclaro import degiro
 
-app = FastAPI(title="opendeclaro")
+async def warm_up() -> None:
+    """Start every worker of the pool, which computes the bundled synthetic account when it starts (warm_worker),
+    then parse and render the account once in this process, so that no request pays for the first calls of polars
+    and opendeclaro"""
+    await pool.start_workers()
+    with open(config.WARMUP_FILE, "rb") as f:
+        content = f.read()
 
-templates = Jinja2Templates(directory="app/api/templates")
+    async def chunks():
+        yield content
 
-UPLOAD_FOLDER = "app/api/uploads"
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+    upload = await read_upload(chunks(), config.MAX_UPLOAD_SIZE, config.UPLOAD_BATCH_SIZE, config.SPOOL_THRESHOLD)
+    try:
+        result = await pool.run(returns_from_csv, upload.data, [config.FISCAL_YEAR])
+    finally:
+        upload.remove_spooled()
+    table_template.render(years=result_tables(result))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pool.start()
+    if config.WARMUP:
+        await warm_up()
+    yield
+    pool.shutdown()
+
+
+app = FastAPI(title="opendeclaro", lifespan=lifespan)
+app.include_router(api_router, prefix="/api/v1")
+
+# templates are static files: read and compiled once, not checked for changes on every request
+# (found from this file, so that the app can be imported from any working directory)
+TEMPLATES_DIR = os.path.join(os.path.dirname(__file__), "api", "templates")
+templates = Jinja2Templates(directory=TEMPLATES_DIR)
+templates.env.auto_reload = False
+table_template = templates.get_template("table.html")
+with open(os.path.join(TEMPLATES_DIR, "form.html")) as f:
+    form_html = f.read()
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # reject before reading the body when the client announces its size; the size of uploads sent without
+    # content-length is checked while reading them
+    content_length = request.headers.get("content-length", "0")
+    if not content_length.isdigit():
+        return JSONResponse(status_code=400, content={"detail": "Invalid Content-Length header"})
+    if int(content_length) > config.MAX_UPLOAD_SIZE:
+        return JSONResponse(status_code=413, content={"detail": f"Upload exceeds {config.MAX_UPLOAD_SIZE} bytes"})
+    requests_in_flight.inc()
+    try:
+        return await call_next(request)
+    finally:
+        requests_in_flight.dec()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> PlainTextResponse:
+    return PlainTextResponse(content=metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/", response_class=HTMLResponse)
 async def get_index() -> HTMLResponse:
-    with open("app/api/templates/form.html") as f:
-        html_content = f.read()
-    return HTMLResponse(content=html_content, status_code=200)
+    return HTMLResponse(content=form_html, status_code=200)
 
 
 @app.post("/uploadfile/", response_class=HTMLResponse)
-async def create_upload_file(request: Request, file: UploadFile = File(...)):
+async def create_upload_file(
+    request: Request, file: UploadFile = File(...), years: List[int] = Form([config.FISCAL_YEAR])
+):
+    years = sorted(set(years))
+    upload = await upload_from(file_chunks(file, config.UPLOAD_CHUNK_SIZE))
     try:
-        folder_path = os.path.join(UPLOAD_FOLDER, generate_random_str())
-        create_user_upload_folder(folder_path)
-        file_path = os.path.join(folder_path, file.filename)
-
-        with open(file_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-
-        return_isin_glob = returns_from_csv(file_path)
-        shutil.rmtree(folder_path)
+        cache_key = results_key(upload.digest, years)
+        return_isin_glob = await cache.get(cache_key)
+        if return_isin_glob is None:
+            return_isin_glob = await pool.run(returns_from_csv, upload.data, years)
+            await cache.set(cache_key, return_isin_glob)
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found")
-
-    # ISIN summary
-    data = json.loads(return_isin_glob.isin_summary)
-    data_html = ""
-    for item in data:
-        data_html += "<tr>"
-        for _, value in item.items():
-            data_html += f"<td>{value}</td>"
-        data_html += "</tr>"
-
-    # Global Return
-    data_global = f"<td>{return_isin_glob.global_result}</td>"
-
-    return templates.TemplateResponse(
-        "table.html",
-        {"request": request, "inserted_html": data_html, "inserted_html_2": data_global},
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Server busy, try again later", headers={"Retry-After": "5"})
+    finally:
+        upload.remove_spooled()
+
+    start = time.perf_counter()
+    response = templates.TemplateResponse(
+        table_template,
+        {"request": request, "years": result_tables(return_isin_glob)},
     )
+    render_seconds.observe(time.perf_counter() - start)
+    return response
 
 
 if __name__ == "__main__":
@@ -0,0 +1,74 @@
+"""serve.py production server: several server processes forked from one with polars and opendeclaro already imported
+
+The heavy imports are paid once before forking and shared by the server processes (copy-on-write); the workers of
+their pools are spawned, not forked, and import the same modules when they start (app.api.utils.warm_worker).
+Polars starts its thread pool on first use, so the thread budget (POLARS_MAX_THREADS) set before forking applies to
+every server process and to the workers of their pools, which inherit the environment.
+
+Settings (environment variables): HOST, PORT, OPENDECLARO_SERVER_WORKERS (server processes, 2 by default) and
+OPENDECLARO_WORKERS (workers of the pool of each server process, by default the cores shared among the server
+processes), besides the ones of app.core.config.
+"""
+import os
+import signal
+import socket
+import sys
+
+import polars  # noqa: F401
+import uvicorn
+
+# the modules computing the returns, not only the package (its classes are imported on first access)
+import opendeclaro.degiro.dataprep  # noqa: F401
+import opendeclaro.degiro.dataset  # noqa: F401
+import opendeclaro.degiro.returns  # noqa: F401
+
+
+def thread_budget(server_workers: int, pool_workers: int) -> int:
+    """Polars threads of each computation, so that all workers running at once use each core once"""
+    return max(1, (os.cpu_count() or 1) // (server_workers * pool_workers))
+
+
+def serve(sock: socket.socket) -> None:
+    # imported after forking: the app opens its job store, caches and pool in each server process
+    from app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, proxy_headers=True, log_level="info"))
+    server.run(sockets=[sock])
+
+
+def main() -> None:
+    server_workers = int(os.environ.get("OPENDECLARO_SERVER_WORKERS", 2))
+    pool_workers = max(1, (os.cpu_count() or 1) // server_workers)
+    pool_workers = int(os.environ.setdefault("OPENDECLARO_WORKERS", str(pool_workers)))
+    os.environ.setdefault("POLARS_MAX_THREADS", str(thread_budget(server_workers, pool_workers)))
+    os.environ.setdefault("OPENDECLARO_WARMUP", "1")
+    # jobs must be visible from every server process
+    os.environ.setdefault("OPENDECLARO_JOB_DB", os.path.abspath("jobs.db"))
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((os.environ.get("HOST", "0.0.0.0"), int(os.environ.get("PORT", 8001))))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    children = []
+    for _ in range(server_workers):
+        pid = os.fork()
+        if pid == 0:
+            serve(sock)
+            os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for pid in children:
+        os.waitpid(pid, 0)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,4 +4,10 @@ export APP_MODULE=${APP_MODULE-app.main:app}
 export HOST=${HOST:-0.0.0.0}
 export PORT=${PORT:-8001}
 
-exec uvicorn --reload --host $HOST --port $PORT "$APP_MODULE"
\ No newline at end of file
+# MODE=prod: several server processes forked after importing polars and opendeclaro, warmed up at startup
+# (see app/serve.py); otherwise a single reloading development server
+if [ "${MODE:-dev}" = "prod" ]; then
+    exec python -m app.serve
+fi
+
+exec uvicorn --reload --host $HOST --port $PORT "$APP_MODULE"
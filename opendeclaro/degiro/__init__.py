@@ -1,6 +1,58 @@
+"""degiro __init__ file
+
+The public classes are imported on first access (PEP 562), so that importing the package, or a module of it that
+does not need polars, does not pay for importing polars.
+"""
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, List
+
 from opendeclaro.degiro import config
-from opendeclaro.degiro.dataprep import DataPrep
-from opendeclaro.degiro.dataset import Dataset
-from opendeclaro.degiro.portfolio import Portfolio, Return
-from opendeclaro.degiro.returns import FIFO, Returns, ReturnsGlobal
-from opendeclaro.degiro.stocks import PurchaseOfStockFromSale, SaleOfStock, Stocks
+
+_exports = {
+    "DataPrep": "dataprep",
+    "Dataset": "dataset",
+    "FXRates": "fx",
+    "ColumnarFIFO": "matching",
+    "MemoryReport": "memory",
+    "memory_report": "memory",
+    "OptionsReturns": "options",
+    "OptionsSummary": "options",
+    "Portfolio": "portfolio",
+    "Return": "portfolio",
+    "FiscalReport": "report",
+    "FiscalSummary": "report",
+    "FIFO": "returns",
+    "MatchingState": "returns",
+    "Returns": "returns",
+    "ReturnsGlobal": "returns",
+    "PurchaseOfStockFromSale": "stocks",
+    "SaleOfStock": "stocks",
+    "Stocks": "stocks",
+}
+
+__all__ = ["config", *_exports]
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f"{__name__}.{_exports[name]}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return __all__
+
+
+if TYPE_CHECKING:
+    from opendeclaro.degiro.dataprep import DataPrep
+    from opendeclaro.degiro.dataset import Dataset
+    from opendeclaro.degiro.fx import FXRates
+    from opendeclaro.degiro.matching import ColumnarFIFO
+    from opendeclaro.degiro.memory import MemoryReport, memory_report
+    from opendeclaro.degiro.options import OptionsReturns, OptionsSummary
+    from opendeclaro.degiro.portfolio import Portfolio, Return
+    from opendeclaro.degiro.report import FiscalReport, FiscalSummary
+    from opendeclaro.degiro.returns import FIFO, MatchingState, Returns, ReturnsGlobal
+    from opendeclaro.degiro.stocks import PurchaseOfStockFromSale, SaleOfStock, Stocks
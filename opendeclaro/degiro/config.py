@@ -13,3 +13,22 @@ cols_list = [
     "cash",
     "id_order",
 ]
+# string columns with few distinct values, stored as Categorical once the dataset is parsed (Dataset(...,
+# categorical=True)): the descriptions repeat for costs, dividends and exchanges of currency, id_order stays Utf8
+categorical_cols = ["product", "isin", "desc", "varcur", "cashcur", "action", "pricecur", "category"]
+# money columns stored as fixed point hold integer amounts of 1/minor_units of their currency
+minor_units = 100
+# columns of the stock orders read by Returns and FIFO, the only ones kept in DataPrep(...).matching_orders
+matching_cols = [
+    "id_order",
+    "isin",
+    "isin_change",
+    "date",
+    "value_date",
+    "action",
+    "number",
+    "var",
+    "curr_rate",
+    "commision",
+    "unintended",
+]
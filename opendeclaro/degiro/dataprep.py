@@ -1,18 +1,27 @@
+from typing import Union
+
 import polars as pl
-from polars import DataFrame
+from polars import DataFrame, LazyFrame
+
+import opendeclaro.degiro.config as config
+from opendeclaro.degiro.fx import FXRates
 
 
 # fmt:off
 class DataPrep:
-    def __init__(self, data: DataFrame):
+    def __init__(self, data: Union[DataFrame, LazyFrame]):
         self.data = data
+
+    @property
+    def money_dtype(self) -> pl.DataType:
+        return self.data.schema["var"]
         
     def prepare_id_orders(self):
         df = (
             self.data
             .filter(
                 (pl.col("id_order").str.lengths() > 0) & 
-                (pl.col("action").str.lengths() > 0)
+                (pl.col("action").is_in(["buy", "sell"]))
             )
             .select(pl.exclude("curr_rate"))
         )
@@ -20,11 +29,11 @@ class DataPrep:
             self.data
             .filter(
                 (pl.col("id_order").str.lengths() > 0) &
-                (pl.col("action").str.lengths() == 0) & 
-                (pl.col("desc").str.contains("Divisa")).not_()
+                (pl.col("action") == "") & 
+                (pl.col("desc").cast(pl.Utf8).str.contains("Divisa")).not_()
             )
             .group_by("id_order")
-            .agg(pl.col("var").sum().alias("commision"))
+            .agg(pl.col("var").sum().cast(self.money_dtype).alias("commision"))
         )
         df_curr_rate = (
             self.data
@@ -43,41 +52,69 @@ class DataPrep:
         df = (
             self.data
             .filter(
-                (pl.col("action").str.lengths() > 0) & 
+                (pl.col("action").is_in(["buy", "sell"])) & 
                 (pl.col("id_order").str.lengths() == 0)
             )
-            .with_columns(pl.lit(None).alias("commision").cast(pl.Float32, strict=False))
+            .with_columns(pl.lit(None).alias("commision").cast(self.money_dtype, strict=False))
             .with_columns(pl.lit(True).alias("unintended"))
         )
         return df.sort("date", descending=True)
     
-    @property
-    def stocks_orders(self) -> DataFrame:
-        df_stocks = self.map_eur_curr_rate(
+    def prepare_orders(self) -> Union[DataFrame, LazyFrame]:
+        df_orders = self.map_eur_curr_rate(
             pl.concat(
                 [self.prepare_id_orders(),
                 self.prepare_involuntary_orders().select(self.prepare_id_orders().columns)],
                 how="align"
-            ).unique().sort("date", descending=True)
+            ).unique()
         )
+        return FXRates(self.data).fill_curr_rate(df_orders).sort("date", descending=True)
+
+    @property
+    def stocks_orders(self) -> DataFrame:
+        df_stocks = self.prepare_orders()
         df_stocks = self.add_isin_change_col(df_stocks)
         return df_stocks
 
+    @property
+    def matching_orders(self) -> DataFrame:
+        """Stock orders with only the columns read by Returns and FIFO (config.matching_cols), so that the frames
+        they filter, sort and concatenate for every transaction are not wider than needed"""
+        return self.stocks_orders.select(config.matching_cols)
+
     
     @staticmethod
-    def map_eur_curr_rate(df: DataFrame) -> DataFrame:
+    def map_eur_curr_rate(df: Union[DataFrame, LazyFrame]) -> Union[DataFrame, LazyFrame]:
         return df.with_columns(
-            pl.when(pl.col("cashcur").str.contains("EUR"))
+            pl.when(pl.col("cashcur").cast(pl.Utf8).str.contains("EUR"))
             .then(1.0)
             .otherwise(pl.col("curr_rate"))
             .alias("curr_rate")
         )
     
+    @staticmethod
+    def eur_amount(fixed_point: bool = False) -> pl.Expr:
+        """Value in EUR of the orders, costs included
+
+        In EUR minor units, rounded as the broker does, if fixed_point.
+        """
+        if fixed_point:
+            return (
+                (pl.col("var").fill_null(0) / pl.col("curr_rate")).round(0).cast(pl.Int64) +
+                pl.col("commision").fill_null(0).cast(pl.Int64)
+            ).alias("amount")
+        return (pl.col("var").fill_null(0.0) / pl.col("curr_rate") + pl.col("commision").fill_null(0.0)).alias("amount")
+
+    @staticmethod
+    def major_units(*cols: str) -> pl.Expr:
+        """Convert money columns in minor units to Float64 in units of currency"""
+        return pl.col(*cols).cast(pl.Float64) / config.minor_units
+
     @staticmethod
     def add_isin_change_col(df: DataFrame) -> DataFrame:
         df_isin = df.filter(
             (pl.col("unintended") == True) & 
-            (pl.col("desc").str.contains("CAMBIO DE ISIN"))
+            (pl.col("desc").cast(pl.Utf8).str.contains("CAMBIO DE ISIN"))
         )
         df_updated_with_isin = df.with_columns(pl.lit(None).alias("isin_change"))
         for _, data in df_isin.group_by("value_date", maintain_order=True):
@@ -1,5 +1,7 @@
 """prepare.py classes and functions for degiro"""
-from typing import List, Union
+import os
+from io import BytesIO
+from typing import IO, List, Union
 
 import polars as pl
 from polars import DataFrame, LazyFrame
@@ -8,15 +10,32 @@ import opendeclaro.degiro.config as config
 
 
 class Dataset:
-    def __init__(self, path: str):
+    # the transactions of the account, read lazily until the orphan rows are handled
+    data: DataFrame
+
+    def __init__(
+        self,
+        path: Union[str, os.PathLike, bytes, IO[bytes], DataFrame],
+        fixed_point: bool = False,
+        categorical: bool = False,
+    ):
         """Initialise class
 
         Parameters
         ----------
-        path : str
-            path location of dataset csv
+        path : Union[str, os.PathLike, bytes, IO[bytes], DataFrame]
+            path location of dataset csv, its content as bytes or a binary file-like object, or the csv already read
+            into a dataframe of string columns
+        fixed_point : bool, optional
+            if True money columns (var, cash) are stored as Int64 minor units (cents) instead of Float32, so that
+            sums are exact, by default False
+        categorical : bool, optional
+            if True low cardinality string columns (config.categorical_cols) are stored as Categorical, by default
+            False. Categoricals of different datasets are joined without re-encoding only under a pl.StringCache
+            (enabled for the whole process by the entry points of the application)
         """
-        self.data = pl.scan_csv(path)
+        self.fixed_point = fixed_point
+        self.data = self.scan(path)
         self.data_cols = dict(zip(config.cols_list, self.data.columns))
         self.data = self.create_combined_date()
         self.data = self.type_converter()
@@ -31,8 +50,21 @@ class Dataset:
         # Change dtype and drop duplicates to avoid same transaction duplicated
         self.data = self.replace_str_null(self.data)
         self.data = self.change_curr_rate_dtype()
+        if categorical:
+            self.data = self.encode_categorical()
         self.data = self.data.unique().sort("date", descending=True)
 
+    @staticmethod
+    def scan(source: Union[str, os.PathLike, bytes, IO[bytes], DataFrame]) -> LazyFrame:
+        """Lazy frame of the csv, scanned from disk for paths and parsed from memory otherwise"""
+        if isinstance(source, DataFrame):
+            return source.lazy()
+        if isinstance(source, (str, os.PathLike)):
+            return pl.scan_csv(source)
+        if isinstance(source, bytes):
+            source = BytesIO(source)
+        return pl.read_csv(source).lazy()
+
     @property
     def change_isin(self) -> dict:
         """Filters dataframe to get the pairs of stocks that changed isin
@@ -43,7 +75,7 @@ class Dataset:
             dict containing pair of stocks names that changed isin (new isin in key, old in value)
         """
         change_isin_str = "CAMBIO DE ISIN"
-        change_isin_df = self.data.filter(pl.col("desc").str.contains(change_isin_str))
+        change_isin_df = self.data.filter(pl.col("desc").cast(pl.Utf8).str.contains(change_isin_str))
         change_isin_list = list(
             change_isin_df.group_by("value_date").agg("product").select("product").to_dict(as_series=False).values()
         )[0]
@@ -68,12 +100,26 @@ class Dataset:
             pl.col(self.data_cols["desc"]),
             pl.col(self.data_cols["curr_rate"]).cast(pl.String),
             pl.col(self.data_cols["varcur"]),
-            pl.col(self.data_cols["var"]).str.replace(",", ".").cast(pl.Float32, strict=False),
+            self.money_converter(pl.col(self.data_cols["var"])),
             pl.col(self.data_cols["cashcur"]),
-            pl.col(self.data_cols["cash"]).str.replace(",", ".").cast(pl.Float32, strict=False),
+            self.money_converter(pl.col(self.data_cols["cash"])),
             pl.col(self.data_cols["id_order"]),
         )
 
+    def money_converter(self, col: pl.Expr) -> pl.Expr:
+        """Convert a money column written with decimal comma to Float32, or to Int64 minor units if fixed_point
+
+        Minor units are rounded half away from zero: the decimal cast truncates, so the amount is read with one more
+        digit and rounded on integers.
+        """
+        amount = col.str.replace(",", ".")
+        if self.fixed_point:
+            tenths = (amount.cast(pl.Decimal(scale=3), strict=False) * (10 * config.minor_units)).cast(
+                pl.Int64, strict=False
+            )
+            return (tenths.abs() + 5).floordiv(10) * tenths.sign()
+        return amount.cast(pl.Float32, strict=False)
+
     def drop_orphan_rows(self) -> Union[DataFrame, LazyFrame]:
         """Drop orphan rows where no date data is available"""
         return self.data.filter(pl.col(self.data_cols["reg_date"]) != None)
@@ -121,9 +167,9 @@ class Dataset:
                     pl.col("desc").unique().alias("desc_list"),
                     pl.col("curr_rate").unique().alias("curr_rate_list"),
                     pl.col("varcur").unique().alias("varcur_list"),
-                    pl.col("var").sum(),
+                    pl.col("var").sum().cast(self.data.schema["var"]),
                     pl.col("cashcur").unique().alias("cashcur_list"),
-                    pl.col("cash").sum(),
+                    pl.col("cash").sum().cast(self.data.schema["cash"]),
                     pl.col("number").sum(),
                     pl.col("price").mean(),
                     pl.col("pricecur").unique().alias("pricecur_list"),
@@ -192,6 +238,12 @@ class Dataset:
             .otherwise(False)
         )
 
+    def encode_categorical(self) -> DataFrame:
+        """Encode the columns of config.categorical_cols as Categorical"""
+        # the chunks of a column are encoded under one cache, instead of separately and then re-encoded to merge them
+        with pl.StringCache():
+            return self.data.with_columns(pl.col(config.categorical_cols).cast(pl.Categorical))
+
     def change_curr_rate_dtype(self):
         self.data = self.data.with_columns(
             pl.col("curr_rate")
@@ -247,7 +299,7 @@ class Dataset:
 
     @staticmethod
     def options_names() -> List[str]:
-        return ["JAN2", "FEB2", "MAR2", "APR2", "JUN2", "JUL2", "AUG2", "SEP2", "OCT2", "NOV2", "DEC2"]
+        return ["JAN2", "FEB2", "MAR2", "APR2", "MAY2", "JUN2", "JUL2", "AUG2", "SEP2", "OCT2", "NOV2", "DEC2"]
 
     @staticmethod
     def get_substring_after_colon(input_str: str):
@@ -0,0 +1,124 @@
+"""fx.py exchange rates of the account used to value transactions in EUR"""
+from typing import TypeVar, Union
+
+import polars as pl
+from polars import DataFrame, LazyFrame
+
+# frames joined together are of the same kind
+Frame = TypeVar("Frame", DataFrame, LazyFrame)
+
+
+class FXRates:
+    def __init__(self, data: Union[DataFrame, LazyFrame]):
+        """Initialise class
+
+        Parameters
+        ----------
+        data : Union[DataFrame, LazyFrame]
+            dataframe of the prepared dataset (Dataset(path).data)
+        """
+        self.table = self.rate_table(data)
+
+    @staticmethod
+    def rate_table(data: Union[DataFrame, LazyFrame]) -> Union[DataFrame, LazyFrame]:
+        """Build the table of exchange rates applied by the broker in its currency exchanges ("Divisa" rows).
+
+        The rows of an exchange share id_order (or the date when the exchange is not linked to an order); the rate
+        is the one informed in either row and the currency is the one which is not EUR.
+
+        Parameters
+        ----------
+        data : Union[DataFrame, LazyFrame]
+            dataframe of the prepared dataset
+
+        Returns
+        -------
+        Union[DataFrame, LazyFrame]
+            contains currency, fx_date and fx_rate (units of currency per EUR) sorted by fx_date
+        """
+        return (
+            data.filter(pl.col("desc").cast(pl.Utf8).str.contains("Divisa"))
+            .with_columns(
+                pl.when(pl.col("id_order").str.len_bytes() > 0)
+                .then(pl.col("id_order"))
+                .otherwise(pl.col("date").cast(pl.Utf8))
+                .alias("fx_key")
+            )
+            .group_by("fx_key")
+            .agg(
+                pl.col("varcur").filter(pl.col("varcur") != "EUR").first().alias("currency"),
+                pl.col("date").first().alias("fx_date"),
+                pl.col("curr_rate").drop_nulls().first().alias("fx_rate"),
+            )
+            .filter(pl.col("currency").is_not_null() & pl.col("fx_rate").is_not_null())
+            .select("currency", "fx_date", "fx_rate")
+            .sort("fx_date")
+        )
+
+    @staticmethod
+    def rate_as_of(df: Frame, table: Frame, currency_col: str = "varcur") -> Frame:
+        """Add the fx_rate of every row: the last rate of its currency up to its date
+
+        A rate of after the transaction is only used when the table has no earlier rate of its currency (e.g. a
+        dividend paid in a currency before the first purchase in it): the earliest rate of the currency then applies.
+
+        Parameters
+        ----------
+        df : Frame
+            dataframe with date and currency columns
+        table : Frame
+            exchange rates with currency, fx_date and fx_rate columns sorted by fx_date (as rate_table), of the same
+            kind (DataFrame or LazyFrame) as df
+        currency_col : str, optional
+            column with the currency of the amount to convert, by default "varcur"
+
+        Returns
+        -------
+        Frame
+            same dataframe (sorted by date) with fx_rate, null for the currencies missing in the table
+        """
+        # joined by a column of the same name: the lazy as-of join loses track of by_right when it differs
+        table = table.rename({"currency": currency_col})
+        return (
+            df.sort("date")
+            .join_asof(table, left_on="date", right_on="fx_date", by=currency_col, strategy="backward")
+            .join_asof(
+                table.rename({"fx_date": "next_fx_date", "fx_rate": "next_fx_rate"}),
+                left_on="date",
+                right_on="next_fx_date",
+                by=currency_col,
+                strategy="forward",
+            )
+            .with_columns(pl.coalesce("fx_rate", "next_fx_rate").alias("fx_rate"))
+            .drop("fx_date", "next_fx_date", "next_fx_rate")
+        )
+
+    def fill_curr_rate(self, df: Frame, currency_col: str = "varcur") -> Frame:
+        """Fill the missing curr_rate of every row with the last rate of its currency up to its date (rate_as_of)
+
+        Parameters
+        ----------
+        df : Frame
+            dataframe with date, curr_rate and currency columns
+        currency_col : str, optional
+            column with the currency of the amount to convert, by default "varcur"
+
+        Returns
+        -------
+        Frame
+            same dataframe (sorted by date) with no null curr_rate where a rate of its currency exists
+        """
+        # the table is of the kind of the dataset, joined as the kind of df
+        table = self.table.lazy() if isinstance(df, LazyFrame) else self.table.lazy().collect()
+        return (
+            self.rate_as_of(df, table, currency_col)
+            .with_columns(
+                pl.coalesce(
+                    pl.col("curr_rate"),
+                    pl.when(pl.col(currency_col) == "EUR").then(pl.lit(1.0)).otherwise(pl.col("fx_rate")),
+                )
+                .cast(pl.Float32)
+                .alias("curr_rate")
+            )
+            .drop("fx_rate")
+        )
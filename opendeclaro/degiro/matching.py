@@ -0,0 +1,147 @@
+"""matching.py columnar FIFO matching of stock transactions"""
+from datetime import timedelta
+
+import polars as pl
+from polars import LazyFrame
+
+
+class ColumnarFIFO:
+    def __init__(self, trades: LazyFrame, by: str = "isin"):
+        """Initialization of class
+
+        Under FIFO the n-th share bought of a security is always paired with the n-th share sold, whichever of the
+        two transactions opened the position. Every transaction therefore covers an interval of the running bought
+        (or sold) quantity, and a match is the overlap of a buy interval with a sell interval. The overlaps are found
+        with as-of joins over the sorted interval boundaries, so no transaction is visited from Python.
+
+        Parameters
+        ----------
+        trades : LazyFrame
+            transactions with columns `by`, "date", "value_date", "action", "number" and "amount", where "amount" is
+            the signed value in EUR of the whole transaction (costs included, negative for purchases)
+        by : str, optional
+            column identifying the security, by default "isin"
+        """
+        self.by = by
+        self.legs = (
+            trades.sort("date", maintain_order=True)
+            .with_row_index("seq")
+            .with_columns(pl.col("number").cum_sum().over([by, "action"]).alias("pos_end"))
+            .with_columns((pl.col("pos_end") - pl.col("number")).alias("pos_start"))
+        )
+
+    def side(self, action: str) -> LazyFrame:
+        """Transactions of one side of the book, renamed with the action as prefix
+
+        Parameters
+        ----------
+        action : str
+            "buy" or "sell"
+
+        Returns
+        -------
+        LazyFrame
+            transactions of the given action sorted by their starting position
+        """
+        return (
+            self.legs.filter(pl.col("action") == action)
+            .select(
+                pl.col(self.by),
+                pl.col("pos_start"),
+                pl.col("pos_end").alias(f"{action}_end"),
+                pl.col("seq").alias(f"{action}_seq"),
+                pl.col("value_date").alias(f"{action}_value_date"),
+                pl.col("number").alias(f"{action}_number"),
+                pl.col("amount").alias(f"{action}_amount"),
+            )
+            .sort("pos_start")
+        )
+
+    @property
+    def matches(self) -> LazyFrame:
+        """Pairs of buy and sell transactions sharing shares under FIFO
+
+        Returns
+        -------
+        LazyFrame
+            one row per matched segment, with the "matched" number of shares, the closing transaction ("close_seq",
+            "close_action", "close_value_date") and the "gain" in EUR realised by the segment
+        """
+        buys, sells = self.side("buy"), self.side("sell")
+        bounds = (
+            pl.concat([buys.select(self.by, "pos_start"), sells.select(self.by, "pos_start")])
+            .unique()
+            .sort([self.by, "pos_start"])
+            .with_columns(pl.col("pos_start").shift(-1).over(self.by).alias("pos_next"))
+            .sort("pos_start")
+        )
+        return (
+            bounds.join_asof(buys, on="pos_start", by=self.by, strategy="backward")
+            .join_asof(sells, on="pos_start", by=self.by, strategy="backward")
+            # a position still open (a security only bought or only sold) has no transaction on the other side
+            .filter(pl.col("buy_seq").is_not_null() & pl.col("sell_seq").is_not_null())
+            .with_columns(
+                (pl.min_horizontal("pos_next", "buy_end", "sell_end") - pl.col("pos_start")).alias("matched"),
+                (pl.col("buy_seq") > pl.col("sell_seq")).alias("buy_closes"),
+            )
+            .filter(pl.col("matched") > 1e-9)
+            .with_columns(
+                pl.when(pl.col("buy_closes")).then(pl.col("buy_seq")).otherwise(pl.col("sell_seq")).alias("close_seq"),
+                pl.when(pl.col("buy_closes")).then(pl.lit("buy")).otherwise(pl.lit("sell")).alias("close_action"),
+                pl.when(pl.col("buy_closes"))
+                .then(pl.col("buy_value_date"))
+                .otherwise(pl.col("sell_value_date"))
+                .alias("close_value_date"),
+                (
+                    pl.col("matched") / pl.col("buy_number") * pl.col("buy_amount")
+                    + pl.col("matched") / pl.col("sell_number") * pl.col("sell_amount")
+                ).alias("gain"),
+            )
+            .drop("buy_closes")
+        )
+
+    @property
+    def closes(self) -> LazyFrame:
+        """Realised result of every closing transaction, with the two month rule applied
+
+        A loss is not computable when the same security is traded again in the opening direction within the two
+        months following the closing transaction, as done in Returns.return_on_stock.
+
+        Returns
+        -------
+        LazyFrame
+            one row per closing transaction with "gain", "matched", "two_month_violation" and "computable_gain"
+        """
+        reopens = self.legs.select(
+            pl.col(self.by),
+            pl.when(pl.col("action") == "buy").then(pl.lit("sell")).otherwise(pl.lit("buy")).alias("close_action"),
+            pl.col("value_date").alias("reopen_date"),
+        ).sort("reopen_date")
+        return (
+            self.matches.group_by(self.by, "close_seq")
+            .agg(
+                pl.col("close_action").first(),
+                pl.col("close_value_date").first(),
+                pl.col("matched").sum(),
+                pl.col("gain").sum(),
+            )
+            .sort("close_value_date")
+            .join_asof(
+                reopens,
+                left_on="close_value_date",
+                right_on="reopen_date",
+                by=[self.by, "close_action"],
+                strategy="forward",
+            )
+            .with_columns(
+                (
+                    (pl.col("gain") < 0)
+                    & pl.col("reopen_date").is_not_null()
+                    & (pl.col("reopen_date") < pl.col("close_value_date") + timedelta(days=60))
+                ).alias("two_month_violation")
+            )
+            .with_columns(
+                pl.when(pl.col("two_month_violation")).then(0.0).otherwise(pl.col("gain")).alias("computable_gain")
+            )
+            .drop("reopen_date")
+        )
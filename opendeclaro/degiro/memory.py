@@ -0,0 +1,84 @@
+"""memory.py memory used by the stages of the computation of the returns of an account"""
+import sys
+from dataclasses import dataclass
+from typing import Dict, Optional, Union
+
+import opendeclaro.degiro.config as config
+from opendeclaro.degiro.dataprep import DataPrep
+from opendeclaro.degiro.dataset import Dataset
+
+if sys.platform != "win32":
+    import resource
+
+
+def reset_peak_rss() -> bool:
+    """Reset the peak resident set size of the process to its current one (Linux), so that peak_rss measures from
+    then on; False where it cannot be reset"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size of the process in bytes, since the last reset_peak_rss on Linux and since its start
+    elsewhere; None where it is unknown (Windows)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if sys.platform != "win32":
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    return None
+
+
+@dataclass
+class MemoryReport:
+    # estimated size in bytes of the frame of every stage and peak resident set size of the process in bytes (None
+    # where unknown)
+    stages: Dict[str, int]
+    peak_rss: Optional[int]
+
+    def report(self) -> str:
+        lines = [f"  {stage:<16} {size / 2**20:10.2f} MiB" for stage, size in self.stages.items()]
+        if self.peak_rss is not None:
+            lines.append(f"  {'peak RSS':<16} {self.peak_rss / 2**20:10.2f} MiB")
+        return "\n".join(lines)
+
+
+def memory_report(path: Union[str, bytes], fixed_point: bool = False) -> MemoryReport:
+    """Estimated size of the frames of the stages of an account (the dataset, the prepared stock orders and the
+    frame matched by Returns) and the peak RSS of the process once computed
+
+    On Linux the peak RSS is reset first, so that it is the one of this account; elsewhere it is the one of the whole
+    process: measure in a fresh process to size the workers of large accounts.
+
+    Parameters
+    ----------
+    path : Union[str, bytes]
+        path location of the account csv or its content
+    fixed_point : bool, optional
+        if True money columns are stored as integer minor units, by default False
+
+    Returns
+    -------
+    MemoryReport
+        estimated size of every stage and peak RSS in bytes
+    """
+    reset_peak_rss()
+    data = Dataset(path, fixed_point=fixed_point).data
+    stocks_orders = DataPrep(data).stocks_orders
+    matching_orders = stocks_orders.select(config.matching_cols)
+    stages = {
+        "dataset": int(data.estimated_size()),
+        "stocks_orders": int(stocks_orders.estimated_size()),
+        "matching_orders": int(matching_orders.estimated_size()),
+    }
+    return MemoryReport(stages, peak_rss())
@@ -0,0 +1,151 @@
+"""options.py realised profit and loss of option contracts"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import polars as pl
+from polars import DataFrame, LazyFrame
+
+from opendeclaro.degiro.dataprep import DataPrep
+from opendeclaro.degiro.matching import ColumnarFIFO
+
+# e.g. "AAPL C150.00 20JAN23" or "APPLE INC P 190,5 19JAN24"
+CONTRACT_PATTERN = (
+    r"^(?P<underlying>.*\S)\s+(?P<type>[CP])\s?(?P<strike>\d+(?:[.,]\d+)?)\s+(?P<expiry>\d{1,2}[A-Z]{3}\d{2})$"
+)
+
+
+@dataclass
+class OptionsSummary:
+    contract_summary: pl.DataFrame
+    year_summary: pl.DataFrame
+
+
+# fmt: off
+class OptionsReturns:
+    def __init__(self, data: DataFrame, as_of: Optional[datetime] = None):
+        """Initialization of class
+
+        Parameters
+        ----------
+        data : DataFrame
+            dataframe of the prepared dataset (Dataset(path).data)
+        as_of : Optional[datetime], optional
+            date at which positions still open in expired contracts are closed at zero value, by default the date of
+            the last transaction of the account (so that the result depends on the data only)
+        """
+        self.data = data.lazy()
+        self.fixed_point = data.schema["var"].is_integer()
+        self.as_of = self.data.select(pl.col("date").max()).collect().item() if as_of is None else as_of
+
+    @staticmethod
+    def contract_fields(col: str = "product") -> List[pl.Expr]:
+        """Expressions parsing underlying, type, strike and expiry out of the contract name
+
+        Parameters
+        ----------
+        col : str, optional
+            column containing the contract name, by default "product"
+
+        Returns
+        -------
+        List[pl.Expr]
+            expressions for underlying, type, strike and expiry columns
+        """
+        fields = pl.col(col).cast(pl.Utf8).str.extract_groups(CONTRACT_PATTERN)
+        return [
+            fields.struct.field("underlying").alias("underlying"),
+            fields.struct.field("type").alias("type"),
+            fields.struct.field("strike").str.replace(",", ".").cast(pl.Float64, strict=False).alias("strike"),
+            fields.struct.field("expiry").str.to_datetime("%d%b%y", strict=False).alias("expiry"),
+        ]
+
+    @property
+    def trades(self) -> LazyFrame:
+        """Option transactions valued in EUR
+
+        Returns
+        -------
+        LazyFrame
+            contains contract, date, value_date, action, number, amount and expiry columns
+        """
+        return (
+            DataPrep(self.data).prepare_orders().lazy()
+            .filter(pl.col("category") == "option")
+            .select(
+                pl.col("product").alias("contract"),
+                "date",
+                "value_date",
+                "action",
+                "number",
+                DataPrep.eur_amount(self.fixed_point),
+                self.contract_fields()[-1],
+            )
+        )
+
+    @property
+    def expirations(self) -> LazyFrame:
+        """Closing transactions at zero value for the positions left open in contracts expired before as_of
+
+        Returns
+        -------
+        LazyFrame
+            same columns as trades
+        """
+        return (
+            self.trades
+            .group_by("contract")
+            .agg(
+                (
+                    pl.col("number").filter(pl.col("action") == "buy").sum() -
+                    pl.col("number").filter(pl.col("action") == "sell").sum()
+                ).alias("position"),
+                pl.col("expiry").first(),
+            )
+            .filter((pl.col("position").abs() > 1e-9) & (pl.col("expiry") < self.as_of))
+            .select(
+                "contract",
+                (pl.col("expiry") + timedelta(hours=23, minutes=59)).alias("date"),
+                pl.col("expiry").alias("value_date"),
+                pl.when(pl.col("position") > 0).then(pl.lit("sell")).otherwise(pl.lit("buy")).alias("action"),
+                pl.col("position").abs().alias("number"),
+                pl.lit(0).cast(pl.Int64 if self.fixed_point else pl.Float64).alias("amount"),
+                "expiry",
+            )
+        )
+
+    @property
+    def closes(self) -> LazyFrame:
+        """Realised result of every closing transaction (including expirations)"""
+        trades = pl.concat([self.trades, self.expirations], how="vertical_relaxed")
+        return ColumnarFIFO(trades, by="contract").closes
+
+    def compute(self) -> OptionsSummary:
+        """Compute the realised profit and loss per contract and per year
+
+        Returns
+        -------
+        OptionsSummary
+            realised result by contract (with its parsed fields) and by year of the closing transaction
+        """
+        closes = self.closes.collect()
+        gain = pl.col("gain").round(0) if self.fixed_point else pl.col("gain")
+        contract_summary = (
+            closes
+            .group_by("contract")
+            .agg(pl.col("matched").sum().alias("contracts_closed"), gain.sum().alias("return"))
+            .with_columns(self.contract_fields("contract"))
+            .sort("expiry", "contract")
+        )
+        year_summary = (
+            closes
+            .group_by(pl.col("close_value_date").dt.year().alias("year"))
+            .agg(gain.sum().alias("return"))
+            .sort("year")
+        )
+        if self.fixed_point:
+            contract_summary = contract_summary.with_columns(DataPrep.major_units("return"))
+            year_summary = year_summary.with_columns(DataPrep.major_units("return"))
+        return OptionsSummary(contract_summary, year_summary)
+
+# fmt: on
@@ -7,6 +7,7 @@ from polars import DataFrame
 
 from opendeclaro.degiro.dataset import Dataset
 from opendeclaro.degiro.stocks import PurchaseOfStockFromSale, SaleOfStock, Stocks
+from opendeclaro.profiling import traced
 
 
 @dataclass
@@ -33,6 +34,11 @@ class Portfolio:
             ).select(["product", "id_order"])
 
     @staticmethod
+    @traced(
+        "Portfolio.return_of_sale",
+        "Portfolio",
+        lambda ds, product, id_order: {"product": product, "id_order": id_order},
+    )
     def return_of_sale(ds: Dataset, product: str, id_order: str) -> Return:
         """Computes the return of a sale.
         1. Initialize the SaleOfStock class
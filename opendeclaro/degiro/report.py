@@ -0,0 +1,180 @@
+"""report.py fiscal report of gains, dividends, withholding tax and commissions"""
+from dataclasses import dataclass
+
+import polars as pl
+from polars import DataFrame, LazyFrame
+
+from opendeclaro.degiro.dataprep import DataPrep
+from opendeclaro.degiro.fx import FXRates
+from opendeclaro.degiro.matching import ColumnarFIFO
+
+
+@dataclass
+class FiscalSummary:
+    isin_summary: pl.DataFrame
+    year_summary: pl.DataFrame
+
+
+# fmt: off
+class FiscalReport:
+    def __init__(self, data: DataFrame):
+        """Initialization of class
+
+        Every figure of the report derives from the same lazy frame, so that the whole report is a single query plan
+        in which polars computes the shared subplans (the prepared orders, the costs by order) only once.
+
+        Parameters
+        ----------
+        data : DataFrame
+            dataframe of the prepared dataset (Dataset(path).data)
+        """
+        self.data = data.lazy()
+        self.fixed_point = data.schema["var"].is_integer()
+
+    @property
+    def orders(self) -> LazyFrame:
+        return DataPrep(self.data).prepare_orders().lazy()
+
+    @property
+    def isin_lineage(self) -> LazyFrame:
+        """Pairs of ISIN involved in a change of ISIN, with the ratio of new shares per old share
+
+        Returns
+        -------
+        LazyFrame
+            contains old_isin, new_isin and ratio columns
+        """
+        df_change = self.orders.filter(
+            (pl.col("unintended") == True) &
+            (pl.col("desc").cast(pl.Utf8).str.contains("CAMBIO DE ISIN"))
+        )
+        return (
+            df_change.filter(pl.col("action") == "sell")
+            .select("value_date", pl.col("isin").alias("old_isin"), pl.col("number").alias("old_number"))
+            .join(
+                df_change.filter(pl.col("action") == "buy")
+                .select("value_date", pl.col("isin").alias("new_isin"), pl.col("number").alias("new_number")),
+                on="value_date",
+            )
+            .select("old_isin", "new_isin", (pl.col("new_number") / pl.col("old_number")).alias("ratio"))
+        )
+
+    @property
+    def stock_orders(self) -> LazyFrame:
+        """Prepared orders of stocks, with the shares of old ISIN carried to the new ISIN
+
+        The orders of the changes of ISIN themselves are left out, and the number and price of the orders of an old
+        ISIN are expressed in shares of the new one.
+
+        Returns
+        -------
+        LazyFrame
+            contains the columns of the prepared orders
+        """
+        return (
+            self.orders
+            .filter(
+                (pl.col("category") == "stock") &
+                ~((pl.col("unintended") == True) & pl.col("desc").cast(pl.Utf8).str.contains("CAMBIO DE ISIN"))
+            )
+            .join(self.isin_lineage, left_on="isin", right_on="old_isin", how="left")
+            .with_columns(
+                pl.coalesce("new_isin", "isin").alias("isin"),
+                (pl.col("number") * pl.col("ratio").fill_null(1.0)).alias("number"),
+                (pl.col("price") / pl.col("ratio").fill_null(1.0)).alias("price"),
+            )
+            .drop("new_isin", "ratio")
+        )
+
+    @property
+    def trades(self) -> LazyFrame:
+        """Stock transactions valued in EUR, with the shares of old ISIN carried to the new ISIN
+
+        Returns
+        -------
+        LazyFrame
+            contains isin, date, value_date, action, number and amount columns
+        """
+        return self.stock_orders.select(
+            "isin", "date", "value_date", "action", "number", DataPrep.eur_amount(self.fixed_point)
+        )
+
+    @property
+    def gains(self) -> LazyFrame:
+        closes = ColumnarFIFO(self.trades, by="isin").closes
+        if self.fixed_point:
+            closes = closes.with_columns(pl.col("gain", "computable_gain").round(0))
+        return (
+            closes
+            .group_by("isin", pl.col("close_value_date").dt.year().alias("year"))
+            .agg(
+                pl.col("computable_gain").sum().alias("gains"),
+                pl.col("gain").filter(pl.col("two_month_violation")).sum().alias("disallowed_losses"),
+            )
+        )
+
+    @property
+    def dividends(self) -> LazyFrame:
+        """Gross dividends and withholding tax in EUR, at the last exchange rate of the account up to the payment"""
+        df_dividends = self.data.filter(pl.col("desc").is_in(["Dividendo", "Retención del dividendo"]))
+        var_eur = pl.col("var") / pl.col("curr_rate")
+        return (
+            FXRates(self.data).fill_curr_rate(df_dividends).lazy()
+            .with_columns((var_eur.round(0) if self.fixed_point else var_eur).alias("var_eur"))
+            .group_by("isin", pl.col("value_date").dt.year().alias("year"))
+            .agg(
+                pl.col("var_eur").filter(pl.col("desc") == "Dividendo").sum().alias("dividends"),
+                pl.col("var_eur").filter(pl.col("desc") != "Dividendo").sum().alias("withholding"),
+            )
+        )
+
+    @property
+    def commissions(self) -> LazyFrame:
+        return (
+            self.data
+            .filter(
+                (pl.col("id_order").str.lengths() > 0) &
+                (pl.col("action") == "") &
+                (pl.col("desc").cast(pl.Utf8).str.contains("Divisa")).not_()
+            )
+            .group_by("isin", pl.col("value_date").dt.year().alias("year"))
+            .agg(pl.col("var").sum().alias("commissions"))
+        )
+
+    @property
+    def plan(self) -> LazyFrame:
+        """Single query plan of the whole report
+
+        Returns
+        -------
+        LazyFrame
+            one row per ISIN and year
+        """
+        money_cols = ["gains", "disallowed_losses", "dividends", "withholding", "commissions"]
+        plan = (
+            pl.concat([self.gains, self.dividends, self.commissions], how="diagonal_relaxed")
+            .group_by("isin", "year")
+            .agg(pl.col(money_cols).sum())
+            .sort("year", "isin")
+        )
+        if self.fixed_point:
+            return plan.with_columns(DataPrep.major_units(*money_cols))
+        return plan
+
+    def compute(self) -> FiscalSummary:
+        """Collect the report plan in one pass
+
+        Returns
+        -------
+        FiscalSummary
+            report by ISIN and year, and totals by year
+        """
+        isin_summary = self.plan.collect(comm_subplan_elim=True)
+        year_summary = (
+            isin_summary
+            .group_by("year", maintain_order=True)
+            .agg(pl.col("gains", "disallowed_losses", "dividends", "withholding", "commissions").sum())
+        )
+        return FiscalSummary(isin_summary, year_summary)
+
+# fmt: on
@@ -1,16 +1,20 @@
+import hashlib
+import os
 from collections import defaultdict
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
 
 import polars as pl
 from polars import DataFrame
 
+import opendeclaro.degiro.config as config
 from opendeclaro.degiro.utils import (
     filter_df_inside_dates,
     filter_rowdate_inside_dates,
     opposite_transaction,
 )
+from opendeclaro.profiling import frame, span, spans, traced
 
 
 @dataclass
@@ -19,6 +23,35 @@ class ReturnsGlobal:
     global_return: float
 
 
+STATE_SCHEMA = {
+    "isin": pl.Utf8,
+    "fingerprint": pl.Utf8,
+    "last_value_date": pl.Datetime("us"),
+    "last_id_order": pl.Utf8,
+    "closed_results": pl.List(pl.Struct({"value_date": pl.Datetime("us"), "result": pl.Float64})),
+}
+
+
+@dataclass
+class MatchingState:
+    # one row per ISIN (STATE_SCHEMA): fingerprint of the transactions of its lineage (the ISIN it changed to or from),
+    # last transaction matched and closing results (value_date, result), reused while the fingerprint does not change
+    securities: DataFrame
+
+    def write(self, path: Union[str, os.PathLike]) -> None:
+        self.securities.write_parquet(path)
+
+    @classmethod
+    def read(cls, path: Union[str, os.PathLike]) -> "MatchingState":
+        return cls(pl.read_parquet(path))
+
+    def closed_results(self) -> Dict[str, List[Tuple[datetime, float]]]:
+        return {
+            row["isin"]: [(result["value_date"], result["result"]) for result in row["closed_results"]]
+            for row in self.securities.select("isin", "closed_results").iter_rows(named=True)
+        }
+
+
 class FIFO:
     def __init__(self, row: dict, df: DataFrame):
         """Initialization of class
@@ -33,6 +66,11 @@ class FIFO:
         self.row = row
         self.df = df
 
+    @traced(
+        "FIFO.opp_df",
+        "FIFO",
+        lambda self, opp_df=pl.DataFrame([]): {"action": self.row["action"], "rows": opp_df.height},
+    )
     def opp_df(self, opp_df: DataFrame = pl.DataFrame([])) -> DataFrame:
         """Computes the opposite transaction to the traded row (e.g. if the traded row is "sell", it returns a dataframe
         containing "buy" transactions).
@@ -51,63 +89,68 @@ class FIFO:
         DataFrame
             dataframe with the opposite transaction to the traded row, after the FIFO method is applied
         """
+        source = self.df if opp_df.is_empty() else opp_df
         if opp_df.is_empty():
-            opp_df_affected = (
-                self.df.sort("value_date")
-                .filter(
-                    (pl.col("action") == opposite_transaction(self.row["action"]))
-                    & (pl.col("value_date") < self.row["value_date"])
-                    & (pl.col("unintended") == False)
-                )
-                .with_columns(
-                    pl.cum_sum("number").sub(self.row["shares_effective"]).sub(pl.col("number")).alias("pending"),
+            with span("FIFO.affected", "FIFO", rows=source.height):
+                opp_df_affected = (
+                    self.df.sort("value_date")
+                    .filter(
+                        (pl.col("action") == opposite_transaction(self.row["action"]))
+                        & (pl.col("value_date") < self.row["value_date"])
+                        & (pl.col("unintended") == False)
+                    )
+                    .with_columns(
+                        pl.cum_sum("number").sub(self.row["shares_effective"]).sub(pl.col("number")).alias("pending"),
+                    )
+                    .filter(pl.col("pending") < 0)
+                    .with_columns(
+                        pl.when(abs(pl.col("pending")) > pl.col("number"))
+                        .then(pl.col("number"))
+                        .otherwise(abs(pl.col("pending")))
+                        .alias("shares_effective")
+                    )
+                    .with_columns((pl.col("number") - pl.col("shares_effective")).alias("number"))
                 )
-                .filter(pl.col("pending") < 0)
-                .with_columns(
-                    pl.when(abs(pl.col("pending")) > pl.col("number"))
-                    .then(pl.col("number"))
-                    .otherwise(abs(pl.col("pending")))
-                    .alias("shares_effective")
+            with span("FIFO.untouched", "FIFO", rows=source.height):
+                opp_df_untouched = (
+                    self.df.sort("value_date")
+                    .filter((pl.col("action") == opposite_transaction(self.row["action"])))
+                    .with_columns(
+                        pl.cum_sum("number").sub(self.row["shares_effective"]).sub(pl.col("number")).alias("pending"),
+                    )
+                    .filter(pl.col("pending") >= 0)
+                    .with_columns(pl.lit(0.0).alias("shares_effective"))
                 )
-                .with_columns((pl.col("number") - pl.col("shares_effective")).alias("number"))
-            )
-            opp_df_untouched = (
-                self.df.sort("value_date")
-                .filter((pl.col("action") == opposite_transaction(self.row["action"])))
-                .with_columns(
-                    pl.cum_sum("number").sub(self.row["shares_effective"]).sub(pl.col("number")).alias("pending"),
-                )
-                .filter(pl.col("pending") >= 0)
-                .with_columns(pl.lit(0.0).alias("shares_effective"))
-            )
 
         else:
-            opp_df_affected = (
-                opp_df.sort("value_date")
-                .filter(pl.col("number") > 0)
-                .with_columns(
-                    pl.cum_sum("number").sub(self.row["shares_effective"]).sub(pl.col("number")).alias("pending")
+            with span("FIFO.affected", "FIFO", rows=source.height):
+                opp_df_affected = (
+                    opp_df.sort("value_date")
+                    .filter(pl.col("number") > 0)
+                    .with_columns(
+                        pl.cum_sum("number").sub(self.row["shares_effective"]).sub(pl.col("number")).alias("pending")
+                    )
+                    .filter(pl.col("pending") < 0)
+                    .with_columns(
+                        pl.when(abs(pl.col("pending")) > pl.col("number"))
+                        .then(pl.col("number"))
+                        .otherwise(abs(pl.col("pending")))
+                        .alias("shares_effective")
+                    )
+                    .with_columns((pl.col("number") - pl.col("shares_effective")).alias("number"))
                 )
-                .filter(pl.col("pending") < 0)
-                .with_columns(
-                    pl.when(abs(pl.col("pending")) > pl.col("number"))
-                    .then(pl.col("number"))
-                    .otherwise(abs(pl.col("pending")))
-                    .alias("shares_effective")
-                )
-                .with_columns((pl.col("number") - pl.col("shares_effective")).alias("number"))
-            )
-            opp_df_untouched = (
-                opp_df.sort("value_date")
-                .filter(pl.col("action") == opposite_transaction(self.row["action"]))
-                .with_columns(
-                    pl.cum_sum("number").sub(self.row["shares_effective"]).sub(pl.col("number")).alias("pending"),
+            with span("FIFO.untouched", "FIFO", rows=source.height):
+                opp_df_untouched = (
+                    opp_df.sort("value_date")
+                    .filter(pl.col("action") == opposite_transaction(self.row["action"]))
+                    .with_columns(
+                        pl.cum_sum("number").sub(self.row["shares_effective"]).sub(pl.col("number")).alias("pending"),
+                    )
+                    .filter(pl.col("pending") >= 0)
+                    .with_columns(pl.lit(0.0).alias("shares_effective"))
                 )
-                .filter(pl.col("pending") >= 0)
-                .with_columns(pl.lit(0.0).alias("shares_effective"))
-            )
 
-        return pl.concat([opp_df_affected, opp_df_untouched])
+        return frame(pl.concat([opp_df_affected, opp_df_untouched]))
 
 
 # fmt: off
@@ -127,27 +170,90 @@ class Returns:
         self.df = df
         self.end_date = end_date
         self.start_date  = start_date
+        # money columns in minor units (Dataset(path, fixed_point=True)) are summed exactly as integers
+        self.fixed_point = df.schema["var"].is_integer()
+        # closing results of the ISIN matched by match_state, reused instead of matching them again
+        self.matched: Dict[str, List[Tuple[datetime, float]]] = {}
     
     @property
     def unique_isin(self) -> List[str]:
         isin_list = (
             filter_df_inside_dates(self.df, col_name="value_date", start_date=self.start_date, end_date=self.end_date)
-            .filter(pl.col("isin").str.len_bytes() > 1)
+            .filter(pl.col("isin").cast(pl.Utf8).str.len_bytes() > 1)
             .select(pl.col("isin").unique())
             .to_series()
             .to_list()
         )
         return isin_list
     
-    def return_on_all_stocks(self) -> ReturnsGlobal:
+    def return_on_all_stocks(self, progress: Optional[Callable[[int, int], None]] = None) -> ReturnsGlobal:
+        """Compute the return of every stock ISIN traded between start_date and end_date
+
+        Parameters
+        ----------
+        progress : Optional[Callable[[int, int], None]], optional
+            called after each ISIN with the number of ISIN computed and the total, by default None
+
+        Returns
+        -------
+        ReturnsGlobal
+            return per ISIN and global return
+        """
         return_all = 0
         isin_dict = defaultdict(list)
-        for isin in self.unique_isin:
+        unique_isin = self.unique_isin
+        for done, isin in enumerate(unique_isin, start=1):
             return_isin = self.return_on_stock(isin)
             isin_dict["isin"].append(isin)
             isin_dict["return"].append(return_isin)
             return_all += return_isin
+            if progress is not None:
+                progress(done, len(unique_isin))
+        if self.fixed_point:
+            return_all = round(return_all, 2)
         return ReturnsGlobal(pl.DataFrame(isin_dict), return_all)
+
+    def return_on_all_stocks_by_year(
+        self, years: List[int], progress: Optional[Callable[[int, int], None]] = None
+    ) -> Dict[int, ReturnsGlobal]:
+        """Compute the return of every stock ISIN for each of several fiscal years, matching the transactions of every
+        ISIN only once (the matching does not depend on the dates of the period, only the computed sales do)
+
+        Parameters
+        ----------
+        years : List[int]
+            fiscal years, each one computed as Returns(df, start_date=f"01/01/{year}", end_date=f"01/01/{year + 1}")
+        progress : Optional[Callable[[int, int], None]], optional
+            called after each ISIN with the number of ISIN computed and the total, by default None
+
+        Returns
+        -------
+        Dict[int, ReturnsGlobal]
+            return per ISIN and global return of every year
+        """
+        periods = {year: (f"01/01/{year}", f"01/01/{year + 1}") for year in years}
+        isin_by_year = {
+            year: set(Returns(self.df, start_date=start_date, end_date=end_date).unique_isin)
+            for year, (start_date, end_date) in periods.items()
+        }
+        unique_isin = list(dict.fromkeys(isin for year in years for isin in sorted(isin_by_year[year])))
+        isin_dicts = {year: {"isin": [], "return": []} for year in years}
+        for done, isin in enumerate(unique_isin, start=1):
+            closed_results = self.closed_results(isin)
+            for year, (start_date, end_date) in periods.items():
+                if isin in isin_by_year[year]:
+                    isin_dicts[year]["isin"].append(isin)
+                    isin_dicts[year]["return"].append(self.sum_results(closed_results, start_date, end_date))
+            if progress is not None:
+                progress(done, len(unique_isin))
+        results = {}
+        for year in years:
+            return_all = sum(isin_dicts[year]["return"])
+            if self.fixed_point:
+                return_all = round(return_all, 2)
+            isin_summary = pl.DataFrame(isin_dicts[year], schema={"isin": pl.Utf8, "return": pl.Float64})
+            results[year] = ReturnsGlobal(isin_summary, return_all)
+        return results
     
     def return_on_stock(self, isin: str) -> float:
         """Compute the return of a given stock ISIN
@@ -162,38 +268,167 @@ class Returns:
         float
             return on the stock
         """
+        return self.sum_results(self.closed_results(isin), self.start_date, self.end_date)
+
+    def sum_results(
+        self, closed_results: List[Tuple[datetime, float]], start_date: Optional[str], end_date: Optional[str]
+    ) -> float:
+        """Sum the results of the closing transactions dated between start_date and end_date"""
+        return_stock = 0
+        for value_date, result in closed_results:
+            if filter_rowdate_inside_dates(value_date, start_date, end_date) == True:
+                return_stock += result
+        if self.fixed_point:
+            return return_stock / config.minor_units
+        return return_stock
+
+    @traced(
+        "Returns.closed_results",
+        "Returns",
+        lambda self, isin: {"isin": isin, "rows": self.df.filter(pl.col("isin") == isin).height},
+    )
+    def closed_results(self, isin: str) -> List[Tuple[datetime, float]]:
+        """Match the transactions of a given stock ISIN under FIFO
+
+        Parameters
+        ----------
+        isin : str
+            ISIN of the stock traded
+
+        Returns
+        -------
+        List[Tuple[datetime, float]]
+            value date and computable result (minor units if fixed_point) of every closing transaction, whatever
+            its date
+        """
+        if isin in self.matched:
+            return self.matched[isin]
         df = self.df.filter(pl.col("isin") == isin).with_columns(pl.col("number").alias("number_orig"))
         opp_df = pl.DataFrame([])
-        return_stock = 0
-        for row in df.sort(pl.col("value_date")).iter_rows(named=True):
+        closed_results = []
+        transactions = df.sort(pl.col("value_date")).iter_rows(named=True)
+        for row in spans(transactions, "transaction", "Returns", lambda row: {"id_order": row["id_order"]}):
             if row["isin_change"] != None:
                 df = (
                     self.df
                     .filter((pl.col("isin") == isin) | (pl.col("isin") == row["isin_change"]))
                     .with_columns(pl.col("number").alias("number_orig"))
                 )
-            stocks_before = self.get_stocks_purchased_before(row, df)
+            with span("stocks_before", "Returns", rows=df.height):
+                stocks_before = self.get_stocks_purchased_before(row, df)
             if self.choose_compute_transaction(row, stocks_before) == True:
                 row["date_2m_limit"] = row["value_date"] + timedelta(days=60)
                 row["shares_effective"] = min(abs(stocks_before), row["number"])
                 opp_df = FIFO(row, df).opp_df(opp_df)
-                row_res = row["var"]/row["curr_rate"] + row["commision"]
-                opp_df_res = (
-                    (opp_df["var"]/opp_df["curr_rate"] + opp_df["commision"]) * opp_df["shares_effective"] / opp_df["number_orig"]
-                ).sum()
+                if self.fixed_point:
+                    row_res = round(row["var"]/row["curr_rate"]) + row["commision"]
+                    opp_df_res = (
+                        (
+                            ((opp_df["var"]/opp_df["curr_rate"]).round(0) + opp_df["commision"]) *
+                            opp_df["shares_effective"] / opp_df["number_orig"]
+                        ).round(0).cast(pl.Int64).sum()
+                    )
+                else:
+                    row_res = row["var"]/row["curr_rate"] + row["commision"]
+                    opp_df_res = (
+                        (opp_df["var"]/opp_df["curr_rate"] + opp_df["commision"]) *
+                        opp_df["shares_effective"] / opp_df["number_orig"]
+                    ).sum()
                 if (row_res + opp_df_res < 0) & (
                     opp_df.filter(pl.col("value_date") < row["date_2m_limit"]).shape != 
                     opp_df.filter(pl.col("value_date") < row["value_date"]).shape
                 ):
-                    return_stock += 0
-                elif filter_rowdate_inside_dates(row["value_date"], self.start_date, self.end_date) == False:
-                    return_stock += 0
-                else:
-                    return_stock += row_res + opp_df_res
-
-        return return_stock
+                    continue
+                closed_results.append((row["value_date"], row_res + opp_df_res))
+        return closed_results
                 
 
+    def lineages(self) -> Dict[str, List[str]]:
+        """ISIN matched together with every ISIN: itself and the ISIN it changed to or from (isin_change)
+
+        Returns
+        -------
+        Dict[str, List[str]]
+            sorted ISIN of the lineage by ISIN
+        """
+        df = (
+            self.df
+            .with_columns(pl.col("isin").cast(pl.Utf8), pl.col("isin_change").cast(pl.Utf8))
+            .filter(pl.col("isin").str.len_bytes() > 1)
+        )
+        # only the rows of the new ISIN name the old one: the lineages are merged in both directions (and along
+        # successive changes of ISIN)
+        lineage: Dict[str, Set[str]] = {isin: {isin} for isin in df["isin"].unique().to_list()}
+        for isin, isin_change in df.select("isin", "isin_change").drop_nulls().unique().iter_rows():
+            if isin_change in lineage and lineage[isin] is not lineage[isin_change]:
+                merged = lineage[isin] | lineage[isin_change]
+                for other in merged:
+                    lineage[other] = merged
+        return {isin: sorted(lineage[isin]) for isin in sorted(lineage)}
+
+    def fingerprints(self) -> Dict[str, str]:
+        """Digest of the transactions matched for every ISIN: the ones of every ISIN of its lineage (lineages), so that
+        the digest of an ISIN changes whenever its closing results may change
+
+        Returns
+        -------
+        Dict[str, str]
+            sha256 digest by ISIN
+        """
+        cols = [col for col in config.matching_cols if col in self.df.columns and col != "isin"]
+        df = self.df.with_columns(pl.col(pl.Categorical).cast(pl.Utf8), pl.col("isin_change").cast(pl.Utf8))
+        # sorted rows written as csv: a digest stable across processes and polars versions
+        digests = {
+            isin: hashlib.sha256(rows.select(cols).sort(cols).write_csv().encode()).hexdigest()
+            for (isin,), rows in df.group_by(["isin"])
+        }
+        return {
+            isin: hashlib.sha256(":".join(digests[other] for other in lineage).encode()).hexdigest()
+            for isin, lineage in self.lineages().items()
+        }
+
+    def security_state(self, isin: str, fingerprint: str, lineage: List[str]) -> dict:
+        """State of an ISIN after matching the transactions of its lineage: last transaction and closing results"""
+        df = self.df.filter(pl.col("isin").cast(pl.Utf8).is_in(lineage)).sort("value_date", "date")
+        last = df.row(-1, named=True)
+        return {
+            "isin": isin,
+            "fingerprint": fingerprint,
+            "last_value_date": last["value_date"],
+            "last_id_order": last["id_order"],
+            "closed_results": [
+                {"value_date": value_date, "result": float(result)} for value_date, result in self.closed_results(isin)
+            ],
+        }
+
+    def match_state(self, state: Optional[MatchingState] = None) -> MatchingState:
+        """Match every ISIN of the transactions, skipping the unchanged ISIN: the closing results of an ISIN whose
+        lineage has the same transactions as in a previous run (same fingerprint) are taken from its state
+
+        Parameters
+        ----------
+        state : Optional[MatchingState], optional
+            state of a previous run (e.g. before a new batch of transactions arrived), by default None
+
+        Returns
+        -------
+        MatchingState
+            state of every ISIN, to be persisted (MatchingState.write) and passed to the next run
+        """
+        # the ISIN of a lineage share their fingerprint
+        rows = [] if state is None else state.securities.to_dicts()
+        previous = {(row["isin"], row["fingerprint"]): row for row in rows}
+        securities = []
+        lineages = self.lineages()
+        for isin, fingerprint in self.fingerprints().items():
+            if (isin, fingerprint) in previous:
+                securities.append(previous[isin, fingerprint])
+            else:
+                securities.append(self.security_state(isin, fingerprint, lineages[isin]))
+        matching_state = MatchingState(pl.DataFrame(securities, schema=STATE_SCHEMA))
+        self.matched = matching_state.closed_results()
+        return matching_state
+
     @staticmethod
     def get_stocks_purchased_before(row: dict, df: DataFrame) -> float:
         """Returns the total number of stocks purchased for a df
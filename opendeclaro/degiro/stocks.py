@@ -5,9 +5,11 @@ import polars as pl
 from polars import DataFrame, Series
 
 from opendeclaro.degiro.dataset import Dataset
+from opendeclaro.profiling import frame, spans, traced
 
 
 class SaleOfStock:
+    @traced("SaleOfStock", "SaleOfStock", lambda self, ds, stock, id_order: {"stock": stock, "id_order": id_order})
     def __init__(self, ds: Dataset, stock: str, id_order: str):
         """Class to compute the sell of a stock
 
@@ -20,11 +22,11 @@ class SaleOfStock:
         id_order : str
             id order of sale
         """
-        self.df = ds.data.filter(pl.col("product") == stock)
+        self.df = frame(ds.data.filter(pl.col("product") == stock))
         self.stock = stock
         self.id_order = id_order
-        self._raw_sale_df = self.raw_sale_df()
-        self._aux_sale_df = self.aux_sale_df()
+        self._raw_sale_df = frame(self.raw_sale_df())
+        self._aux_sale_df = frame(self.aux_sale_df())
 
     # fmt: off
 
@@ -145,6 +147,15 @@ class SaleOfStock:
 
 
 class PurchaseOfStockFromSale(SaleOfStock):
+    @traced(
+        "PurchaseOfStockFromSale",
+        "PurchaseOfStockFromSale",
+        lambda self, ds, stock, id_order, change_isin=False: {
+            "stock": stock,
+            "id_order": id_order,
+            "change_isin": change_isin,
+        },
+    )
     def __init__(self, ds: Dataset, stock: str, id_order: str, change_isin: bool = False):
         """Class to associate stocks purchased for a given sale order
 
@@ -162,10 +173,12 @@ class PurchaseOfStockFromSale(SaleOfStock):
         """
         super().__init__(ds, stock, id_order)
         if change_isin is True:
-            all_stocks_df = pl.DataFrame(pl.Series("product", [stock, ds.change_isin[stock]]))
-            self.df = ds.data.join(all_stocks_df, on="product", how="inner")
-        self.__aux_purchase_df = self.aux_purchase_df()
-        self.__raw_purchase_df = self.raw_purchase_df()
+            all_stocks_df = pl.DataFrame(
+                pl.Series("product", [stock, ds.change_isin[stock]]).cast(ds.data.schema["product"])
+            )
+            self.df = frame(ds.data.join(all_stocks_df, on="product", how="inner"))
+        self.__aux_purchase_df = frame(self.aux_purchase_df())
+        self.__raw_purchase_df = frame(self.raw_purchase_df())
 
     # fmt: off
 
@@ -198,7 +211,11 @@ class PurchaseOfStockFromSale(SaleOfStock):
         """
         buy_df = self.df.filter((pl.col("id_order").is_in(self.buy_orders)) & (pl.col("action") == "buy"))
 
-        for row in self.df_older_sales.select("id_order").iter_rows(named=True):
+        older_sales = self.df_older_sales.select("id_order").iter_rows(named=True)
+        older_sales = spans(
+            older_sales, "older_sale", "PurchaseOfStockFromSale", lambda row: {"id_order": row["id_order"]}
+        )
+        for row in older_sales:
             sale_df = self.df.filter(pl.col("id_order") == row["id_order"])
             row_shares_sold = sale_df.filter(pl.col("action") == "sell").select("number")
 
@@ -225,7 +242,7 @@ class PurchaseOfStockFromSale(SaleOfStock):
             ).select(self.df.columns)
 
             # Update buy_df
-            buy_df = pl.concat([buy_df_affected, buy_df_untouched])
+            buy_df = frame(pl.concat([buy_df_affected, buy_df_untouched]))
         return buy_df
 
     @property
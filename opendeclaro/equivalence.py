@@ -0,0 +1,574 @@
+"""equivalence.py differential testing of the engines computing the realised gains of an account
+
+Random DEGIRO accounts (partial fills, changes of ISIN, short positions, repurchases within two months of a loss and
+trades in USD) are computed by every engine supporting their features, and the gains of every year are compared
+with the ones of the reference engine (Returns) within a tolerance. A failing account is shrunk, dropping securities
+and then transactions while the engine still disagrees, and the minimal account is written as a csv to reproduce it.
+
+    python -m opendeclaro.equivalence --accounts 50 --seed 0 --output failures
+    python -m opendeclaro.equivalence --features isin_change --reference columnar_fifo
+
+New engines are compared by adding them to ENGINES.
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple, Union
+
+import polars as pl
+
+from opendeclaro.degiro.dataprep import DataPrep
+from opendeclaro.degiro.dataset import Dataset
+from opendeclaro.degiro.portfolio import Portfolio
+from opendeclaro.degiro.report import FiscalReport
+from opendeclaro.degiro.returns import MatchingState, Returns
+from opendeclaro.degiro.stocks import Stocks
+from opendeclaro.trades import Trades
+
+HEADER = "Fecha,Hora,Fecha valor,Producto,ISIN,Descripción,Tipo,Variación,,Saldo,,ID Orden"
+FEATURES = frozenset(["partial_fills", "isin_change", "short", "wash_sale", "multi_currency"])
+COSTS = "Costes de transacción y/o externos de DEGIRO"
+
+
+@dataclass(frozen=True)
+class Trade:
+    isin: str
+    date: datetime
+    action: str
+    number: int
+    # price in the currency of the trade, which is worth fx_rate units per EUR
+    price: float
+    currency: str = "EUR"
+    fx_rate: float = 1.0
+    # transaction costs in EUR
+    commission: float = 2.0
+    # rows of the order (partial fills), each one of part of the shares
+    fills: int = 1
+    id_order: str = ""
+
+
+@dataclass(frozen=True)
+class IsinChange:
+    # shares of old_isin exchanged one for one for shares of new_isin, without an order
+    old_isin: str
+    new_isin: str
+    date: datetime
+    number: int
+    price: float
+
+
+Event = Union[Trade, IsinChange]
+
+
+def decimal_comma(value: float, decimals: int = 2) -> str:
+    return f"{value:.{decimals}f}".replace(".", ",")
+
+
+@dataclass(frozen=True)
+class Account:
+    events: Tuple[Event, ...]
+
+    @property
+    def features(self) -> FrozenSet[str]:
+        """Features of FEATURES present in the account"""
+        features = set()
+        position: Dict[str, int] = defaultdict(int)
+        last_sale: Dict[str, datetime] = {}
+        for event in sorted(self.events, key=lambda event: event.date):
+            if isinstance(event, IsinChange):
+                features.add("isin_change")
+                position[event.new_isin] += position.pop(event.old_isin, 0)
+                continue
+            if event.fills > 1:
+                features.add("partial_fills")
+            if event.currency != "EUR":
+                features.add("multi_currency")
+            position[event.isin] += event.number if event.action == "buy" else -event.number
+            if position[event.isin] < 0:
+                features.add("short")
+            if event.action == "sell":
+                last_sale[event.isin] = event.date
+            elif event.isin in last_sale and event.date - last_sale[event.isin] < timedelta(days=60):
+                features.add("wash_sale")
+        return frozenset(features)
+
+    @property
+    def valid(self) -> bool:
+        """Whether the account could have been generated by random_account: no order turns a long position into a short
+        one (or the other way around) and a change of ISIN exchanges the whole position"""
+        position: Dict[str, int] = defaultdict(int)
+        for event in sorted(self.events, key=lambda event: event.date):
+            if isinstance(event, IsinChange):
+                if position[event.old_isin] != event.number or position[event.new_isin] != 0:
+                    return False
+                position[event.new_isin] = position.pop(event.old_isin)
+                continue
+            before = position[event.isin]
+            position[event.isin] += event.number if event.action == "buy" else -event.number
+            if before * position[event.isin] < 0:
+                return False
+        return True
+
+    @property
+    def years(self) -> List[int]:
+        return sorted({event.date.year for event in self.events})
+
+    def without(self, events: List[Event]) -> "Account":
+        return Account(tuple(event for event in self.events if event not in events))
+
+    def substitute(self, event: Event, new: Event) -> "Account":
+        return Account(tuple(new if other == event else other for other in self.events))
+
+    @staticmethod
+    def trade_rows(trade: Trade) -> List[str]:
+        """Rows of a trade as exported by DEGIRO: the fills, the exchange of currency and the costs"""
+        day, hour = trade.date.strftime("%d-%m-%Y"), trade.date.strftime("%H:%M")
+        product, sign = f"STOCK {trade.isin}", -1 if trade.action == "buy" else 1
+        verb = "Compra" if trade.action == "buy" else "Venta"
+        prefix = f"{day},{hour},{day},{product},{trade.isin}"
+        shares = [trade.number // trade.fills] * trade.fills
+        shares[0] += trade.number - sum(shares)
+        rows = [
+            f'{prefix},"{verb} {number} {product}@{decimal_comma(trade.price)} {trade.currency} ({trade.isin})",,'
+            f'{trade.currency},"{decimal_comma(sign * number * trade.price)}",{trade.currency},"0,00",{trade.id_order}'
+            for number in shares
+        ]
+        if trade.currency != "EUR":
+            local = sign * round(trade.number * trade.price, 2)
+            eur = round(local / trade.fx_rate, 2)
+            rate = f'"{decimal_comma(trade.fx_rate, 4)}"'
+            # the EUR leg of the exchange carries the rate
+            rows += [
+                f'{prefix},Ingreso Cambio de Divisa,{rate if sign > 0 else ""},'
+                f'{"EUR" if sign > 0 else trade.currency},"{decimal_comma(eur if sign > 0 else -local)}",'
+                f'{"EUR" if sign > 0 else trade.currency},"0,00",{trade.id_order}',
+                f'{prefix},Retirada Cambio de Divisa,{rate if sign < 0 else ""},'
+                f'{"EUR" if sign < 0 else trade.currency},"{decimal_comma(eur if sign < 0 else -local)}",'
+                f'{"EUR" if sign < 0 else trade.currency},"0,00",{trade.id_order}',
+            ]
+        rows.append(f'{prefix},{COSTS},,EUR,"{decimal_comma(-trade.commission)}",EUR,"0,00",{trade.id_order}')
+        return rows
+
+    @staticmethod
+    def isin_change_rows(change: IsinChange) -> List[str]:
+        day, hour = change.date.strftime("%d-%m-%Y"), change.date.strftime("%H:%M")
+        rows = []
+        for verb, isin in [("Venta", change.old_isin), ("Compra", change.new_isin)]:
+            product = f"STOCK {isin}"
+            rows.append(
+                f'{day},{hour},{day},{product},{isin},"CAMBIO DE ISIN: {verb} {change.number} {product}@'
+                f'{decimal_comma(change.price)} EUR ({isin})",,EUR,"0,00",EUR,"0,00",'
+            )
+        return rows
+
+    def to_csv(self) -> bytes:
+        """Account csv in the format of DEGIRO, from the most recent transaction"""
+        lines = [HEADER]
+        for event in sorted(self.events, key=lambda event: event.date, reverse=True):
+            lines += self.trade_rows(event) if isinstance(event, Trade) else self.isin_change_rows(event)
+        return ("\n".join(lines) + "\n").encode()
+
+
+def random_account(
+    seed: int, features: FrozenSet[str] = FEATURES, securities: int = 3, years: Tuple[int, ...] = (2022, 2023)
+) -> Account:
+    """Random account trading some securities over some years, with the given features
+
+    Every security is traded on different days, from January 2 of the first year to December 30 of the last one,
+    and a trade never turns a long position into a short one in a single order (or the other way around).
+
+    Parameters
+    ----------
+    seed : int
+        seed of the account (the same seed and arguments give the same account)
+    features : FrozenSet[str], optional
+        features of FEATURES the account may have, by default all of them
+    securities : int, optional
+        maximum number of securities traded, by default 3
+    years : Tuple[int, ...], optional
+        years of the trades, by default (2022, 2023)
+
+    Returns
+    -------
+    Account
+        trades and changes of ISIN of the account
+    """
+    rng = random.Random(seed)
+    start, end = datetime(years[0], 1, 2, 9), datetime(years[-1], 12, 30, 17)
+    events: List[Event] = []
+    for k in range(rng.randint(1, securities)):
+        isin = f"XS{seed % 10**6:06d}{k:02d}00"
+        currency = "USD" if "multi_currency" in features and rng.random() < 0.5 else "EUR"
+        price, position, changed = rng.uniform(10, 200), 0, False
+        date = start + timedelta(days=rng.randint(0, 60), minutes=rng.randint(0, 480))
+        while date < end:
+            if "isin_change" in features and not changed and position > 0 and rng.random() < 0.2:
+                new_isin = f"{isin[:-2]}01"
+                events.append(IsinChange(isin, new_isin, date, position, round(price, 2)))
+                isin, changed = new_isin, True
+            else:
+                if position != 0:
+                    action = rng.choice(["buy", "sell"])
+                else:
+                    action = "sell" if "short" in features and rng.random() < 0.3 else "buy"
+                closing = (action == "sell") == (position > 0) and position != 0
+                number = rng.randint(1, abs(position)) if closing else rng.randint(1, 50)
+                fills = rng.randint(2, 3) if "partial_fills" in features and number >= 3 and rng.random() < 0.4 else 1
+                events.append(
+                    Trade(
+                        isin=isin,
+                        date=date,
+                        action=action,
+                        number=number,
+                        price=round(price, 2),
+                        currency=currency,
+                        fx_rate=round(rng.uniform(1.02, 1.18), 4) if currency != "EUR" else 1.0,
+                        commission=round(rng.uniform(0.5, 5), 2),
+                        fills=fills,
+                        id_order=f"{seed}-{len(events)}",
+                    )
+                )
+                position += number if action == "buy" else -number
+            price *= rng.lognormvariate(0, 0.15)
+            # a repurchase soon after a sale is a wash sale when the sale was at a loss
+            soon = "wash_sale" in features and events and getattr(events[-1], "action", "") == "sell"
+            date += timedelta(days=rng.randint(1, 59) if soon else rng.randint(1, 150), minutes=rng.randint(0, 60))
+    return Account(tuple(events))
+
+
+@dataclass
+class Case:
+    """An account as given to the engines: its csv, the path of a copy of it (for the engines reading files) and its
+    fiscal years"""
+
+    csv: bytes
+    path: str
+    years: List[int]
+
+
+@dataclass(frozen=True)
+class Engine:
+    name: str
+    # gains of every fiscal year of the case (or of all of them under the first year, if not by_year)
+    run: Callable[[Case], Dict[int, float]]
+    # features of FEATURES the engine computes, accounts with any other feature are skipped
+    supports: FrozenSet[str] = FEATURES
+    by_year: bool = True
+
+
+def returns_by_year(returns: Returns, years: List[int]) -> Dict[int, float]:
+    return {year: result.global_return for year, result in returns.return_on_all_stocks_by_year(years).items()}
+
+
+def returns_engine(case: Case) -> Dict[int, float]:
+    return returns_by_year(Returns(DataPrep(Dataset(case.csv).data).stocks_orders), case.years)
+
+
+def matching_orders_engine(case: Case) -> Dict[int, float]:
+    return returns_by_year(Returns(DataPrep(Dataset(case.csv).data).matching_orders), case.years)
+
+
+def fixed_point_engine(case: Case) -> Dict[int, float]:
+    return returns_by_year(Returns(DataPrep(Dataset(case.csv, fixed_point=True).data).stocks_orders), case.years)
+
+
+def match_state_engine(case: Case) -> Dict[int, float]:
+    # the state of the transactions up to the last one of the security whose trades end first, as if the others
+    # arrived in a later batch: the state of that security is reused and the other ones are matched again
+    data = Dataset(case.csv).data
+    prefix = data.filter(pl.col("value_date") <= data.group_by("isin").agg(pl.max("value_date"))["value_date"].min())
+    path = Path(case.path).with_name("state.parquet")
+    Returns(DataPrep(prefix).matching_orders).match_state().write(path)
+    returns = Returns(DataPrep(data).matching_orders)
+    returns.match_state(MatchingState.read(path))
+    return returns_by_year(returns, case.years)
+
+
+def columnar_fifo_engine(case: Case) -> Dict[int, float]:
+    # a security only bought (or only sold) gets a close of no gain without a date, which is left out
+    closes = Trades.from_degiro(Dataset(case.csv).data).closes
+    gains = (
+        closes.filter(pl.col("close_value_date").is_not_null())
+        .group_by(pl.col("close_value_date").dt.year().alias("year"))
+        .agg(pl.col("computable_gain").sum())
+        .collect()
+    )
+    return dict(zip(gains["year"].to_list(), gains["computable_gain"].to_list()))
+
+
+def fiscal_report_engine(case: Case) -> Dict[int, float]:
+    gains = FiscalReport(Dataset(case.csv).data).compute().year_summary.filter(pl.col("year").is_not_null())
+    return dict(zip(gains["year"].to_list(), gains["gains"].to_list()))
+
+
+def stocks_engine(case: Case) -> Dict[int, float]:
+    stocks = Stocks(case.path)
+    products = stocks.data.filter(pl.col("action") == "sell")["product"].cast(pl.Utf8).unique().to_list()
+    return {case.years[0]: sum(stocks.return_on_stock(product) for product in products)}
+
+
+def portfolio_engine(case: Case) -> Dict[int, float]:
+    ds = Dataset(case.path)
+    gains: Dict[int, float] = defaultdict(float)
+    sales = ds.data.filter(pl.col("action") == "sell").select(pl.col("product", "id_order").cast(pl.Utf8), "value_date")
+    for product, id_order, value_date in sales.iter_rows():
+        result = Portfolio.return_of_sale(ds, product, id_order)
+        if not result.two_month_violation:
+            gains[value_date.year] += result.return_value
+    return dict(gains)
+
+
+# Stocks and Portfolio match the shares of a product in EUR, long positions only and without changes of ISIN; Stocks
+# sums the sales of all the dates
+ENGINES = [
+    Engine("returns", returns_engine),
+    Engine("returns_matching_orders", matching_orders_engine),
+    Engine("returns_fixed_point", fixed_point_engine),
+    Engine("returns_match_state", match_state_engine),
+    Engine("columnar_fifo", columnar_fifo_engine),
+    Engine("fiscal_report", fiscal_report_engine),
+    Engine("stocks", stocks_engine, supports=frozenset(["partial_fills", "wash_sale"]), by_year=False),
+    Engine("portfolio", portfolio_engine, supports=frozenset(["partial_fills", "wash_sale"])),
+]
+
+
+@dataclass
+class Mismatch:
+    engine: str
+    seed: int
+    # minimal account (shrunk) on which the engine disagrees with the reference, and the gains of both (the error
+    # raised instead of the gains if an engine failed)
+    account: Account
+    expected: Union[Dict[int, float], str]
+    result: Union[Dict[int, float], str]
+
+    @staticmethod
+    def gains(gains: Union[Dict[int, float], str]) -> str:
+        if isinstance(gains, str):
+            return gains
+        return ", ".join(f"{year}: {gain:.2f}" for year, gain in sorted(gains.items())) or "no gains"
+
+    def report(self) -> str:
+        return (
+            f"  {self.engine} (seed {self.seed}, {len(self.account.events)} transactions, "
+            f"features {sorted(self.account.features)}): expected {self.gains(self.expected)}, "
+            f"got {self.gains(self.result)}"
+        )
+
+
+@dataclass
+class EquivalenceReport:
+    accounts: int
+    # accounts computed and seconds spent by every engine, all of them on the same generated accounts
+    compared: Dict[str, int] = field(default_factory=dict)
+    timings: Dict[str, float] = field(default_factory=dict)
+    mismatches: List[Mismatch] = field(default_factory=list)
+
+    def report(self) -> str:
+        failed: Dict[str, int] = defaultdict(int)
+        for mismatch in self.mismatches:
+            failed[mismatch.engine] += 1
+        lines = [f"{self.accounts} accounts, {len(self.mismatches)} mismatches"]
+        lines += [
+            f"  {name:<24} {accounts:5d} accounts {failed[name]:5d} mismatches "
+            f"{self.timings[name]:8.2f} s {1000 * self.timings[name] / accounts:9.1f} ms/account"
+            for name, accounts in self.compared.items()
+            if accounts
+        ]
+        return "\n".join(lines + [mismatch.report() for mismatch in self.mismatches])
+
+
+def run_engine(engine: Engine, account: Account) -> Tuple[Union[Dict[int, float], str], float]:
+    """Gains of the account computed by the engine (or the error it raised) and the seconds it took"""
+    csv = account.to_csv()
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "account.csv"
+        path.write_bytes(csv)
+        start = time.perf_counter()
+        result: Union[Dict[int, float], str]
+        try:
+            result = engine.run(Case(csv, str(path), account.years))
+        except Exception as e:
+            result = f"{type(e).__name__}: {e}"
+        return result, time.perf_counter() - start
+
+
+def agree(
+    engine: Engine, expected: Dict[int, float], result: Union[Dict[int, float], str], atol: float, rtol: float
+) -> bool:
+    """Whether the gains of every year (of all of them, if the engine is not by_year) are within the tolerance"""
+    if isinstance(result, str):
+        return False
+    if not engine.by_year:
+        expected, result = {0: sum(expected.values())}, {0: sum(result.values())}
+    return all(
+        abs(result.get(year, 0.0) - expected.get(year, 0.0)) <= atol + rtol * abs(expected.get(year, 0.0))
+        for year in set(expected) | set(result)
+    )
+
+
+def fails(engine: Engine, reference: Engine, account: Account, atol: float, rtol: float) -> bool:
+    """Whether the engine disagrees with the reference on a valid account (or the reference fails on it)"""
+    if not account.events or not account.valid or not account.features <= engine.supports:
+        return False
+    expected, _ = run_engine(reference, account)
+    if engine is reference or isinstance(expected, str):
+        return engine is reference and isinstance(expected, str)
+    result, _ = run_engine(engine, account)
+    return not agree(engine, expected, result, atol, rtol)
+
+
+def drop_events(account: Account, failing: Callable[[Account], bool]) -> Account:
+    """Drop the transactions of the account while it still fails, in chunks halving in size down to one"""
+    chunk = max(1, len(account.events) // 2)
+    while True:
+        start = 0
+        while start < len(account.events):
+            candidate = account.without(list(account.events[start : start + chunk]))
+            if failing(candidate):
+                account = candidate
+            else:
+                start += chunk
+        if chunk == 1:
+            return account
+        chunk = max(1, chunk // 2)
+
+
+def simplify_trade(account: Account, failing: Callable[[Account], bool]) -> Account:
+    """First simplification of a trade of the account (a single fill, fewer shares) still failing, or the account"""
+    for event in account.events:
+        if not isinstance(event, Trade):
+            continue
+        for simpler in [replace(event, fills=1), replace(event, number=1), replace(event, number=event.number // 2)]:
+            if simpler == event or simpler.number < simpler.fills:
+                continue
+            if failing(candidate := account.substitute(event, simpler)):
+                return candidate
+    return account
+
+
+def shrink(account: Account, failing: Callable[[Account], bool]) -> Account:
+    """Smallest account found still failing: the securities (with the ones they changed ISIN to) are dropped first,
+    then the transactions, and the trades left are simplified, until no transaction can be dropped nor simplified
+
+    Parameters
+    ----------
+    account : Account
+        failing account
+    failing : Callable[[Account], bool]
+        whether an account still fails
+
+    Returns
+    -------
+    Account
+        account failing from which no security nor transaction can be dropped
+    """
+    securities = defaultdict(list)
+    for event in account.events:
+        securities[(event.isin if isinstance(event, Trade) else event.old_isin)[:-2]].append(event)
+    for events in securities.values():
+        if len(securities) > 1 and failing(candidate := account.without(events)):
+            account = candidate
+    while True:
+        account = drop_events(account, failing)
+        simpler = simplify_trade(account, failing)
+        if simpler is account:
+            return account
+        account = simpler
+
+
+def check(
+    accounts: int = 20,
+    seed: int = 0,
+    features: FrozenSet[str] = FEATURES,
+    engines: Optional[List[Engine]] = None,
+    atol: float = 0.05,
+    rtol: float = 1e-6,
+    output: Optional[Path] = None,
+) -> EquivalenceReport:
+    """Compare the engines with the reference (the first one) on random accounts
+
+    Parameters
+    ----------
+    accounts : int, optional
+        number of random accounts, of seeds seed, seed + 1, ..., by default 20
+    seed : int, optional
+        seed of the first account, by default 0
+    features : FrozenSet[str], optional
+        features of FEATURES the accounts may have, by default all of them
+    engines : Optional[List[Engine]], optional
+        reference engine followed by the engines compared with it, by default ENGINES
+    atol : float, optional
+        absolute tolerance in EUR of the gains of a year (the engines in fixed point round every leg to cents), by
+        default 0.05
+    rtol : float, optional
+        relative tolerance of the gains of a year (money columns in Float32), by default 1e-6
+    output : Optional[Path], optional
+        directory where the minimal account of every mismatch is written as <engine>-<seed>.csv, by default None
+
+    Returns
+    -------
+    EquivalenceReport
+        accounts compared, timings and (shrunk) mismatches of every engine
+    """
+    engines = ENGINES if engines is None else engines
+    reference = engines[0]
+    names = [engine.name for engine in engines]
+    report = EquivalenceReport(accounts, dict.fromkeys(names, 0), dict.fromkeys(names, 0.0))
+    for account_seed in range(seed, seed + accounts):
+        account = random_account(account_seed, features)
+        expected, elapsed = run_engine(reference, account)
+        report.compared[reference.name] += 1
+        report.timings[reference.name] += elapsed
+        # an account failing on the reference is reported as a mismatch of it, and not compared
+        failing = [reference] if isinstance(expected, str) else []
+        for engine in engines[1:]:
+            if isinstance(expected, str) or not account.features <= engine.supports:
+                continue
+            result, elapsed = run_engine(engine, account)
+            report.compared[engine.name] += 1
+            report.timings[engine.name] += elapsed
+            if not agree(engine, expected, result, atol, rtol):
+                failing.append(engine)
+        for engine in failing:
+            minimal = shrink(account, lambda candidate: fails(engine, reference, candidate, atol, rtol))
+            expected, _ = run_engine(reference, minimal)
+            result, _ = run_engine(engine, minimal) if engine is not reference else (expected, 0.0)
+            report.mismatches.append(Mismatch(engine.name, account_seed, minimal, expected, result))
+            if output is not None:
+                output.mkdir(parents=True, exist_ok=True)
+                (output / f"{engine.name}-{account_seed}.csv").write_bytes(minimal.to_csv())
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    names = [engine.name for engine in ENGINES]
+    parser = argparse.ArgumentParser(description="Differential testing of the engines on random DEGIRO accounts")
+    parser.add_argument("--accounts", type=int, default=20, help="number of random accounts")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first account")
+    parser.add_argument("--features", nargs="*", choices=sorted(FEATURES), help="features, by default all of them")
+    parser.add_argument("--reference", choices=names, default=names[0], help="engine the others are compared with")
+    parser.add_argument("--engines", nargs="*", choices=names, help="engines compared, by default all of them")
+    parser.add_argument("--atol", type=float, default=0.05, help="absolute tolerance in EUR of the gains of a year")
+    parser.add_argument("--rtol", type=float, default=1e-6, help="relative tolerance of the gains of a year")
+    parser.add_argument("--output", type=Path, help="directory of the csv of the minimal failing accounts")
+    args = parser.parse_args(argv)
+
+    pl.enable_string_cache()
+    features = FEATURES if args.features is None else frozenset(args.features)
+    reference = next(engine for engine in ENGINES if engine.name == args.reference)
+    selected = names if args.engines is None else args.engines
+    engines = [reference] + [engine for engine in ENGINES if engine is not reference and engine.name in selected]
+    report = check(args.accounts, args.seed, features, engines, args.atol, args.rtol, args.output)
+    print(report.report())
+    return 1 if report.mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
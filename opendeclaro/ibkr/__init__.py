@@ -0,0 +1,34 @@
+"""ibkr __init__ file
+
+The public classes are imported on first access (PEP 562), as in opendeclaro.degiro.
+"""
+from importlib import import_module
+from typing import TYPE_CHECKING, Any, List
+
+from opendeclaro.ibkr import config
+
+_exports = {
+    "DataPrep": "dataprep",
+    "Dataset": "prepare",
+    "Statement": "statement",
+}
+
+__all__ = ["config", *_exports]
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(f"{__name__}.{_exports[name]}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return __all__
+
+
+if TYPE_CHECKING:
+    from opendeclaro.ibkr.dataprep import DataPrep
+    from opendeclaro.ibkr.prepare import Dataset
+    from opendeclaro.ibkr.statement import Statement
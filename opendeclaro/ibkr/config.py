@@ -1,6 +1,8 @@
-"""config.py of degiro methods"""
+"""config.py of ibkr methods"""
+# sections of the activity statement, by the start of their name (the first matching entry wins)
 table_dict = {
     "statement": "Statement",
+    "instruments": "Información de instrumento",
     "info": "Informaci",
     "value": "Valor",
     "change_nav": "Cambio",
@@ -8,8 +10,36 @@ table_dict = {
     "open_pos": "Posiciones",
     "forex": "Saldos",
     "forex_pnl": "Detalles",
+    "fx_rates": "Tipo de cambio",
+    "trades": "Operaciones",
     "dividends": "Dividendos",
     "tax": "Retenci",
     "dividends_mod": "Modificaci",
     "code": "Código",
 }
+# columns of the sections used to compute returns, by position
+cols_dict = {
+    "trades": [
+        "discriminator",
+        "category",
+        "currency",
+        "symbol",
+        "date",
+        "quantity",
+        "price",
+        "close_price",
+        "proceeds",
+        "commision",
+        "basis",
+        "realized_pnl",
+        "mtm_pnl",
+        "code",
+    ],
+    "instruments": ["category", "symbol", "description", "conid", "isin"],
+    "dividends": ["currency", "date", "description", "amount"],
+    "tax": ["currency", "date", "description", "amount"],
+    "fx_rates": ["currency", "rate"],
+}
+# asset categories of the trades section
+stock_categories = ["Acciones", "Stocks"]
+forex_categories = ["Fórex", "Forex"]
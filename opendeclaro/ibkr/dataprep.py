@@ -0,0 +1,202 @@
+"""dataprep.py normalization of IBKR statements to the stock orders of degiro.DataPrep"""
+from typing import Dict
+
+import polars as pl
+from polars import DataFrame
+
+import opendeclaro.ibkr.config as config
+from opendeclaro.degiro.fx import FXRates
+
+ISIN_PATTERN = r"\(([A-Z]{2}[A-Z0-9]{9}[0-9])\)"
+
+
+# fmt: off
+class DataPrep:
+    def __init__(self, data: Dict[str, DataFrame]):
+        """Initialization of class
+
+        Parameters
+        ----------
+        data : Dict[str, DataFrame]
+            tables of the statement (Dataset(path).data), with the columns of config.cols_dict
+        """
+        self.data = data
+
+    @staticmethod
+    def number(col: str) -> pl.Expr:
+        """Number written by IBKR, possibly with thousands separator"""
+        return pl.col(col).cast(pl.Utf8).str.replace_all(",", "").cast(pl.Float64, strict=False)
+
+    @staticmethod
+    def datetime(col: str) -> pl.Expr:
+        """Date ("2023-02-10") or date and time ("2023-02-10, 15:30:00") written by IBKR, or already parsed"""
+        value = pl.col(col).cast(pl.Utf8)
+        return pl.coalesce(
+            value.str.to_datetime("%Y-%m-%d, %H:%M:%S", strict=False),
+            value.str.to_datetime("%Y-%m-%d %H:%M:%S%.f", strict=False),
+            value.str.to_datetime("%Y-%m-%d", strict=False),
+        )
+
+    def table(self, table_name: str) -> DataFrame:
+        """Table of the statement, empty (with its columns) when missing"""
+        if table_name in self.data:
+            return self.data[table_name]
+        return pl.DataFrame(schema={col: pl.Utf8 for col in config.cols_dict[table_name]})
+
+    @property
+    def isin_map(self) -> DataFrame:
+        """Symbol, ISIN and description of the stocks"""
+        return (
+            self.table("instruments")
+            .filter(pl.col("category").is_in(config.stock_categories))
+            .select("symbol", "isin", pl.col("description").alias("product"))
+            .unique("symbol")
+        )
+
+    @property
+    def fx_table(self) -> DataFrame:
+        """Exchange rates of the forex trades of the account, as units of currency per EUR
+
+        Returns
+        -------
+        DataFrame
+            contains currency, fx_date and fx_rate sorted by fx_date
+        """
+        pair = pl.col("symbol").str.split_exact(".", 1)
+        return (
+            self.table("trades")
+            .filter(
+                (pl.col("discriminator") == "Order") &
+                (pl.col("category").is_in(config.forex_categories))
+            )
+            .select(
+                pair.struct.field("field_0").alias("base"),
+                pair.struct.field("field_1").alias("quote"),
+                self.datetime("date").alias("fx_date"),
+                self.number("price").alias("price"),
+            )
+            .filter((pl.col("base") == "EUR") | (pl.col("quote") == "EUR"))
+            .select(
+                pl.when(pl.col("base") == "EUR").then(pl.col("quote")).otherwise(pl.col("base")).alias("currency"),
+                "fx_date",
+                pl.when(pl.col("base") == "EUR").then(pl.col("price")).otherwise(1 / pl.col("price")).alias("fx_rate"),
+            )
+            .sort("fx_date")
+        )
+
+    def fill_curr_rate(self, df: DataFrame) -> DataFrame:
+        """Add the curr_rate (units of varcur per EUR) of the last forex trade of the account up to the date of every
+        row (FXRates.rate_as_of), or the base currency exchange rate of the statement for the currencies never
+        exchanged"""
+        base_rates = (
+            self.table("fx_rates")
+            .select(pl.col("currency").alias("varcur"), (1 / self.number("rate")).alias("base_rate"))
+        )
+        return (
+            FXRates.rate_as_of(df, self.fx_table)
+            .join(base_rates, on="varcur", how="left")
+            .with_columns(
+                pl.when(pl.col("varcur") == "EUR")
+                .then(pl.lit(1.0))
+                .otherwise(pl.coalesce("fx_rate", "base_rate"))
+                .cast(pl.Float32)
+                .alias("curr_rate")
+            )
+            .drop("fx_rate", "base_rate")
+        )
+
+    @property
+    def stocks_orders(self) -> DataFrame:
+        """Stock trades of the statement with the columns and types of degiro.DataPrep(...).stocks_orders
+
+        var is the signed value of the trade in its currency, commision the costs in EUR and curr_rate the units of
+        currency per EUR, so that degiro.Returns computes the gains of the account.
+
+        Returns
+        -------
+        DataFrame
+            stock orders sorted by date in descending order
+        """
+        df = (
+            self.table("trades")
+            .filter(
+                (pl.col("discriminator") == "Order") &
+                (pl.col("category").is_in(config.stock_categories))
+            )
+            .with_row_index("id_order")
+            .join(self.isin_map, on="symbol", how="left")
+            .select(
+                self.datetime("date").alias("date"),
+                pl.coalesce("isin", "symbol").alias("isin"),
+                pl.coalesce("product", "symbol").alias("product"),
+                "symbol",
+                pl.col("currency").alias("varcur"),
+                self.number("quantity").alias("quantity"),
+                self.number("price").alias("price"),
+                self.number("proceeds").cast(pl.Float32).alias("var"),
+                self.number("commision").alias("commision"),
+                pl.format("ibkr-{}", "id_order").alias("id_order"),
+            )
+        )
+        action = pl.when(pl.col("quantity") > 0).then(pl.lit("buy")).otherwise(pl.lit("sell"))
+        verb = pl.when(pl.col("quantity") > 0).then(pl.lit("Compra")).otherwise(pl.lit("Venta"))
+        return (
+            self.fill_curr_rate(df)
+            .select(
+                pl.col("date").dt.truncate("1d").alias("reg_date"),
+                pl.datetime(1, 1, 1, pl.col("date").dt.hour(), pl.col("date").dt.minute()).alias("reg_hour"),
+                pl.col("date").dt.truncate("1d").alias("value_date"),
+                "product",
+                "isin",
+                pl.format("{} {} {}@{} {} ({})", verb, pl.col("quantity").abs(), "symbol", "price", "varcur", "isin")
+                .alias("desc"),
+                "varcur",
+                "var",
+                pl.col("varcur").alias("cashcur"),
+                pl.lit(None, dtype=pl.Float32).alias("cash"),
+                "id_order",
+                "date",
+                action.alias("action"),
+                pl.col("quantity").abs().alias("number"),
+                "price",
+                pl.col("varcur").alias("pricecur"),
+                pl.lit(False).alias("unintended"),
+                pl.lit("stock").alias("category"),
+                (pl.col("commision").fill_null(0.0) / pl.col("curr_rate")).cast(pl.Float32).alias("commision"),
+                "curr_rate",
+                pl.lit(None, dtype=pl.Utf8).alias("isin_change"),
+            )
+            .sort("date", descending=True)
+        )
+
+    @property
+    def dividends(self) -> DataFrame:
+        """Gross dividends and withholding tax with the columns of the dividend rows of degiro.Dataset(path).data
+
+        Returns
+        -------
+        DataFrame
+            contains value_date, date, isin, desc ("Dividendo" or "Retención del dividendo"), varcur, var and
+            curr_rate
+        """
+        df = pl.concat(
+            [
+                self.table("dividends").with_columns(pl.lit("Dividendo").alias("desc")),
+                self.table("tax").with_columns(pl.lit("Retención del dividendo").alias("desc")),
+            ],
+            how="diagonal_relaxed",
+        )
+        df = (
+            df.filter(~pl.col("currency").str.starts_with("Total"))
+            .select(
+                self.datetime("date").alias("value_date"),
+                self.datetime("date").alias("date"),
+                pl.col("description").str.extract(ISIN_PATTERN).alias("isin"),
+                "desc",
+                pl.col("currency").alias("varcur"),
+                self.number("amount").cast(pl.Float32).alias("var"),
+            )
+        )
+        return self.fill_curr_rate(df).sort("date", descending=True)
+
+# fmt: on
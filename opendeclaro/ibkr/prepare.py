@@ -1,10 +1,12 @@
 """prepare.py classes and functions for ibkr"""
-import csv
+from typing import List
 
-import ibkr.config as config
 import polars as pl
 from polars import DataFrame
 
+import opendeclaro.ibkr.config as config
+from opendeclaro.ibkr.statement import Statement
+
 
 class Dataset:
     def __init__(self, path: str):
@@ -15,12 +17,27 @@ class Dataset:
         path : str
             path location of dataset csv
         """
-        self.data = pl.read_csv(path)
-        self.data_cols = dict(zip(config.cols_list, self.data.columns))
+        self.statement = Statement(path)
+        tables = [table_name for table_name in config.cols_dict if table_name in self.statement.offsets]
+        self.data = {
+            table_name: pl.concat(
+                [self.rename_cols(df, config.cols_dict[table_name]) for df in blocks], how="diagonal_relaxed"
+            )
+            for table_name, blocks in self.statement.blocks(*tables).items()
+        }
+
+    @staticmethod
+    def rename_cols(df: DataFrame, cols_list: List[str]) -> DataFrame:
+        """Keep the columns of cols_list (by position) with those names
+
+        The blocks of a section may name their columns differently (e.g. the commission of forex trades), so they are
+        aligned by position.
+        """
+        return df.select([pl.col(col).alias(name) for col, name in zip(df.columns, cols_list)])
 
     @staticmethod
     def extract_table(file: str, table_name: str, table_dict: dict = config.table_dict) -> DataFrame:
-        """Extract table from IBKR summary .csv
+        """Extract table from IBKR summary .csv (see Statement to extract several tables in one read)
 
         Parameters
         ----------
@@ -34,35 +51,11 @@ class Dataset:
         Returns
         -------
         DataFrame
-            polars DataFrame with table values
+            polars DataFrame with the typed values of the data rows of the table
 
         Raises
         ------
         ValueError
             "table_name should be contained in table_dict key values"
         """
-        for idx, key in enumerate(table_dict):
-            if table_name == key:
-                table_id = idx
-        if table_id == None:
-            raise ValueError("table_name should be contained in table_dict key values")
-
-        tables = []
-        current_table = None
-
-        with open(file, "r") as f:
-            csv_reader = csv.reader(f)
-            for row in csv_reader:
-                if len(row) > 1 and row[1] == "Header":
-                    current_table = [row]
-                    if current_table:
-                        tables.append(current_table)
-                elif current_table:
-                    current_table.append(row)
-
-        if current_table:
-            tables.append(current_table)
-
-        df = pl.DataFrame(tables[table_id][1:], schema=tables[table_id][0])
-
-        return df
+        return Statement(file, table_dict).table(table_name)
@@ -0,0 +1,147 @@
+"""statement.py single pass parser of the sections of IBKR activity statements"""
+import csv
+import os
+from collections import defaultdict
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple, Union
+
+import polars as pl
+from polars import DataFrame
+
+import opendeclaro.ibkr.config as config
+
+
+class Statement:
+    def __init__(self, path: Union[str, os.PathLike], table_dict: dict = config.table_dict):
+        """Initialise class
+
+        The activity statement is a csv of sections one after the other, every row starting with the name of its
+        section and its kind ("Header", "Data", "Total"...). The file is scanned once to record the byte ranges of the
+        blocks (a header row and the rows up to the next header) of every section in table_dict; sections are read
+        and typed only when asked for.
+
+        Parameters
+        ----------
+        path : Union[str, os.PathLike]
+            path location of the activity statement csv
+        table_dict : dict, optional
+            dictionary of the sections to index, with the start of the section name as value, by default
+            config.table_dict
+        """
+        self.path = path
+        self.table_dict = table_dict
+        self.offsets = self.scan_offsets()
+        self.frames: Dict[str, DataFrame] = {}
+
+    @staticmethod
+    def section_name(line: bytes) -> str:
+        """Name of the section of a row (its first field)"""
+        if line.startswith(b'"'):
+            return next(csv.reader([line.decode("utf-8-sig")]))[0]
+        return line.split(b",", 1)[0].decode("utf-8-sig")
+
+    @staticmethod
+    def row_kind(line: bytes) -> bytes:
+        """Kind of a row (its second field: Header, Data, Total, SubTotal, Notes...)"""
+        fields = line.split(b",", 2)
+        return fields[1].strip(b'"') if len(fields) > 1 else b""
+
+    def table_of(self, name: str) -> Optional[str]:
+        """Key of table_dict of a section name, None if the section is not indexed"""
+        for key, prefix in self.table_dict.items():
+            if name.startswith(prefix):
+                return key
+        return None
+
+    def scan_offsets(self) -> Dict[str, List[Tuple[int, int]]]:
+        """Scan the file once, recording the byte range of every block of the indexed sections
+
+        Returns
+        -------
+        Dict[str, List[Tuple[int, int]]]
+            (start, end) byte offsets of the blocks of every table found, by table_dict key
+        """
+        offsets = defaultdict(list)
+        block_table, block_start = None, 0
+        position = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if self.row_kind(line) == b"Header":
+                    if block_table is not None:
+                        offsets[block_table].append((block_start, position))
+                    block_table, block_start = self.table_of(self.section_name(line)), position
+                position += len(line)
+        if block_table is not None:
+            offsets[block_table].append((block_start, position))
+        return dict(offsets)
+
+    @staticmethod
+    def parse_block(block: bytes) -> DataFrame:
+        """Typed frame of the data rows of a block, without the section name and kind columns"""
+        header, *rows = block.splitlines()
+        data = [row for row in rows if Statement.row_kind(row) == b"Data"]
+        df = pl.read_csv(BytesIO(b"\n".join([header, *data])), infer_schema_length=None, try_parse_dates=True)
+        return df.drop(df.columns[:2])
+
+    def blocks(self, *table_names: str) -> Dict[str, List[DataFrame]]:
+        """Frames of the blocks of the requested tables, reading their byte ranges in a single open of the file
+
+        Parameters
+        ----------
+        table_names : str
+            keys of table_dict
+
+        Returns
+        -------
+        Dict[str, List[DataFrame]]
+            frame of every block (header and its data rows) of every requested table, in file order
+
+        Raises
+        ------
+        ValueError
+            "table_name should be contained in table_dict key values"
+        KeyError
+            if a requested table is not in the statement
+        """
+        for table_name in table_names:
+            if table_name not in self.table_dict:
+                raise ValueError("table_name should be contained in table_dict key values")
+            if table_name not in self.offsets:
+                raise KeyError(f"table {table_name} not found in {self.path}")
+        ranges = sorted(
+            (start, end, table_name) for table_name in set(table_names) for start, end in self.offsets[table_name]
+        )
+        blocks = defaultdict(list)
+        with open(self.path, "rb") as f:
+            for start, end, table_name in ranges:
+                f.seek(start)
+                blocks[table_name].append(self.parse_block(f.read(end - start)))
+        return {table_name: blocks[table_name] for table_name in table_names}
+
+    def tables(self, *table_names: str) -> Dict[str, DataFrame]:
+        """Frames of the requested tables, reading the ones not read yet in a single open of the file
+
+        Parameters
+        ----------
+        table_names : str
+            keys of table_dict
+
+        Returns
+        -------
+        Dict[str, DataFrame]
+            frame of every requested table (the blocks of a table with different headers are concatenated by name)
+
+        Raises
+        ------
+        ValueError
+            "table_name should be contained in table_dict key values"
+        KeyError
+            if a requested table is not in the statement
+        """
+        missing = [table_name for table_name in table_names if table_name not in self.frames]
+        for table_name, frames in self.blocks(*missing).items():
+            self.frames[table_name] = pl.concat(frames, how="diagonal_relaxed")
+        return {table_name: self.frames[table_name] for table_name in table_names}
+
+    def table(self, table_name: str) -> DataFrame:
+        return self.tables(table_name)[table_name]
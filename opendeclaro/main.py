@@ -1,8 +1,284 @@
-from typing import Optional
+"""main.py batch processing of client accounts
+
+Computes the realised gains of every account of a directory (every .csv in it) or of a manifest (a text file with
+the path of an account per line, relative to the manifest) in a pool of worker processes, each account with a time
+limit. The gains of every account are written to <output>/accounts/<account>.<format> and all of them to
+<output>/gains.<format>, and a throughput summary is printed.
+
+    opendeclaro accounts/ --output results --years 2023 --workers 8 --timeout 120
+    python -m opendeclaro.main manifest.txt --format csv
+"""
+import argparse
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from opendeclaro import degiro, ibkr
+
+# polars, and the modules importing it, are imported where used: the command line answers --help and argument errors
+# without them, and the parent process of a batch only imports polars to merge the results
+if TYPE_CHECKING:
+    from polars import DataFrame
+
+    from opendeclaro.trades import Trades
+
+FORMATS = ["parquet", "csv"]
+
+
+@dataclass
+class BatchSummary:
+    accounts: int
+    rows: int
+    elapsed: float
+    failures: Dict[str, str] = field(default_factory=dict)
+    # peak RSS in bytes of the worker while computing every account, where it can be reset between accounts (Linux)
+    peak_rss: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def accounts_per_second(self) -> float:
+        return (self.accounts - len(self.failures)) / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def report(self) -> str:
+        lines = [
+            f"{self.accounts - len(self.failures)}/{self.accounts} accounts in {self.elapsed:.2f} s: "
+            f"{self.accounts_per_second:.2f} accounts/s, {self.rows_per_second:.0f} rows/s, "
+            f"{len(self.failures)} failures"
+        ]
+        if self.peak_rss:
+            account = max(self.peak_rss, key=lambda name: self.peak_rss[name])
+            lines.append(f"peak RSS {self.peak_rss[account] / 2**20:.1f} MiB (account {account})")
+        lines += [f"  {account}: {error}" for account, error in self.failures.items()]
+        return "\n".join(lines)
+
+
+def account_files(source: Path) -> List[Path]:
+    """Account files of a directory (its .csv files) or of a manifest (a path per line, blank lines and lines
+    starting with # are skipped)"""
+    if source.is_dir():
+        return sorted(source.glob("*.csv"))
+    with open(source) as f:
+        lines = [line.strip() for line in f]
+    return [source.parent / line for line in lines if line and not line.startswith("#")]
+
+
+def account_names(paths: List[Path]) -> List[str]:
+    """Name of the output file of every account (its file name, numbered when repeated)"""
+    names: List[str] = []
+    seen: Dict[str, int] = {}
+    for path in paths:
+        seen[path.stem] = seen.get(path.stem, 0) + 1
+        names.append(path.stem if seen[path.stem] == 1 else f"{path.stem}-{seen[path.stem]}")
+    return names
+
+
+def read_trades(path: str) -> Tuple["Trades", int]:
+    """Trades of an account and rows read, from an IBKR activity statement or from a DEGIRO account"""
+    from opendeclaro.trades import Trades
+
+    with open(path, "rb") as f:
+        first_line = f.readline().lstrip(b"\xef\xbb\xbf")
+    if first_line.startswith(b"Statement,"):
+        tables = ibkr.Dataset(path).data
+        return Trades.from_ibkr(tables), sum(table.height for table in tables.values())
+    data = degiro.Dataset(path, categorical=True).data
+    return Trades.from_degiro(data), data.height
+
+
+def account_gains(trades: "Trades", account: str, years: Optional[List[int]] = None) -> "DataFrame":
+    """Realised gains and disallowed losses (two month rule) of every security and year of the closing transactions
+
+    Returns
+    -------
+    DataFrame
+        contains account, security, year, gains and disallowed_losses columns
+    """
+    import polars as pl
+
+    # fmt: off
+    gains = (
+        trades.closes
+        .group_by("security", pl.col("close_value_date").dt.year().cast(pl.Int32).alias("year"))
+        .agg(
+            pl.col("computable_gain").sum().alias("gains"),
+            pl.col("gain").filter(pl.col("two_month_violation")).sum().alias("disallowed_losses"),
+        )
+    )
+    # fmt: on
+    if years:
+        gains = gains.filter(pl.col("year").is_in(years))
+    return gains.select(pl.lit(account).alias("account"), pl.all()).sort("year", "security").collect()
+
+
+def write_frame(df: "DataFrame", path: Path) -> None:
+    if path.suffix == ".csv":
+        df.write_csv(path)
+    else:
+        df.write_parquet(path)
+
+
+def process_account(
+    path: str, account: str, output: str, format: str, years: Optional[List[int]]
+) -> Tuple[int, Optional[int]]:
+    """Compute and write the gains of an account, returning the number of rows read and the peak RSS of the worker
+    while computing it (None where the peak RSS of a worker that computed other accounts before cannot be reset)"""
+    from opendeclaro.degiro.memory import peak_rss, reset_peak_rss
+
+    reset = reset_peak_rss()
+    trades, rows = read_trades(path)
+    write_frame(account_gains(trades, account, years), Path(output) / "accounts" / f"{account}.{format}")
+    return rows, peak_rss() if reset else None
+
+
+def worker(connection: Connection) -> None:
+    import polars as pl
+
+    pl.enable_string_cache()
+    # the start of every account is reported so that the parent enforces its time limit from then on, not from the
+    # start of the process
+    while (task := connection.recv()) is not None:
+        index, args = task
+        connection.send(("start", index, None))
+        try:
+            connection.send(("done", index, process_account(*args)))
+        except Exception as e:
+            connection.send(("failed", index, f"{type(e).__name__}: {e}"))
+
+
+def run_batch(
+    paths: List[Path],
+    output: Path,
+    format: str = "parquet",
+    years: Optional[List[int]] = None,
+    workers: int = 1,
+    timeout: float = 300,
+) -> BatchSummary:
+    """Process the accounts in a pool of worker processes and write their gains, one file per account and one with
+    all of them
+
+    Every worker is given an account at a time through a pipe of its own, so that the account of a worker is known
+    even when it dies before reporting anything, and a worker killed while writing to its pipe cannot block the
+    others. A worker running an account for longer than timeout seconds (or dying on it) is terminated and replaced,
+    and the account is reported as failed.
+    """
+    names = account_names(paths)
+    (output / "accounts").mkdir(parents=True, exist_ok=True)
+    context = multiprocessing.get_context("spawn")
+
+    queued = deque(range(len(paths)))
+    pending = set(range(len(paths)))
+    processes: Dict[int, BaseProcess] = {}
+    connections: Dict[int, Connection] = {}
+    # account given to every busy worker, with its deadline once the worker reported its start
+    assigned: Dict[int, Tuple[int, Optional[float]]] = {}
+
+    def start_worker() -> None:
+        connection, worker_connection = context.Pipe()
+        process = context.Process(target=worker, args=(worker_connection,), daemon=True)
+        process.start()
+        worker_connection.close()
+        pid = process.pid
+        assert pid is not None  # set by start
+        processes[pid] = process
+        connections[pid] = connection
+
+    def stop_worker(pid: int, reason: str) -> None:
+        index, _ = assigned.pop(pid, (None, None))
+        if index is not None:
+            summary.failures[names[index]] = reason
+            pending.discard(index)
+        processes.pop(pid).terminate()
+        connections.pop(pid).close()
+        if len(processes) < min(workers, len(queued)):
+            start_worker()
+
+    start = time.perf_counter()
+    summary = BatchSummary(accounts=len(paths), rows=0, elapsed=0.0)
+    for _ in range(min(workers, len(paths))):
+        start_worker()
+    while pending:
+        for pid in [pid for pid in processes if pid not in assigned]:
+            if not queued:
+                break
+            index = queued.popleft()
+            assigned[pid] = (index, None)
+            try:
+                connections[pid].send((index, (str(paths[index]), names[index], str(output), format, years)))
+            except OSError:
+                stop_worker(pid, "worker died")
+        deadlines = [deadline for _, deadline in assigned.values() if deadline is not None]
+        wait = min(deadlines, default=time.monotonic() + 1) - time.monotonic()
+        ready = multiprocessing.connection.wait(list(connections.values()), timeout=min(max(wait, 0), 1))
+        for pid, connection in list(connections.items()):
+            if connection not in ready:
+                continue
+            try:
+                kind, index, value = connection.recv()
+            except (EOFError, OSError):
+                stop_worker(pid, "worker died")
+                continue
+            if kind == "start":
+                assigned[pid] = (index, time.monotonic() + timeout)
+                continue
+            del assigned[pid]
+            pending.discard(index)
+            if kind == "done":
+                summary.rows += value[0]
+                if value[1] is not None:
+                    summary.peak_rss[names[index]] = value[1]
+            else:
+                summary.failures[names[index]] = value
+        now = time.monotonic()
+        for pid in list(processes):
+            _, deadline = assigned.get(pid, (None, None))
+            if deadline is not None and deadline <= now:
+                stop_worker(pid, f"timed out after {timeout} s")
+            elif not processes[pid].is_alive():
+                stop_worker(pid, "worker died")
+    for pid, connection in connections.items():
+        try:
+            connection.send(None)
+        except OSError:
+            pass
+        processes[pid].join()
+
+    import polars as pl
+
+    done = [output / "accounts" / f"{name}.{format}" for name in names if name not in summary.failures]
+    frames = [pl.read_csv(path) if format == "csv" else pl.read_parquet(path) for path in done]
+    if frames:
+        write_frame(pl.concat(frames, how="diagonal_relaxed"), output / f"gains.{format}")
+    summary.elapsed = time.perf_counter() - start
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Realised gains of many client accounts (DEGIRO or IBKR)")
+    parser.add_argument("source", type=Path, help="directory of account csv files or manifest with a path per line")
+    parser.add_argument("--output", type=Path, default=Path("results"), help="directory of the results")
+    parser.add_argument("--format", choices=FORMATS, default="parquet", help="format of the results")
+    parser.add_argument("--years", type=int, nargs="*", help="fiscal years to keep, by default all of them")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--timeout", type=float, default=300, help="time limit of every account in seconds")
+    args = parser.parse_args(argv)
+
+    # polars threads of every worker, so that all of them running at once use each core once
+    os.environ.setdefault("POLARS_MAX_THREADS", str(max(1, (os.cpu_count() or 1) // args.workers)))
+    summary = run_batch(account_files(args.source), args.output, args.format, args.years, args.workers, args.timeout)
+    print(summary.report())
+    return 1 if summary.failures else 0
 
-from opendeclaro.degiro.dataprep import DataPrep
-from opendeclaro.degiro.dataset import Dataset
 
 if __name__ == "__main__":
-    data = Dataset("datasets/Account.csv").data
-    DataPrep(data).prepare_stock_id_orders().write_csv("datasets/Account_postprocessed.csv")
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""positions.py point-in-time open lots, positions and cost basis of stock trades"""
+from datetime import date
+from typing import List
+
+import polars as pl
+from polars import DataFrame, LazyFrame
+
+from opendeclaro.degiro.matching import ColumnarFIFO
+from opendeclaro.trades import Trades
+
+
+# fmt: off
+class PositionIndex:
+    def __init__(self, trades: Trades):
+        """Initialization of class
+
+        The trades of every security are indexed once as intervals of the running bought (or sold) quantity, as in
+        ColumnarFIFO. As of a date the shares bought so far cover [0, bought) and under FIFO the first `sold` of them
+        are gone, so the lots open are the purchases whose interval ends after `sold` (or, for a short position, the
+        sales whose interval ends after `bought`). Those are consecutive in the index: every query finds with as-of
+        joins the first and last lot open of each security as of each date, for all the dates at once.
+
+        Parameters
+        ----------
+        trades : Trades
+            trades of the account (Trades.from_degiro, Trades.from_ibkr or Trades.read)
+        """
+        self.legs = (
+            ColumnarFIFO(trades.data, by="security").legs
+            .select("security", "date", "value_date", "action", "number", "amount", "pos_start", "pos_end")
+            # position of the trade among the ones of its security and action, in order of date
+            .with_columns(pl.int_range(0, pl.len()).over("security", "action").alias("index"))
+            .collect()
+        )
+
+    @classmethod
+    def from_degiro(cls, data: DataFrame) -> "PositionIndex":
+        """Index of the stock trades of a DEGIRO account, with the shares of an ISIN changed carried to the new ISIN
+
+        Parameters
+        ----------
+        data : DataFrame
+            dataframe of the prepared dataset (degiro.Dataset(path).data)
+        """
+        return cls(Trades.from_degiro(data))
+
+    @staticmethod
+    def as_of(dates: List[date]) -> LazyFrame:
+        """Dates of the query with the last instant of each ("cutoff"): a trade counts as of a date from any time of
+        that day"""
+        return (
+            pl.LazyFrame({"as_of": dates})
+            .select(pl.col("as_of").cast(pl.Date))
+            .with_columns(
+                (pl.col("as_of").cast(pl.Datetime("us")) + pl.duration(days=1) - pl.duration(microseconds=1))
+                .alias("cutoff")
+            )
+            .sort("cutoff")
+        )
+
+    def quantities(self, dates: List[date]) -> LazyFrame:
+        """Quantity bought and sold of every security as of every date
+
+        Returns
+        -------
+        LazyFrame
+            contains as_of, cutoff, security, bought and sold columns
+        """
+        totals = (
+            self.legs.lazy().select(pl.col("security").unique())
+            .join(self.as_of(dates), how="cross")
+            .sort("cutoff")
+        )
+        for action, total in [("buy", "bought"), ("sell", "sold")]:
+            side = (
+                self.legs.lazy()
+                .filter(pl.col("action") == action)
+                .select("security", "date", pl.col("pos_end").alias(total))
+                .sort("date")
+            )
+            totals = (
+                totals.join_asof(side, left_on="cutoff", right_on="date", by="security", strategy="backward")
+                .with_columns(pl.col(total).fill_null(0.0))
+                .drop("date")
+            )
+        return totals
+
+    def open_lots(self, dates: List[date]) -> DataFrame:
+        """Lots open as of every date: purchases not sold yet under FIFO (or sales not bought back, when short)
+
+        Parameters
+        ----------
+        dates : List[date]
+            dates of the query, each one including the trades of the whole day
+
+        Returns
+        -------
+        DataFrame
+            one row per date and lot with as_of, security, date, value_date and action of the lot, the shares of it
+            still open ("number", negative when short) and their "cost" in EUR (their part of the amount paid, costs
+            included, or of the proceeds received, negative, when short)
+        """
+        quantities = self.quantities(dates).collect().lazy()
+        lots = []
+        for action, closed in [("buy", "sold"), ("sell", "bought")]:
+            side = self.legs.lazy().filter(pl.col("action") == action)
+            last = side.select("security", "date", pl.col("index").alias("last")).sort("date")
+            first = side.select("security", pl.col("pos_end").alias("first_end"), pl.col("index").alias("first"))
+            lots.append(
+                quantities
+                # last lot traded as of the date and first lot not closed yet under FIFO
+                .join_asof(last, left_on="cutoff", right_on="date", by="security", strategy="backward")
+                .with_columns(pl.col(closed).alias("closed"), (pl.col(closed) + 1e-9).alias("open_from"))
+                .sort("open_from")
+                .join_asof(
+                    first.sort("first_end"), left_on="open_from", right_on="first_end", by="security",
+                    strategy="forward",
+                )
+                .filter(pl.col("first") <= pl.col("last"))
+                .select("as_of", "security", "closed", pl.int_ranges("first", pl.col("last") + 1).alias("index"))
+                .explode("index")
+                .join(side, on=["security", "index"])
+            )
+        return (
+            pl.concat(lots)
+            .with_columns(
+                (pl.col("pos_end") - pl.max_horizontal("pos_start", "closed")).alias("open")
+            )
+            .select(
+                "as_of",
+                "security",
+                "date",
+                "value_date",
+                "action",
+                (pl.col("open") * pl.when(pl.col("action") == "buy").then(1.0).otherwise(-1.0)).alias("number"),
+                (-pl.col("amount") * pl.col("open") / pl.col("number")).alias("cost"),
+            )
+            .sort("as_of", "security", "date")
+            .collect()
+        )
+
+    def positions(self, dates: List[date]) -> DataFrame:
+        """Open position and cost basis of every security held as of every date
+
+        Parameters
+        ----------
+        dates : List[date]
+            dates of the query, each one including the trades of the whole day
+
+        Returns
+        -------
+        DataFrame
+            one row per date and security with an open position, with its "number" of shares (negative when short),
+            its "cost_basis" in EUR and its "average_cost" per share
+        """
+        return (
+            self.open_lots(dates)
+            .group_by("as_of", "security")
+            .agg(pl.col("number").sum(), pl.col("cost").sum().alias("cost_basis"))
+            .with_columns((pl.col("cost_basis") / pl.col("number")).alias("average_cost"))
+            .sort("as_of", "security")
+        )
+
+
+# fmt: on
@@ -0,0 +1,144 @@
+"""profiling.py opt-in trace of the matching loops, written as Chrome trace JSON
+
+Nothing is recorded unless a profile is active. Within a profile every span (an ISIN, a transaction, a step of the
+FIFO) is recorded with its duration and arguments, the rows it scanned and the frames it materialized, and the trace
+is written in the Chrome trace event format, to be opened in chrome://tracing or https://ui.perfetto.dev.
+
+    with profile("trace.json"):
+        Returns(data_stock).return_on_stock(isin)
+
+The code is instrumented with the traced decorator (a span per call) and the spans generator (a span per iteration
+of a loop), which leave the instrumented code as it is.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, TypeVar, Union
+
+from polars import DataFrame
+
+
+class Tracer:
+    def __init__(self) -> None:
+        """Initialise class
+
+        Spans are recorded as complete events ("ph": "X") in microseconds from the start of the tracer, with the
+        number of frames and rows materialized inside them (see frame) added to their arguments.
+        """
+        self.events: List[dict] = []
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self.local = threading.local()
+
+    @property
+    def stack(self) -> List[dict]:
+        # open spans of the current thread, innermost last
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def now(self) -> float:
+        return (time.perf_counter_ns() - self.origin) / 1000
+
+    @contextmanager
+    def span(self, name: str, category: str, **args: Any) -> Iterator[dict]:
+        event: Dict[str, Any] = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "pid": self.pid,
+            "tid": threading.get_ident(),
+            "args": {**args, "frames": 0, "rows_materialized": 0},
+        }
+        self.stack.append(event)
+        event["ts"] = self.now()
+        try:
+            yield event
+        finally:
+            event["dur"] = self.now() - event["ts"]
+            # not always the innermost span: the span of a loop left early closes when its generator does
+            self.stack.remove(event)
+            self.events.append(event)
+
+    def frame(self, df: DataFrame) -> None:
+        for event in self.stack:
+            event["args"]["frames"] += 1
+            event["args"]["rows_materialized"] += df.height
+
+    def write(self, path: Union[str, os.PathLike]) -> None:
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f, default=str)
+
+
+_tracer: Optional[Tracer] = None
+# returned by span when no profile is active: a nullcontext can be entered any number of times
+_no_span = nullcontext()
+
+T = TypeVar("T")
+
+
+@contextmanager
+def profile(path: Optional[Union[str, os.PathLike]] = None) -> Iterator[Tracer]:
+    """Record the spans of the code run inside, writing them to path (Chrome trace JSON) at the end if given"""
+    global _tracer
+    previous, _tracer = _tracer, Tracer()
+    tracer = _tracer
+    try:
+        yield tracer
+    finally:
+        _tracer = previous
+        if path is not None:
+            tracer.write(path)
+
+
+def span(name: str, category: str = "opendeclaro", **args: Any) -> ContextManager[Any]:
+    """Context manager recording a span when a profile is active, doing nothing otherwise"""
+    if _tracer is None:
+        return _no_span
+    return _tracer.span(name, category, **args)
+
+
+def traced(name: str, category: str = "opendeclaro", args: Optional[Callable[..., dict]] = None) -> Callable:
+    """Decorator recording a span around every call when a profile is active
+
+    args, called with the arguments of the call, gives the arguments of the span.
+    """
+
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*fn_args: Any, **fn_kwargs: Any) -> Any:
+            if _tracer is None:
+                return fn(*fn_args, **fn_kwargs)
+            with _tracer.span(name, category, **(args(*fn_args, **fn_kwargs) if args else {})):
+                return fn(*fn_args, **fn_kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def spans(
+    items: Iterable[T], name: str, category: str = "opendeclaro", args: Optional[Callable[[T], dict]] = None
+) -> Iterator[T]:
+    """Items of an iterable, each one inside a span that lasts while the body of the loop runs on it when a profile
+    is active
+
+    args, called with the item, gives the arguments of its span.
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield from items
+        return
+    for item in items:
+        with tracer.span(name, category, **(args(item) if args else {})):
+            yield item
+
+
+def frame(df: DataFrame) -> DataFrame:
+    """Count a materialized frame (and its rows) in the open spans when a profile is active, returning it"""
+    if _tracer is not None:
+        _tracer.frame(df)
+    return df
@@ -0,0 +1,120 @@
+"""trades.py broker-agnostic columnar format of stock trades"""
+import os
+from typing import Dict, Union
+
+import polars as pl
+from polars import DataFrame, LazyFrame
+from polars.type_aliases import PolarsDataType
+
+import opendeclaro.degiro.config as degiro_config
+from opendeclaro.degiro.matching import ColumnarFIFO
+from opendeclaro.degiro.report import FiscalReport
+from opendeclaro.ibkr.dataprep import DataPrep as IBKRDataPrep
+
+# one row per trade, money in units of currency: local_amount in the trade currency and fx_rate in units of it per
+# EUR; commission (negative) and amount (signed value of the trade in EUR, costs included, negative for purchases) in
+# EUR. Rows are sorted by security and date.
+TRADE_SCHEMA: Dict[str, PolarsDataType] = {
+    "security": pl.Utf8,
+    "date": pl.Datetime("us"),
+    "value_date": pl.Datetime("us"),
+    "action": pl.Enum(["buy", "sell"]),
+    "number": pl.Float64,
+    "price": pl.Float64,
+    "currency": pl.Utf8,
+    "local_amount": pl.Float64,
+    "fx_rate": pl.Float64,
+    "commission": pl.Float64,
+    "amount": pl.Float64,
+    "broker": pl.Utf8,
+}
+
+
+class Trades:
+    def __init__(self, data: Union[DataFrame, LazyFrame]):
+        """Initialization of class
+
+        Parameters
+        ----------
+        data : Union[DataFrame, LazyFrame]
+            trades with the columns of TRADE_SCHEMA (they are cast to its types and sorted by security and date)
+        """
+        self.data = (
+            data.lazy()
+            .select([pl.col(col).cast(dtype) for col, dtype in TRADE_SCHEMA.items()])
+            .sort("security", "date", maintain_order=True)
+        )
+
+    @staticmethod
+    def from_stocks_orders(df: Union[DataFrame, LazyFrame], broker: str) -> LazyFrame:
+        """Trades in TRADE_SCHEMA from stock orders with the columns of degiro.DataPrep(...).stocks_orders"""
+        money = [
+            pl.col(col).cast(pl.Float64) / degiro_config.minor_units if df.schema[col].is_integer() else pl.col(col)
+            for col in ["var", "commision"]
+        ]
+        return (
+            df.lazy()
+            .select(
+                pl.col("isin").cast(pl.Utf8).alias("security"),
+                "date",
+                "value_date",
+                pl.col("action").cast(pl.Utf8),
+                "number",
+                "price",
+                pl.col("varcur").cast(pl.Utf8).alias("currency"),
+                money[0].cast(pl.Float64).alias("local_amount"),
+                pl.col("curr_rate").cast(pl.Float64).alias("fx_rate"),
+                money[1].cast(pl.Float64).fill_null(0.0).alias("commission"),
+                pl.lit(broker).alias("broker"),
+            )
+            .with_columns((pl.col("local_amount") / pl.col("fx_rate") + pl.col("commission")).alias("amount"))
+        )
+
+    @classmethod
+    def from_degiro(cls, data: DataFrame) -> "Trades":
+        """Stock trades of a DEGIRO account, with the shares of an ISIN changed carried to the new ISIN
+
+        Parameters
+        ----------
+        data : DataFrame
+            dataframe of the prepared dataset (degiro.Dataset(path).data)
+        """
+        return cls(cls.from_stocks_orders(FiscalReport(data).stock_orders, broker="degiro"))
+
+    @classmethod
+    def from_ibkr(cls, data: Dict[str, DataFrame]) -> "Trades":
+        """Stock trades of an IBKR activity statement
+
+        Parameters
+        ----------
+        data : Dict[str, DataFrame]
+            tables of the statement (ibkr.Dataset(path).data)
+        """
+        return cls(cls.from_stocks_orders(IBKRDataPrep(data).stocks_orders, broker="ibkr"))
+
+    @classmethod
+    def concat(cls, *trades: "Trades") -> "Trades":
+        """Trades of several accounts (or brokers) in a single frame"""
+        return cls(pl.concat([t.data for t in trades]))
+
+    def write(self, path: Union[str, os.PathLike]) -> None:
+        """Persist the trades as Parquet (.parquet) or as uncompressed Arrow IPC, which is memory mapped when read"""
+        df = self.data.collect()
+        path = os.fspath(path)
+        if path.endswith(".parquet"):
+            df.write_parquet(path)
+        else:
+            df.write_ipc(path, compression="uncompressed")
+
+    @classmethod
+    def read(cls, path: Union[str, os.PathLike]) -> "Trades":
+        """Trades persisted with write, scanned lazily (Arrow IPC files are memory mapped)"""
+        path = os.fspath(path)
+        if path.endswith(".parquet"):
+            return cls(pl.scan_parquet(path))
+        return cls(pl.scan_ipc(path, memory_map=True))
+
+    @property
+    def closes(self) -> LazyFrame:
+        """Realised result of every closing transaction, with the two month rule applied (see ColumnarFIFO)"""
+        return ColumnarFIFO(self.data, by="security").closes
@@ -0,0 +1,49 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# the web backend is not part of the package: its app is imported from its directory
+sys.path.insert(0, str(Path(__file__).parents[1] / "opendeclaro-web" / "backend"))
+
+# IBKR activity statement: AAPL bought in USD and half of it sold, SAP bought and sold in EUR, a dividend of AAPL
+STATEMENT = """Statement,Header,Nombre del campo,Valor del campo
+Statement,Data,Title,Extracto de actividad
+Operaciones,Header,DataDiscriminator,Categoría de activo,Divisa,Símbolo,Fecha/Hora,Cantidad,Precio trans.,Precio de cier.,Productos,Tarifa/com.,Base,PyG realizadas,PyG MTM,Código
+Operaciones,Data,Order,Acciones,USD,AAPL,"2023-02-10, 15:30:00",10,150.5,151,-1505,-1,1506,0,5,O
+Operaciones,Data,Order,Acciones,USD,AAPL,"2023-06-20, 09:10:00",-5,190.5,190,952.5,-1,-753,198.5,2,C
+Operaciones,SubTotal,,Acciones,USD,AAPL,,5,,,-552.5,-2,753,198.5,7,
+Operaciones,Data,Order,Acciones,EUR,SAP,"2023-01-05, 10:00:00",4,100,100,-400,-2,402,0,0,O
+Operaciones,Data,Order,Acciones,EUR,SAP,"2023-03-07, 10:00:00",-4,120,120,480,-2,-402,76,0,C
+Operaciones,Header,DataDiscriminator,Categoría de activo,Divisa,Símbolo,Fecha/Hora,Cantidad,Precio trans.,,Productos,Tarifa/com. en EUR,,,PyG MTM en EUR,Código
+Operaciones,Data,Order,Fórex,USD,EUR.USD,"2023-02-10, 15:30:00","1,400",1.075,,-1505,-2,,,0,
+Operaciones,Data,Order,Fórex,USD,EUR.USD,"2023-06-20, 09:10:00",-873.85,1.09,,952.5,-2,,,0,
+Dividendos,Header,Divisa,Fecha,Descripción,Importe
+Dividendos,Data,USD,2023-05-15,AAPL(US0378331005) Dividendo en efectivo USD 0.24 por acción (Dividendo ordinario),2.4
+Dividendos,Data,Total,,,2.4
+Información de instrumento financiero,Header,Categoría de activo,Símbolo,Descripción,Conid,Id. de seguridad,Multiplicador,Tipo,Código
+Información de instrumento financiero,Data,Acciones,AAPL,APPLE INC,265598,US0378331005,1,COMMON,
+Información de instrumento financiero,Data,Acciones,SAP,SAP SE,14204,DE0007164600,1,COMMON,
+"""
+
+# DEGIRO account: SAP bought and sold in EUR, the sale with a gain of 76 EUR costs included
+DEGIRO_ACCOUNT = """Fecha,Hora,Fecha valor,Producto,ISIN,Descripción,Tipo,Variación,,Saldo,,ID Orden
+07-03-2023,10:00,07-03-2023,SAP SE,DE0007164600,"Venta 4 SAP SE@120 EUR (DE0007164600)",,EUR,"480,00",EUR,"0,00",ord2
+07-03-2023,10:00,07-03-2023,SAP SE,DE0007164600,Costes de transacción y/o externos de DEGIRO,,EUR,"-2,00",EUR,"0,00",ord2
+05-01-2023,10:00,05-01-2023,SAP SE,DE0007164600,"Compra 4 SAP SE@100 EUR (DE0007164600)",,EUR,"-400,00",EUR,"0,00",ord1
+05-01-2023,10:00,05-01-2023,SAP SE,DE0007164600,Costes de transacción y/o externos de DEGIRO,,EUR,"-2,00",EUR,"0,00",ord1
+"""
+
+
+@pytest.fixture
+def statement_path(tmp_path) -> Path:
+    path = tmp_path / "statement.csv"
+    path.write_text(STATEMENT)
+    return path
+
+
+@pytest.fixture
+def degiro_account(tmp_path) -> Path:
+    path = tmp_path / "account.csv"
+    path.write_text(DEGIRO_ACCOUNT)
+    return path
@@ -0,0 +1,26 @@
+import polars as pl
+
+from opendeclaro.degiro.dataset import Dataset
+
+ACCOUNT = """Fecha,Hora,Fecha valor,Producto,ISIN,Descripción,Tipo,Variación,,Saldo,,ID Orden
+07-03-2023,10:00,07-03-2023,SAP SE,DE0007164600,"Compra 1 SAP SE@12,345 EUR (DE0007164600)",,EUR,"-12,345",EUR,"12,344",ord2
+06-03-2023,10:00,06-03-2023,SONY,JP3435000009,"Venta 2000 SONY@15000 JPY (JP3435000009)",,JPY,"30000000,00",JPY,"0,005",ord1
+"""
+
+
+def test_fixed_point():
+    data = Dataset(ACCOUNT.encode(), fixed_point=True).data
+    assert data.schema["var"] == pl.Int64
+    # rounded half away from zero, beyond the range of Int32
+    assert data.sort("date")["var"].to_list() == [3_000_000_000, -1235]
+    assert data.sort("date")["cash"].to_list() == [1, 1234]
+
+    floats = Dataset(ACCOUNT.encode()).data
+    assert floats.schema["var"] == pl.Float32
+
+
+def test_categorical(recwarn, degiro_account):
+    data = Dataset(degiro_account, categorical=True).data
+    assert all(data.schema[col] == pl.Categorical for col in ["isin", "desc", "action"])
+    assert not [warning for warning in recwarn if warning.category is pl.exceptions.CategoricalRemappingWarning]
+    assert Dataset(ACCOUNT.encode()).data.schema["desc"] == pl.Utf8
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import numpy as np
+import polars as pl
+import pytest
+
+from opendeclaro.degiro.fx import FXRates
+
+
+@pytest.fixture
+def data():
+    # exchanges of USD on Feb 1 (rate in the EUR row of an order) and Jun 1 (not linked to an order)
+    return pl.DataFrame(
+        {
+            "date": [datetime(2023, 2, 1), datetime(2023, 2, 1), datetime(2023, 6, 1), datetime(2023, 6, 1)],
+            "desc": ["Ingreso Cambio de Divisa", "Retirada Cambio de Divisa"] * 2,
+            "id_order": ["ord1", "ord1", "", ""],
+            "varcur": ["USD", "EUR", "EUR", "USD"],
+            "curr_rate": [None, 1.10, 1.05, None],
+        }
+    )
+
+
+@pytest.fixture
+def orders():
+    return pl.DataFrame(
+        {
+            "date": [datetime(2023, 1, 15), datetime(2023, 5, 30), datetime(2023, 7, 1), datetime(2023, 7, 1)],
+            "varcur": ["USD", "USD", "USD", "EUR"],
+            "curr_rate": [None, None, 1.2, None],
+        }
+    )
+
+
+def test_rate_table(data):
+    table = FXRates(data).table
+    assert table["currency"].to_list() == ["USD", "USD"]
+    assert np.allclose(table["fx_rate"].to_numpy(), [1.10, 1.05])
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_fill_curr_rate(data, orders, lazy):
+    fx = FXRates(data.lazy() if lazy else data)
+    filled = fx.fill_curr_rate(orders.lazy() if lazy else orders)
+    filled = filled.collect() if lazy else filled
+    assert filled["curr_rate"].null_count() == 0
+    # before any exchange the first rate, then the last rate up to the date (May 30 is nearer to Jun 1 than to Feb 1),
+    # an informed rate is kept and EUR is 1
+    assert np.allclose(filled["curr_rate"].to_numpy(), [1.10, 1.10, 1.2, 1.0])
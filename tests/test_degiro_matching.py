@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import numpy as np
+import polars as pl
+import pytest
+
+from opendeclaro.degiro.matching import ColumnarFIFO
+
+
+@pytest.fixture
+def trades():
+    return pl.LazyFrame(
+        {
+            "isin": ["A", "B", "A", "A", "B", "A", "A"],
+            "date": [
+                datetime(2023, 1, 1),
+                datetime(2023, 1, 1),
+                datetime(2023, 1, 2),
+                datetime(2023, 2, 1),
+                datetime(2023, 2, 1),
+                datetime(2023, 3, 1),
+                datetime(2023, 3, 15),
+            ],
+            "action": ["buy", "sell", "buy", "sell", "buy", "sell", "buy"],
+            "number": [10.0, 3.0, 10.0, 15.0, 3.0, 10.0, 5.0],
+            "amount": [-100.0, 30.0, -200.0, 150.0, -60.0, 50.0, -10.0],
+        }
+    ).with_columns(pl.col("date").alias("value_date"))
+
+
+def test_matches_fifo_long_and_short(trades):
+    closes = ColumnarFIFO(trades).closes.sort("close_seq").collect()
+    assert closes["close_action"].to_list() == ["sell", "buy", "sell", "buy"]
+    assert np.allclose(closes["matched"].to_numpy(), [15.0, 3.0, 5.0, 5.0])
+    assert np.allclose(closes["gain"].to_numpy(), [-50.0, -30.0, -75.0, 15.0])
+
+
+def test_two_month_violation(trades):
+    closes = ColumnarFIFO(trades).closes.sort("close_seq").collect()
+    assert closes["two_month_violation"].to_list() == [True, False, True, False]
+    assert np.allclose(closes["computable_gain"].to_numpy(), [0.0, -30.0, 0.0, 15.0])
+
+
+def test_open_position(trades):
+    # a security only bought has no close
+    open_position = pl.LazyFrame(
+        {"isin": ["C"], "date": [datetime(2023, 4, 1)], "action": ["buy"], "number": [5.0], "amount": [-50.0]}
+    ).with_columns(pl.col("date").alias("value_date"))
+    closes = ColumnarFIFO(pl.concat([trades, open_position])).closes.collect()
+    assert "C" not in closes["isin"].to_list()
+    assert closes["close_value_date"].null_count() == 0
+    assert closes.height == 4
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from opendeclaro.degiro import config
+from opendeclaro.degiro.dataprep import DataPrep
+from opendeclaro.degiro.dataset import Dataset
+from opendeclaro.degiro.memory import memory_report, peak_rss, reset_peak_rss
+from opendeclaro.degiro.returns import Returns
+
+
+def test_matching_orders(degiro_account):
+    data_prep = DataPrep(Dataset(degiro_account).data)
+    matching_orders = data_prep.matching_orders
+    assert matching_orders.columns == config.matching_cols
+    assert np.isclose(Returns(matching_orders).return_on_stock("DE0007164600"), 76.0)
+    assert np.isclose(Returns(data_prep.stocks_orders).return_on_stock("DE0007164600"), 76.0)
+
+    report = memory_report(str(degiro_account))
+    assert list(report.stages) == ["dataset", "stocks_orders", "matching_orders"]
+    assert report.stages["matching_orders"] < report.stages["stocks_orders"]
+    assert report.peak_rss > 0
+
+
+def test_reset_peak_rss():
+    if not reset_peak_rss():
+        pytest.skip("the peak RSS cannot be reset on this platform")
+    before = peak_rss()
+    np.ones(2**25).sum()
+    assert peak_rss() >= before + 2**27
+    reset_peak_rss()
+    assert peak_rss() < before + 2**27
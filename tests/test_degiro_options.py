@@ -0,0 +1,58 @@
+from datetime import datetime
+
+import numpy as np
+import polars as pl
+import pytest
+
+from opendeclaro.degiro.dataset import Dataset
+from opendeclaro.degiro.options import OptionsReturns
+
+
+def test_contract_fields():
+    df = pl.DataFrame({"product": ["AAPL C150.00 20JAN23", "APPLE INC P 190,5 19JAN24", "SAP SE"]}).select(
+        OptionsReturns.contract_fields()
+    )
+    assert df["underlying"].to_list() == ["AAPL", "APPLE INC", None]
+    assert df["type"].to_list() == ["C", "P", None]
+    assert df["strike"].to_list() == [150.0, 190.5, None]
+    assert df["expiry"].to_list() == [datetime(2023, 1, 20), datetime(2024, 1, 19), None]
+
+
+# two calls bought, one sold and the other expired worthless, and a put still open
+ACCOUNT = """Fecha,Hora,Fecha valor,Producto,ISIN,Descripción,Tipo,Variación,,Saldo,,ID Orden
+10-06-2023,10:00,10-06-2023,SAP P100.00 19JAN24,,"Compra 1 SAP P100.00 19JAN24@100 EUR",,EUR,"-100,00",EUR,"0,00",oo3
+10-06-2023,10:00,10-06-2023,SAP P100.00 19JAN24,,Costes de transacción y/o externos de DEGIRO,,EUR,"-1,00",EUR,"0,00",oo3
+10-01-2023,10:00,10-01-2023,SAP C120.00 20JAN23,,"Venta 1 SAP C120.00 20JAN23@400 EUR",,EUR,"400,00",EUR,"0,00",oo2
+10-01-2023,10:00,10-01-2023,SAP C120.00 20JAN23,,Costes de transacción y/o externos de DEGIRO,,EUR,"-1,00",EUR,"0,00",oo2
+03-01-2023,10:00,03-01-2023,SAP C120.00 20JAN23,,"Compra 2 SAP C120.00 20JAN23@250 EUR",,EUR,"-500,00",EUR,"0,00",oo1
+03-01-2023,10:00,03-01-2023,SAP C120.00 20JAN23,,Costes de transacción y/o externos de DEGIRO,,EUR,"-1,50",EUR,"0,00",oo1
+"""
+
+
+@pytest.fixture
+def options(tmp_path):
+    path = tmp_path / "account.csv"
+    path.write_text(ACCOUNT)
+    return OptionsReturns(Dataset(path).data)
+
+
+def test_matching_and_expiry(options):
+    # as of the last transaction of the account the call has expired, the put has not
+    assert options.as_of == datetime(2023, 6, 10, 10, 0)
+    closes = options.closes.sort("close_value_date").collect()
+    assert closes["contract"].to_list() == ["SAP C120.00 20JAN23", "SAP C120.00 20JAN23"]
+    # the contract sold (400 - 1 against half of 501.5) and the one expired at zero value
+    assert np.allclose(closes["gain"].to_numpy(), [148.25, -250.75])
+    assert closes["close_value_date"].to_list()[-1] == datetime(2023, 1, 20)
+
+
+def test_yearly_totals(options):
+    summary = options.compute()
+    # the put still open is not closed
+    assert summary.contract_summary["contract"].to_list() == ["SAP C120.00 20JAN23"]
+    assert summary.contract_summary["contracts_closed"].to_list() == [2.0]
+    assert summary.year_summary["year"].to_list() == [2023]
+    assert np.allclose(summary.year_summary["return"].to_numpy(), [-102.5])
+    # once the put has expired it is closed at zero value
+    summary = OptionsReturns(options.data.collect(), as_of=datetime(2024, 2, 1)).compute()
+    assert np.allclose(summary.year_summary["return"].to_numpy(), [-102.5, -101.0])
@@ -0,0 +1,31 @@
+import numpy as np
+
+from opendeclaro.degiro.dataset import Dataset
+from opendeclaro.degiro.report import FiscalReport
+
+# a round trip of SAP (gain 76 after costs), a dividend of SAP and a purchase of Apple still open
+ACCOUNT = """Fecha,Hora,Fecha valor,Producto,ISIN,Descripción,Tipo,Variación,,Saldo,,ID Orden
+01-06-2023,10:00,01-06-2023,APPLE INC,US0378331005,"Compra 5 Apple Inc@100 EUR (US0378331005)",,EUR,"-500,00",EUR,"0,00",ord3
+01-06-2023,10:00,01-06-2023,APPLE INC,US0378331005,Costes de transacción y/o externos de DEGIRO,,EUR,"-2,00",EUR,"0,00",ord3
+15-05-2023,12:00,15-05-2023,SAP SE,DE0007164600,Dividendo,,EUR,"10,00",EUR,"0,00",
+15-05-2023,12:00,15-05-2023,SAP SE,DE0007164600,Retención del dividendo,,EUR,"-1,50",EUR,"0,00",
+07-03-2023,10:00,07-03-2023,SAP SE,DE0007164600,"Venta 4 SAP SE@120 EUR (DE0007164600)",,EUR,"480,00",EUR,"0,00",ord2
+07-03-2023,10:00,07-03-2023,SAP SE,DE0007164600,Costes de transacción y/o externos de DEGIRO,,EUR,"-2,00",EUR,"0,00",ord2
+05-01-2023,10:00,05-01-2023,SAP SE,DE0007164600,"Compra 4 SAP SE@100 EUR (DE0007164600)",,EUR,"-400,00",EUR,"0,00",ord1
+05-01-2023,10:00,05-01-2023,SAP SE,DE0007164600,Costes de transacción y/o externos de DEGIRO,,EUR,"-2,00",EUR,"0,00",ord1
+"""
+
+
+def test_fiscal_report(tmp_path):
+    path = tmp_path / "account.csv"
+    path.write_text(ACCOUNT)
+    summary = FiscalReport(Dataset(path).data).compute()
+    assert summary.isin_summary["year"].null_count() == 0
+    assert summary.year_summary["year"].to_list() == [2023]
+    year = summary.year_summary.row(0, named=True)
+    assert np.isclose(year["gains"], 76.0)
+    assert np.isclose(year["dividends"], 10.0)
+    assert np.isclose(year["withholding"], -1.5)
+    assert np.isclose(year["commissions"], -6.0)
+    apple = summary.isin_summary.filter(summary.isin_summary["isin"] == "US0378331005")
+    assert np.isclose(apple["gains"].sum(), 0.0)
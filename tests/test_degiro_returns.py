@@ -1,8 +1,13 @@
+from datetime import datetime
+
 import numpy as np
 import polars as pl
 import pytest
 
-from opendeclaro.degiro.returns import Returns
+from opendeclaro.degiro.dataprep import DataPrep
+from opendeclaro.degiro.dataset import Dataset
+from opendeclaro.degiro.returns import MatchingState, Returns
+from opendeclaro.equivalence import Account, IsinChange, Trade
 
 
 @pytest.fixture
@@ -74,3 +79,67 @@ def test_one_year_return(data_stock):
         Returns(data_stock, start_date="01/01/2023", end_date="01/01/2024").return_on_all_stocks().global_return,
         1367.929,
     )
+
+
+def test_return_on_all_stocks_by_year():
+    account = """Fecha,Hora,Fecha valor,Producto,ISIN,Descripción,Tipo,Variación,,Saldo,,ID Orden
+10-05-2023,10:00,10-05-2023,ASML,NL0010273215,"Venta 1 ASML@650 EUR (NL0010273215)",,EUR,"650,00",EUR,"0,00",ord5
+10-05-2023,10:00,10-05-2023,ASML,NL0010273215,Costes de transacción y/o externos de DEGIRO,,EUR,"-2,00",EUR,"0,00",ord5
+10-01-2023,10:00,10-01-2023,ASML,NL0010273215,"Compra 1 ASML@600 EUR (NL0010273215)",,EUR,"-600,00",EUR,"0,00",ord4
+10-01-2023,10:00,10-01-2023,ASML,NL0010273215,Costes de transacción y/o externos de DEGIRO,,EUR,"-2,00",EUR,"0,00",ord4
+07-03-2023,10:00,07-03-2023,SAP SE,DE0007164600,"Venta 2 SAP SE@90 EUR (DE0007164600)",,EUR,"180,00",EUR,"0,00",ord3
+07-03-2023,10:00,07-03-2023,SAP SE,DE0007164600,Costes de transacción y/o externos de DEGIRO,,EUR,"-2,00",EUR,"0,00",ord3
+07-06-2022,10:00,07-06-2022,SAP SE,DE0007164600,"Venta 2 SAP SE@120 EUR (DE0007164600)",,EUR,"240,00",EUR,"0,00",ord2
+07-06-2022,10:00,07-06-2022,SAP SE,DE0007164600,Costes de transacción y/o externos de DEGIRO,,EUR,"-2,00",EUR,"0,00",ord2
+05-01-2022,10:00,05-01-2022,SAP SE,DE0007164600,"Compra 4 SAP SE@100 EUR (DE0007164600)",,EUR,"-400,00",EUR,"0,00",ord1
+05-01-2022,10:00,05-01-2022,SAP SE,DE0007164600,Costes de transacción y/o externos de DEGIRO,,EUR,"-2,00",EUR,"0,00",ord1
+"""
+    data_stock = DataPrep(Dataset(account.encode()).data).matching_orders
+    returns_by_year = Returns(data_stock).return_on_all_stocks_by_year([2022, 2023])
+    assert returns_by_year[2022].isin_summary.to_dicts() == [{"isin": "DE0007164600", "return": 37.0}]
+    assert returns_by_year[2023].isin_summary.to_dicts() == [
+        {"isin": "DE0007164600", "return": -23.0},
+        {"isin": "NL0010273215", "return": 46.0},
+    ]
+    for year, returns_year in returns_by_year.items():
+        returns = Returns(data_stock, start_date=f"01/01/{year}", end_date=f"01/01/{year + 1}").return_on_all_stocks()
+        assert np.allclose(returns_year.global_return, returns.global_return)
+        assert returns_year.isin_summary.sort("isin").equals(returns.isin_summary.sort("isin"))
+
+
+def test_match_state(tmp_path, degiro_account):
+    header, *rows = degiro_account.read_text().splitlines()
+    # the account before the sale arrived (rows are sorted from the most recent)
+    (tmp_path / "old.csv").write_text("\n".join([header, *rows[2:]]) + "\n")
+    old_returns = Returns(DataPrep(Dataset(tmp_path / "old.csv").data).matching_orders)
+    old_returns.match_state().write(tmp_path / "state.parquet")
+    state = MatchingState.read(tmp_path / "state.parquet")
+    assert state.securities["last_id_order"].to_list() == ["ord1"]
+
+    returns = Returns(DataPrep(Dataset(degiro_account).data).matching_orders)
+    new_state = returns.match_state(state)
+    assert new_state.securities["fingerprint"].to_list() != state.securities["fingerprint"].to_list()
+    assert new_state.securities["closed_results"].list.len().to_list() == [1]
+    assert np.isclose(returns.return_on_stock("DE0007164600"), 76.0)
+    # an unchanged account reuses every ISIN of the state
+    assert returns.match_state(new_state).securities.equals(new_state.securities)
+
+
+def test_fingerprints_isin_change(tmp_path):
+    old, new = "XS0000000000", "XS0000000001"
+    account = Account(
+        (
+            Trade(old, datetime(2022, 1, 3, 10), "buy", 10, 100.0, id_order="o1"),
+            IsinChange(old, new, datetime(2022, 3, 1, 10), 10, 120.0),
+            Trade(new, datetime(2022, 6, 1, 10), "sell", 4, 130.0, id_order="o2"),
+        )
+    )
+    fingerprints = []
+    for events in [account.events, account.events + (Trade(new, datetime(2022, 9, 1, 10), "sell", 6, 140.0),)]:
+        (tmp_path / "account.csv").write_bytes(Account(events).to_csv())
+        returns = Returns(DataPrep(Dataset(tmp_path / "account.csv").data).matching_orders)
+        assert returns.lineages() == {old: [old, new], new: [old, new]}
+        fingerprints.append(returns.fingerprints())
+    # a trade of the new ISIN changes the fingerprint of the old one too
+    assert fingerprints[0][old] == fingerprints[0][new]
+    assert fingerprints[1][old] != fingerprints[0][old]
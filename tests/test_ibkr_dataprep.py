@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from opendeclaro.degiro.returns import Returns
+from opendeclaro.ibkr.dataprep import DataPrep
+from opendeclaro.ibkr.prepare import Dataset
+
+
+@pytest.fixture
+def data_prep(statement_path):
+    return DataPrep(Dataset(statement_path).data)
+
+
+def test_stocks_orders(data_prep):
+    stocks_orders = data_prep.stocks_orders
+    assert stocks_orders["isin"].to_list() == ["US0378331005", "DE0007164600", "US0378331005", "DE0007164600"]
+    assert np.allclose(stocks_orders["curr_rate"].to_numpy(), [1.09, 1.0, 1.075, 1.0])
+    returns = Returns(stocks_orders, start_date="01/01/2023", end_date="01/01/2024")
+    assert np.allclose(returns.return_on_stock("DE0007164600"), 76.0)
+    assert np.allclose(returns.return_on_stock("US0378331005"), (952.5 - 1) / 1.09 - (1505 + 1) / 1.075 / 2)
+
+
+def test_dividends(data_prep):
+    dividends = data_prep.dividends
+    assert dividends["isin"].to_list() == ["US0378331005"]
+    # the rate of the last exchange before the dividend, not of the nearest one (after it)
+    assert np.allclose(dividends["var"].to_numpy() / dividends["curr_rate"].to_numpy(), [2.4 / 1.075])
@@ -0,0 +1,44 @@
+from datetime import date
+
+import pytest
+
+from opendeclaro.ibkr.prepare import Dataset
+from opendeclaro.ibkr.statement import Statement
+
+STATEMENT = """﻿Statement,Header,Nombre del campo,Valor del campo
+Statement,Data,Title,Extracto de actividad
+Statement,Data,Period,"Enero 1, 2023 - Diciembre 31, 2023"
+Dividendos,Header,Divisa,Fecha,Descripción,Importe
+Dividendos,Data,USD,2023-05-15,AAPL(US0378331005) Dividendo en efectivo USD 0.24 por acción (Dividendo ordinario),2.4
+Dividendos,Data,EUR,2023-06-01,SAP(DE0007164600) Dividendo en efectivo EUR 2.05 por acción (Dividendo ordinario),8.2
+Dividendos,Data,Total,,,10.6
+Dividendos,Header,Divisa,Fecha,Descripción,Importe,Código
+Dividendos,Data,USD,2023-08-15,AAPL(US0378331005) Dividendo en efectivo USD 0.24 por acción (Dividendo ordinario),2.4,Re
+Retención de impuestos,Header,Divisa,Fecha,Descripción,Importe,Código
+Retención de impuestos,Data,USD,2023-05-15,AAPL(US0378331005) Dividendo en efectivo - US Impuesto,-0.36,
+Retención de impuestos,Total,,,,-0.36,
+"""
+
+
+@pytest.fixture
+def statement_path(tmp_path):
+    path = tmp_path / "statement.csv"
+    path.write_bytes(STATEMENT.replace("\n", "\r\n").encode())
+    return path
+
+
+def test_tables_in_one_read(statement_path):
+    statement = Statement(statement_path)
+    assert set(statement.offsets) == {"statement", "dividends", "tax"}
+    assert len(statement.offsets["dividends"]) == 2
+    tables = statement.tables("dividends", "tax")
+    dividends = tables["dividends"]
+    assert dividends.columns == ["Divisa", "Fecha", "Descripción", "Importe", "Código"]
+    assert dividends["Fecha"].to_list()[0] == date(2023, 5, 15)
+    assert dividends["Importe"].to_list() == [2.4, 8.2, 10.6, 2.4]
+    assert tables["tax"]["Importe"].to_list() == [-0.36]
+
+
+def test_extract_table_unknown_name(statement_path):
+    with pytest.raises(ValueError):
+        Dataset.extract_table(statement_path, "unknown")
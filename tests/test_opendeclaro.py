@@ -1,7 +1,39 @@
 """main test python script"""
+import os
+import subprocess
+import sys
+
 from opendeclaro import __version__
 
+# import time budget of the packages, in microseconds (they must not import polars until a class is used)
+IMPORT_BUDGET = int(os.environ.get("OPENDECLARO_IMPORT_BUDGET", 50_000))
+
 
 def test_version() -> None:
     """Test function to check version"""
     assert __version__ == "0.1.0"
+
+
+def test_import_time() -> None:
+    """Test function to check that importing the packages is lazy and within budget"""
+    code = "import sys, opendeclaro.degiro, opendeclaro.ibkr; print('polars' in sys.modules)"
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    assert process.stdout.strip() == "False"
+    # lines of -X importtime are "import time: self [us] | cumulative | imported package"
+    cumulative = {
+        line.split("|")[2].strip(): int(line.split("|")[1])
+        for line in process.stderr.splitlines()
+        if line.startswith("import time:") and "cumulative" not in line
+    }
+    assert cumulative["opendeclaro.degiro"] + cumulative["opendeclaro.ibkr"] < IMPORT_BUDGET
+
+
+def test_lazy_exports() -> None:
+    """Test function to check that the public names of the packages are still importable"""
+    from opendeclaro import degiro, ibkr
+    from opendeclaro.degiro import FIFO, Returns
+    from opendeclaro.degiro.returns import Returns as ReturnsClass
+
+    assert Returns is ReturnsClass and FIFO.__module__ == "opendeclaro.degiro.returns"
+    assert all(getattr(degiro, name) is not None for name in degiro.__all__)
+    assert all(getattr(ibkr, name) is not None for name in ibkr.__all__)
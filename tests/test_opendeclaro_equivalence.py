@@ -0,0 +1,49 @@
+import polars as pl
+
+from opendeclaro.degiro.dataset import Dataset
+from opendeclaro.equivalence import ENGINES, Case, Engine, check, random_account
+from opendeclaro.trades import Trades
+
+
+def no_two_month_rule(case: Case) -> dict:
+    # every loss is computed, even when the security is bought again within two months
+    closes = Trades.from_degiro(Dataset(case.csv).data).closes
+    gains = (
+        closes.filter(pl.col("close_value_date").is_not_null())
+        .group_by(pl.col("close_value_date").dt.year().alias("year"))
+        .agg(pl.col("gain").sum())
+        .collect()
+    )
+    return dict(zip(gains["year"].to_list(), gains["gain"].to_list()))
+
+
+def test_random_account():
+    account = random_account(0)
+    assert account == random_account(0)
+    assert account.valid
+    assert account.to_csv().decode().splitlines()[0].startswith("Fecha,Hora")
+    # repurchases within two months of a sale happen by chance
+    assert random_account(0, frozenset()).features <= frozenset(["wash_sale"])
+
+
+def test_engines_agree():
+    features = frozenset(["partial_fills", "wash_sale", "multi_currency"])
+    engines = [engine for engine in ENGINES if engine.name in ["returns", "returns_match_state", "columnar_fifo"]]
+    report = check(accounts=3, features=features, engines=engines)
+    assert report.mismatches == []
+    assert report.compared == {"returns": 3, "returns_match_state": 3, "columnar_fifo": 3}
+    assert all(seconds > 0 for seconds in report.timings.values())
+
+
+def test_shrink(tmp_path):
+    report = check(
+        accounts=1,
+        features=frozenset(["wash_sale"]),
+        engines=[ENGINES[0], Engine("wrong", no_two_month_rule)],
+        output=tmp_path,
+    )
+    (mismatch,) = report.mismatches
+    # a purchase, a sale at a loss and a purchase within the two months after it
+    assert [event.action for event in mismatch.account.events] == ["buy", "sell", "buy"]
+    assert mismatch.account.features == frozenset(["wash_sale"])
+    assert (tmp_path / "wrong-0.csv").read_bytes() == mismatch.account.to_csv()
@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import threading
+
+import numpy as np
+import polars as pl
+import pytest
+
+from opendeclaro.main import account_files, run_batch
+
+
+def test_run_batch(tmp_path, statement_path):
+    (tmp_path / "accounts").mkdir()
+    statement_path.rename(tmp_path / "accounts" / "statement.csv")
+    (tmp_path / "accounts" / "broken.csv").write_text("not,an,account\n")
+    summary = run_batch(account_files(tmp_path / "accounts"), tmp_path / "results", years=[2023], workers=2)
+    assert summary.accounts == 2
+    assert list(summary.failures) == ["broken"]
+    gains = pl.read_parquet(tmp_path / "results" / "gains.parquet")
+    assert gains["account"].unique().to_list() == ["statement"]
+    assert np.isclose(gains.filter(pl.col("security") == "DE0007164600")["gains"].item(), 76.0)
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="needs named pipes")
+def test_run_batch_timeout(tmp_path, statement_path):
+    # reading an account from a pipe nobody writes to never ends
+    (tmp_path / "accounts").mkdir()
+    os.mkfifo(tmp_path / "accounts" / "hanging.csv")
+    statement_path.rename(tmp_path / "accounts" / "statement.csv")
+    summary = run_batch(account_files(tmp_path / "accounts"), tmp_path / "results", workers=1, timeout=1)
+    assert summary.failures == {"hanging": "timed out after 1 s"}
+    assert (tmp_path / "results" / "accounts" / "statement.parquet").exists()
+
+
+@pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="needs named pipes")
+def test_run_batch_worker_died(tmp_path, statement_path):
+    (tmp_path / "accounts").mkdir()
+    os.mkfifo(tmp_path / "accounts" / "killed.csv")
+    statement_path.rename(tmp_path / "accounts" / "statement.csv")
+
+    def kill_worker():
+        # the pipe opens once the worker reads the account
+        with open(tmp_path / "accounts" / "killed.csv", "w"):
+            (process,) = multiprocessing.active_children()
+            os.kill(process.pid, signal.SIGKILL)
+
+    killer = threading.Thread(target=kill_worker)
+    killer.start()
+    summary = run_batch(account_files(tmp_path / "accounts"), tmp_path / "results", workers=1, timeout=60)
+    killer.join()
+    assert summary.failures == {"killed": "worker died"}
+    assert (tmp_path / "results" / "accounts" / "statement.parquet").exists()
+
+
+def test_lazy_imports():
+    code = "import sys, opendeclaro.main; print('polars' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code], capture_output=True, text=True).stdout.strip() == "False"
@@ -0,0 +1,38 @@
+from datetime import date, datetime
+
+import numpy as np
+
+from opendeclaro.degiro.dataset import Dataset as DegiroDataset
+from opendeclaro.equivalence import Account, IsinChange, Trade
+from opendeclaro.ibkr.prepare import Dataset
+from opendeclaro.positions import PositionIndex
+from opendeclaro.trades import Trades
+
+
+def test_positions(statement_path):
+    index = PositionIndex(Trades.from_ibkr(Dataset(statement_path).data))
+    positions = index.positions([date(2023, 1, 4), date(2023, 1, 5), date(2023, 3, 7), date(2023, 12, 31)])
+    assert positions.select("as_of", "security", "number").rows() == [
+        (date(2023, 1, 5), "DE0007164600", 4.0),
+        (date(2023, 3, 7), "US0378331005", 10.0),
+        (date(2023, 12, 31), "US0378331005", 5.0),
+    ]
+    # half of the purchase of AAPL (its amount and commission in EUR) is still open at the end of the year
+    assert np.isclose(positions["cost_basis"][-1], (1505 + 1) / 1.075 / 2)
+    assert np.isclose(positions["cost_basis"][0], 402.0)
+
+
+def test_positions_isin_change(tmp_path):
+    old, new = "XS0000000000", "XS0000000001"
+    account = Account(
+        (
+            Trade(old, datetime(2022, 1, 3, 10), "buy", 10, 100.0, id_order="o1"),
+            IsinChange(old, new, datetime(2022, 3, 1, 10), 10, 120.0),
+        )
+    )
+    (tmp_path / "account.csv").write_bytes(account.to_csv())
+    positions = PositionIndex.from_degiro(DegiroDataset(tmp_path / "account.csv").data).positions([date(2022, 6, 1)])
+    # the shares of the old ISIN are carried to the new one at the cost of the purchase, commission included
+    assert positions.select("security", "number").rows() == [(new, 10.0)]
+    assert np.isclose(positions["cost_basis"][0], 1002.0)
+    assert np.isclose(positions["average_cost"][0], 100.2)
@@ -0,0 +1,46 @@
+import json
+
+import polars as pl
+
+from opendeclaro.degiro.dataset import Dataset as DegiroDataset
+from opendeclaro.degiro.portfolio import Portfolio
+from opendeclaro.degiro.returns import Returns
+from opendeclaro.ibkr.dataprep import DataPrep
+from opendeclaro.ibkr.prepare import Dataset
+from opendeclaro.profiling import profile
+
+
+def test_profile_returns(tmp_path, statement_path):
+    returns = Returns(DataPrep(Dataset(statement_path).data).stocks_orders)
+    with profile(tmp_path / "trace.json"):
+        return_on_stock = returns.return_on_stock("DE0007164600")
+    assert return_on_stock == returns.return_on_stock("DE0007164600")
+    with open(tmp_path / "trace.json") as f:
+        events = json.load(f)["traceEvents"]
+    assert {event["name"] for event in events} >= {
+        "Returns.closed_results",
+        "transaction",
+        "stocks_before",
+        "FIFO.opp_df",
+        "FIFO.affected",
+        "FIFO.untouched",
+    }
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+    (closed_results,) = [event for event in events if event["name"] == "Returns.closed_results"]
+    assert closed_results["args"]["isin"] == "DE0007164600" and closed_results["args"]["frames"] > 0
+    # the rows of the ISIN, not of the whole account
+    assert closed_results["args"]["rows"] == 2 < returns.df.height
+
+
+def test_profile_portfolio(tmp_path, degiro_account):
+    ds = DegiroDataset(degiro_account)
+    sales = ds.data.filter(pl.col("action") == "sell").select(pl.col("product", "id_order").cast(pl.Utf8))
+    product, id_order = sales.row(0)
+    with profile(tmp_path / "trace.json"):
+        result = Portfolio.return_of_sale(ds, product, id_order)
+    assert result == Portfolio.return_of_sale(ds, product, id_order)
+    with open(tmp_path / "trace.json") as f:
+        events = json.load(f)["traceEvents"]
+    assert {event["name"] for event in events} >= {"Portfolio.return_of_sale", "SaleOfStock", "PurchaseOfStockFromSale"}
+    (return_of_sale,) = [event for event in events if event["name"] == "Portfolio.return_of_sale"]
+    assert return_of_sale["args"]["id_order"] == id_order and return_of_sale["args"]["frames"] > 0
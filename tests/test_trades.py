@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from opendeclaro.degiro.dataset import Dataset as DegiroDataset
+from opendeclaro.ibkr.prepare import Dataset
+from opendeclaro.trades import TRADE_SCHEMA, Trades
+
+
+@pytest.fixture
+def trades(statement_path):
+    return Trades.from_ibkr(Dataset(statement_path).data)
+
+
+@pytest.mark.parametrize("file_name", ["trades.arrow", "trades.parquet"])
+def test_trades_round_trip(trades, tmp_path, file_name):
+    trades.write(tmp_path / file_name)
+    df = Trades.read(tmp_path / file_name).data.collect()
+    assert dict(df.schema) == TRADE_SCHEMA
+    assert df["security"].to_list() == ["DE0007164600", "DE0007164600", "US0378331005", "US0378331005"]
+    assert df.equals(trades.data.collect())
+
+
+def test_trades_closes(trades):
+    gains = dict(trades.closes.collect().select("security", "computable_gain").iter_rows())
+    assert np.isclose(gains["DE0007164600"], 76.0)
+    assert np.isclose(gains["US0378331005"], (952.5 - 1) / 1.09 - (1505 + 1) / 1.075 / 2)
+
+
+def test_trades_from_degiro(degiro_account):
+    trades = Trades.from_degiro(DegiroDataset(degiro_account).data)
+    df = trades.data.collect()
+    assert df.select("security", "action", "number", "price").rows() == [
+        ("DE0007164600", "buy", 4.0, 100.0),
+        ("DE0007164600", "sell", 4.0, 120.0),
+    ]
+    assert np.isclose(trades.closes.collect()["computable_gain"].sum(), 76.0)
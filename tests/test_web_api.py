@@ -0,0 +1,154 @@
+import asyncio
+import json
+import time
+
+import polars as pl
+import pytest
+from app.api.api_v1.api import submit
+from app.api.jobs import JobStore, SQLiteJobStore
+from app.api.services import pool
+from app.core import config
+from app.main import app
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+ACCOUNT = """Fecha,Hora,Fecha valor,Producto,ISIN,Descripción,Tipo,Variación,,Saldo,,ID Orden
+07-03-2023,10:00,07-03-2023,SAP SE,DE0007164600,"Venta 4 SAP SE@120 EUR (DE0007164600)",,EUR,"480,00",EUR,"0,00",ord2
+07-03-2023,10:00,07-03-2023,SAP SE,DE0007164600,Costes de transacción y/o externos de DEGIRO,,EUR,"-2,00",EUR,"0,00",ord2
+05-01-2023,10:00,05-01-2023,SAP SE,DE0007164600,"Compra 4 SAP SE@100 EUR (DE0007164600)",,EUR,"-400,00",EUR,"0,00",ord1
+05-01-2023,10:00,05-01-2023,SAP SE,DE0007164600,Costes de transacción y/o externos de DEGIRO,,EUR,"-2,00",EUR,"0,00",ord1
+"""
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(pool, "workers", 1)
+    monkeypatch.setattr(config, "WARMUP", False)
+    with TestClient(app) as client:
+        yield client
+    assert pool.pending == 0
+
+
+def test_job_lifecycle(client):
+    response = client.post("/api/v1/jobs/csv", content=ACCOUNT.encode(), params={"years": [2023]})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    while (job := client.get(f"/api/v1/jobs/{job_id}").json())["status"] not in ("done", "failed"):
+        time.sleep(0.05)
+    assert job["status"] == "done"
+    result = client.get(f"/api/v1/jobs/{job_id}/result").json()
+    assert result["isin_summary"] == [{"year": 2023, "isin": "DE0007164600", "return": 76.0}]
+    assert result["year_summary"] == [{"year": 2023, "global_result": 76.0}]
+
+    # the same upload is answered from the cache
+    response = client.post("/api/v1/jobs/csv", content=ACCOUNT.encode(), params={"years": [2023]})
+    assert response.json()["status"] == "done"
+    assert client.get("/api/v1/jobs/unknown").status_code == 404
+
+
+def test_returns(client):
+    upload = {"file": ("account.csv", ACCOUNT.encode())}
+    response = client.post("/api/v1/returns/", files=upload, data={"years": [2023]})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == {
+        "isin_summary": [{"year": 2023, "isin": "DE0007164600", "return": 76.0}],
+        "year_summary": [{"year": 2023, "global_result": 76.0}],
+    }
+
+    response = client.post("/api/v1/returns/", files=upload, data={"years": [2023]}, params={"format": "arrow"})
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    isin_summary = pl.read_ipc_stream(response.content)
+    assert isin_summary.rows() == [(2023, "DE0007164600", 76.0)]
+    assert json.loads(response.headers["x-year-summary"]) == [{"year": 2023, "global_result": 76.0}]
+
+
+def test_returns_errors(client, monkeypatch):
+    def post(content: bytes, **params):
+        return client.post("/api/v1/returns/", files={"file": ("account.csv", content)}, params=params)
+
+    assert post(ACCOUNT.encode(), format="xml").status_code == 422
+    assert post(b"").status_code == 400
+    monkeypatch.setattr(config, "MAX_UPLOAD_SIZE", 100)
+    assert post(ACCOUNT.encode()).status_code == 413
+    monkeypatch.setattr(config, "MAX_UPLOAD_SIZE", 2**20)
+    monkeypatch.setattr(pool, "pending", pool.workers + pool.queue_size)
+    response = post(ACCOUNT.encode() + b"\n")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+    monkeypatch.setattr(pool, "pending", 0)
+
+
+def test_submit_busy(client, monkeypatch):
+    monkeypatch.setattr(pool, "pending", pool.workers + pool.queue_size)
+    response = client.post("/api/v1/jobs/csv", content=ACCOUNT.encode())
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "5"
+    assert pool.pending == pool.workers + pool.queue_size
+    monkeypatch.setattr(pool, "pending", 0)
+
+
+@pytest.mark.parametrize("store", ["memory", "sqlite"])
+def test_late_progress(store, tmp_path):
+    jobs = JobStore(60) if store == "memory" else SQLiteJobStore(str(tmp_path / "jobs.db"), 60)
+    job_id = jobs.create()
+    jobs.progress(job_id, "matching", 1, 2)
+    assert jobs.get(job_id)["stage"] == "matching"
+    # progress reported by a worker after the job finished doesn't reopen it
+    jobs.update(job_id, status="done")
+    jobs.progress(job_id, "matching", 2, 2)
+    assert jobs.get(job_id)["status"] == "done"
+
+
+def test_upload_too_large(client, monkeypatch):
+    monkeypatch.setattr(config, "MAX_UPLOAD_SIZE", 100)
+    assert client.post("/api/v1/jobs/csv", content=ACCOUNT.encode()).status_code == 413
+
+    # sent without content-length: rejected while being read, and the slot reserved for the job is given back
+    response = client.post("/api/v1/jobs/csv", content=iter([ACCOUNT.encode()]))
+    assert response.status_code == 413
+    assert pool.pending == 0
+
+
+def test_submit_reserves_before_reading(monkeypatch):
+    monkeypatch.setattr(pool, "workers", 1)
+    monkeypatch.setattr(pool, "queue_size", 0)
+    monkeypatch.setattr(config, "MAX_UPLOAD_SIZE", 100)
+    seen = []
+
+    async def chunks():
+        # a concurrent submit arriving while this upload is read finds the pool full
+        seen.append(pool.full)
+        yield ACCOUNT.encode()
+
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(submit(chunks(), [2023]))
+    assert e.value.status_code == 413
+    assert seen == [True]
+    assert pool.pending == 0
+
+
+def test_invalid_upload(client):
+    assert client.post("/api/v1/jobs/csv", content=b"").status_code == 400
+    assert client.post("/api/v1/jobs/csv", content=ACCOUNT.encode()[: ACCOUNT.index("\n") + 1]).status_code == 400
+    response = client.post("/api/v1/jobs/csv", content=ACCOUNT.encode(), headers={"content-length": "many"})
+    assert response.status_code == 400
+
+
+def test_metrics(client):
+    client.post("/api/v1/returns/", files={"file": ("account.csv", ACCOUNT.encode())}, data={"years": [2023]})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = dict(line.rsplit(" ", 1) for line in response.text.splitlines() if not line.startswith("#"))
+    types = {line.split()[2]: line.split()[3] for line in response.text.splitlines() if line.startswith("# TYPE")}
+    assert types["opendeclaro_rows_total"] == "counter"
+    assert types["opendeclaro_returns_seconds"] == types["opendeclaro_upload_bytes"] == "histogram"
+    assert types["opendeclaro_worker_pending"] == "gauge"
+    # a computation observed in this process and in its worker, or answered from the cache of an earlier test
+    assert float(samples["opendeclaro_upload_bytes_count"]) >= 1
+    assert float(samples['opendeclaro_upload_bytes_bucket{le="+Inf"}']) == float(
+        samples["opendeclaro_upload_bytes_count"]
+    )
+    assert float(samples["opendeclaro_render_seconds_count"]) >= 1
+    assert "opendeclaro_rows_total" in samples and "opendeclaro_returns_seconds_sum" in samples
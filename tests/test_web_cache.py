@@ -0,0 +1,49 @@
+import asyncio
+import os
+
+import pytest
+from app.api.cache import ResultCache
+
+
+def test_hit_miss_eviction():
+    async def run():
+        cache = ResultCache(max_entries=2, ttl=60)
+        assert await cache.get("a") is None
+        await cache.set("a", 1)
+        await cache.set("b", 2)
+        assert await cache.get("a") == 1
+        # the least recently used entry is evicted past max_entries
+        await cache.set("c", 3)
+        assert await cache.get("b") is None
+        assert [await cache.get("a"), await cache.get("c")] == [1, 3]
+        assert (cache.hits, cache.misses) == (3, 2)
+
+        expired = ResultCache(max_entries=2, ttl=0)
+        await expired.set("a", 1)
+        assert await expired.get("a") is None
+
+    asyncio.run(run())
+
+
+def test_disk(tmp_path):
+    def serialize(value):
+        return value.encode(), b""
+
+    def deserialize(text, empty):
+        assert empty == b""
+        return text.decode()
+
+    async def run():
+        cache = ResultCache(2, 60, str(tmp_path), serialize, deserialize)
+        await cache.set("a", "one")
+        # a new cache (a restart) reads the entries of the directory
+        restarted = ResultCache(2, 60, str(tmp_path), serialize, deserialize)
+        assert await restarted.get("a") == "one"
+        # a truncated file is a miss
+        with open(cache.disk_path("a"), "r+b") as f:
+            f.truncate(os.path.getsize(cache.disk_path("a")) - 1)
+        assert await ResultCache(2, 60, str(tmp_path), serialize, deserialize).get("a") is None
+
+    asyncio.run(run())
+    with pytest.raises(ValueError):
+        ResultCache(2, 60, str(tmp_path))
@@ -0,0 +1,73 @@
+import asyncio
+import sys
+import threading
+
+import polars as pl
+import pytest
+from app.api import utils
+from app.api.utils import WORKER_MODULES, UploadTooLargeError, read_upload, warm_worker
+from app.api.workers import WorkerPool
+
+CSV = b"""a,b
+1,"one
+line"
+2,"two ""quoted""
+lines"
+3,three
+"""
+
+
+async def iter_chunks(csv: bytes, size: int):
+    for start in range(0, len(csv), size):
+        yield csv[start : start + size]
+
+
+def read(csv: bytes, batch_size: int, spool_threshold: int = 1024):
+    return asyncio.run(read_upload(iter_chunks(csv, 4), 1024, batch_size, spool_threshold))
+
+
+def test_read_upload():
+    expected = pl.read_csv(CSV, infer_schema_length=0)
+    # batches are cut between records, never inside a quoted field spanning lines
+    upload = read(CSV, batch_size=1)
+    assert upload.data.equals(expected)
+    assert upload.size == len(CSV)
+
+    spooled = read(CSV, batch_size=1, spool_threshold=20)
+    assert spooled.digest == upload.digest
+    assert pl.read_csv(spooled.data, infer_schema_length=0).equals(expected)
+    spooled.remove_spooled()
+
+
+def test_read_upload_error(monkeypatch):
+    parsing = threading.Event()
+    monkeypatch.setattr(utils, "parse_batch", lambda csv: parsing.wait())
+
+    async def run():
+        with pytest.raises(UploadTooLargeError):
+            await read_upload(iter_chunks(CSV, 4), 30, 1, 1024)
+        # the batches still being parsed are cancelled along with the upload
+        batches = asyncio.all_tasks() - {asyncio.current_task()}
+        assert batches and all(batch.cancelling() for batch in batches)
+        parsing.set()
+        await asyncio.gather(*batches, return_exceptions=True)
+
+    asyncio.run(run())
+
+
+def loaded_modules():
+    return [module for module in WORKER_MODULES if module in sys.modules]
+
+
+def test_warm_worker():
+    async def run():
+        pool = WorkerPool(workers=2, queue_size=0, initializer=warm_worker)
+        pool.start()
+        try:
+            await pool.start_workers()
+            # spawned workers import the modules computing the returns when they start, before any computation
+            return await pool.run(loaded_modules)
+        finally:
+            pool.shutdown()
+
+    assert asyncio.run(run()) == WORKER_MODULES